@@ -1,3 +1,9 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from logging import getLogger
+from typing import AsyncGenerator
+
 from litestar import Litestar
 from litestar.contrib.sqlalchemy.base import UUIDBase
 from litestar.contrib.sqlalchemy.plugins import (
@@ -6,14 +12,23 @@ from litestar.contrib.sqlalchemy.plugins import (
     SQLAlchemyInitPlugin,
 )
 from litestar.di import Provide
+from sqlalchemy import Connection, text
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from admin_service.controller import (
     ConfigController,
+    FeedController,
     IncomingController,
     OrderController,
     StrategyController,
 )
-from admin_service.pkg.provider import provide_limit_offset_pagination
+from admin_service.model import IncomingModel, OrderModel
+from admin_service.pkg.partition import PartitionPolicy, maintain_partitions
+from admin_service.pkg.provider import (
+    provide_created_filter,
+    provide_cursor_pagination,
+)
+from admin_service.repo.stats import StatsRepository
 from admin_service.setting import settings
 
 session_config = AsyncSessionConfig(expire_on_commit=False)
@@ -23,11 +38,72 @@ sqlalchemy_config = SQLAlchemyAsyncConfig(
 )  # Create 'db_session' dependency.
 sqlalchemy_plugin = SQLAlchemyInitPlugin(config=sqlalchemy_config)
 
+logger = getLogger("app")
+
+PARTITIONED_TABLES = [IncomingModel.__tablename__, OrderModel.__tablename__]
+# Indexes an older schema created, duplicates of a primary key since
+DROPPED_INDEXES = ["ix_incoming_created_at_id", "ix_order_created_at_id"]
+partition_policy = PartitionPolicy(
+    interval=settings.partition_interval,
+    premake=settings.partition_premake,
+    retention=settings.partition_retention,
+)
+
 
 async def on_startup() -> None:
     """Initializes the database."""
     async with sqlalchemy_config.get_engine().begin() as conn:
         await conn.run_sync(UUIDBase.metadata.create_all)
+        # create_all skips existing tables, add indexes introduced since then
+        await conn.run_sync(create_missing_indexes)
+        for name in DROPPED_INDEXES:
+            await conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    await update_partitions()
+    await purge_order_events()
+
+
+async def update_partitions() -> None:
+    today = datetime.now(timezone.utc).date()
+    async with sqlalchemy_config.get_engine().begin() as conn:
+        await conn.run_sync(
+            maintain_partitions, PARTITIONED_TABLES, partition_policy, today
+        )
+
+
+async def purge_order_events() -> None:
+    if not settings.order_event_retention:
+        return
+    before = datetime.now(timezone.utc) - timedelta(
+        days=settings.order_event_retention
+    )
+    async with sqlalchemy_config.get_engine().begin() as conn:
+        await StatsRepository(session=AsyncSession(conn)).purge_events(before)
+
+
+@asynccontextmanager
+async def partition_maintenance(app: Litestar) -> AsyncGenerator[None, None]:
+    """Keeps partitions ahead of time and applies retention while running."""
+
+    async def run() -> None:
+        while True:
+            await asyncio.sleep(settings.partition_check_interval)
+            try:
+                await update_partitions()
+                await purge_order_events()
+            except Exception:
+                logger.exception("Partition maintenance failed")
+
+    task = asyncio.create_task(run())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+
+def create_missing_indexes(conn: Connection) -> None:
+    for table in UUIDBase.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
 
 
 app = Litestar(
@@ -36,9 +112,14 @@ app = Litestar(
         StrategyController,
         IncomingController,
         OrderController,
+        FeedController,
     ],
     on_startup=[on_startup],
+    lifespan=[partition_maintenance],
     plugins=[SQLAlchemyInitPlugin(config=sqlalchemy_config)],
-    dependencies={"limit_offset": Provide(provide_limit_offset_pagination)},
+    dependencies={
+        "page": Provide(provide_cursor_pagination),
+        "created": Provide(provide_created_filter),
+    },
     debug=True,
 )
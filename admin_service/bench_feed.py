@@ -0,0 +1,76 @@
+"""Fan-out of the live feed to many in-process subscribers.
+
+Measures publish cost, delivery rate and publish to receive latency, with a
+share of stalled subscribers that never read, e.g.
+
+    python -m admin_service.bench_feed --subscribers 1000 --events 2000 --slow 100
+"""
+import argparse
+import asyncio
+import time
+from uuid import uuid4
+
+from orjson import loads
+
+from admin_service.pkg.feed import ORDER_KIND, Feed, Subscription
+
+
+async def consume(subscription: Subscription, n_events: int, latencies: list[float]):
+    received = 0
+    async for payload in subscription:
+        event = loads(payload)
+        if event["kind"] != ORDER_KIND:
+            continue
+        latencies.append(time.perf_counter() - event["data"]["published"])
+        received += 1
+        if received == n_events:
+            return
+
+
+async def bench(n_subscribers: int, n_events: int, batch_size: int, n_slow: int):
+    feed = Feed(max_queue_size=1_000)
+    strategy_id = uuid4()
+    latencies: list[float] = []
+    consumers = [
+        asyncio.create_task(consume(feed.subscribe(strategy_id), n_events, latencies))
+        for _ in range(n_subscribers - n_slow)
+    ]
+    stalled = [feed.subscribe(strategy_id) for _ in range(n_slow)]
+    await asyncio.sleep(0)
+
+    publish_time = 0.0
+    start_time = time.perf_counter()
+    for start in range(0, n_events, batch_size):
+        published = time.perf_counter()
+        batch = [
+            {"strategy_id": strategy_id, "data": {"seq": seq, "published": published}}
+            for seq in range(start, min(start + batch_size, n_events))
+        ]
+        feed.publish(ORDER_KIND, batch)
+        publish_time += time.perf_counter() - published
+        # Like the ingestion handlers, publishers yield between requests
+        await asyncio.sleep(0)
+    await asyncio.gather(*consumers)
+    total_time = time.perf_counter() - start_time
+
+    latencies.sort()
+    deliveries = len(latencies)
+    print(f"subscribers {n_subscribers}, stalled {n_slow}, events {n_events}")
+    print(f"publish    {publish_time / n_events * 1e6:>10.1f} us/event")
+    print(f"delivered  {deliveries / total_time:>10.0f} events/s")
+    p50, p99 = latencies[deliveries // 2], latencies[int(deliveries * 0.99)]
+    print(f"latency    p50 {p50 * 1e3:.1f} ms, p99 {p99 * 1e3:.1f} ms")
+    if stalled:
+        dropped = sum(subscription.dropped for subscription in stalled) / n_slow
+        print(f"dropped    {dropped:>10.0f} per stalled")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=1_000)
+    parser.add_argument("--events", type=int, default=2_000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--slow", type=int, default=100)
+    args = parser.parse_args()
+
+    asyncio.run(bench(args.subscribers, args.events, args.batch_size, args.slow))
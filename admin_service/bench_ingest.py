@@ -0,0 +1,79 @@
+"""Rows/sec of the single-record and batch ingestion endpoints.
+
+Runs the app in-process against `settings.connection_string`, e.g.
+
+    connection_string='sqlite+aiosqlite:///bench.db' \
+        python -m admin_service.bench_ingest
+"""
+import argparse
+import time
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from litestar.testing import TestClient
+from orjson import dumps
+
+from admin_service.app import app
+
+
+def make_order(strategy_id: str) -> dict:
+    return {
+        "strategy_id": strategy_id,
+        "data": {
+            "order_id": str(uuid4()),
+            "instrument": "SBER",
+            "kind": "buy",
+            "status": "open",
+            "open_price": 270.5,
+            "quantity": 3,
+            "open_dt": datetime.now(timezone.utc).isoformat(),
+        },
+    }
+
+
+def bench_single(client: TestClient, strategy_id: str, n_rows: int) -> float:
+    start_time = time.perf_counter()
+    for _ in range(n_rows):
+        client.post("/orders", content=dumps(make_order(strategy_id)))
+    return n_rows / (time.perf_counter() - start_time)
+
+
+def bench_batch(
+    client: TestClient, strategy_id: str, n_rows: int, batch_size: int, ndjson: bool
+) -> float:
+    start_time = time.perf_counter()
+    for start in range(0, n_rows, batch_size):
+        size = min(batch_size, n_rows - start)
+        orders = [make_order(strategy_id) for _ in range(size)]
+        if ndjson:
+            content = b"\n".join(dumps(order) for order in orders)
+            headers = {"Content-Type": "application/x-ndjson"}
+        else:
+            content, headers = dumps(orders), {"Content-Type": "application/json"}
+        response = client.post("/orders/batch", content=content, headers=headers)
+        response.raise_for_status()
+    return n_rows / (time.perf_counter() - start_time)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 1_000])
+    args = parser.parse_args()
+
+    with TestClient(app) as client:
+        strategy = {
+            "name": "Bench",
+            "description": "Ingestion bench",
+            "source_code": "",
+        }
+        strategy_id = client.post("/strategies", json=strategy).json()["id"]
+
+        print(f"single   {bench_single(client, strategy_id, args.rows):>10.0f} rows/s")
+        for batch_size in args.batch_sizes:
+            for ndjson in (False, True):
+                rows_per_sec = bench_batch(
+                    client, strategy_id, args.rows, batch_size, ndjson
+                )
+                kind = "ndjson" if ndjson else "array"
+                print(f"{kind:<6} {batch_size:>5} {rows_per_sec:>10.0f} rows/s")
@@ -1,4 +1,5 @@
 from .config import ConfigController
+from .feed import FeedController
 from .incoming import IncomingController
 from .order import OrderController
 from .strategy import StrategyController
@@ -2,12 +2,11 @@ from litestar import get
 from litestar.controller import Controller
 from litestar.di import Provide
 from litestar.handlers.http_handlers.decorators import post
-from litestar.pagination import OffsetPagination
-from litestar.repository.filters import LimitOffset
 from pydantic import TypeAdapter
 
 from admin_service.dto.config import ReadDTO, WriteDTO
 from admin_service.model import ConfigModel
+from admin_service.pkg.pagination import CursorPage, CursorParams
 from admin_service.repo.config import ConfigRepository, provide_configs_repo
 
 
@@ -21,16 +20,16 @@ class ConfigController(Controller):
     async def list_configs(
         self,
         configs_repo: ConfigRepository,
-        limit_offset: LimitOffset,
-    ) -> OffsetPagination[ReadDTO]:
-        """List of configs."""
-        results, total = await configs_repo.list_and_count(limit_offset)
+        page: CursorParams,
+    ) -> CursorPage[ReadDTO]:
+        """List of configs, newest first."""
+        results, next_cursor, total = await configs_repo.list_page(page)
         type_adapter = TypeAdapter(list[ReadDTO])
-        return OffsetPagination[ReadDTO](
+        return CursorPage[ReadDTO](
             items=type_adapter.validate_python(results),
+            results_per_page=page.page_size,
+            cursor=next_cursor,
             total=total,
-            limit=limit_offset.limit,
-            offset=limit_offset.offset,
         )
 
     @post(path="/configs")
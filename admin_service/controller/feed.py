@@ -0,0 +1,47 @@
+from typing import AsyncIterator, Optional
+from uuid import UUID
+
+from litestar import get
+from litestar.controller import Controller
+from litestar.exceptions import ValidationException
+from litestar.params import Parameter
+from litestar.response import Stream
+
+from admin_service.pkg.feed import KINDS, Subscription, feed
+
+
+class FeedController(Controller):
+    """Live feed of ingested orders and incomings"""
+
+    tags = ["Feed"]
+
+    @get(path="/feed")
+    async def stream_feed(
+        self,
+        strategy_id: Optional[UUID] = Parameter(
+            query="strategyId", default=None, required=False
+        ),
+        kinds: Optional[list[str]] = None,
+    ) -> Stream:
+        """Server-sent events of new orders and incomings, of one or all strategies.
+
+        Every event is a JSON object with `kind`, `strategy_id` and `data`. A
+        `lagged` event tells how many events a slow client missed.
+        """
+        selected = frozenset(kinds) if kinds else KINDS
+        if unknown := selected - KINDS:
+            raise ValidationException(detail=f"Unknown kinds {sorted(unknown)}")
+        return Stream(
+            _events(feed.subscribe(strategy_id, selected)),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+
+
+async def _events(subscription: Subscription) -> AsyncIterator[bytes]:
+    # Framed here, litestar's ServerSentEvent ends the event only with the stream
+    try:
+        async for payload in subscription:
+            yield b"data: " + payload + b"\n\n"
+    finally:
+        feed.unsubscribe(subscription)
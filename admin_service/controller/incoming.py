@@ -1,47 +1,85 @@
-from litestar import get, post
+from typing import Optional
+from uuid import UUID
+
+from litestar import Request, get, post
 from litestar.controller import Controller
 from litestar.di import Provide
 from litestar.handlers.http_handlers.decorators import post
-from litestar.pagination import OffsetPagination
-from litestar.repository.filters import LimitOffset
+from litestar.params import Parameter
+from litestar.repository.filters import BeforeAfter
 from pydantic import TypeAdapter
 
+from admin_service.dto.batch import BatchDTO
 from admin_service.dto.incoming import ReadDTO, WriteDTO
 from admin_service.model import IncomingModel
+from admin_service.pkg.batch import parse_batch
+from admin_service.pkg.feed import INCOMING_KIND, feed
+from admin_service.pkg.pagination import CursorPage, CursorParams
 from admin_service.repo.incoming import IncomingRepository, provide_incomings_repo
+from admin_service.repo.strategy import StrategyRepository, provide_strategys_repo
 
 
 class IncomingController(Controller):
     """Incoming CRUD"""
 
     tags = ["Incoming"]
-    dependencies = {"incomings_repo": Provide(provide_incomings_repo)}
+    dependencies = {
+        "incomings_repo": Provide(provide_incomings_repo),
+        "strategys_repo": Provide(provide_strategys_repo),
+    }
 
     @get(path="/incomings")
     async def list_incomings(
         self,
         incomings_repo: IncomingRepository,
-        limit_offset: LimitOffset,
-    ) -> OffsetPagination[ReadDTO]:
-        """List of incomings."""
-        results, total = await incomings_repo.list_and_count(limit_offset)
+        page: CursorParams,
+        created: BeforeAfter,
+        strategy_id: Optional[UUID] = Parameter(
+            query="strategyId", default=None, required=False
+        ),
+    ) -> CursorPage[ReadDTO]:
+        """List of incomings, newest first, filtered by strategy and time."""
+        kwargs = {"strategy_id": strategy_id} if strategy_id else {}
+        results, next_cursor, total = await incomings_repo.list_page(
+            page, created, **kwargs
+        )
         type_adapter = TypeAdapter(list[ReadDTO])
-        return OffsetPagination[ReadDTO](
+        return CursorPage[ReadDTO](
             items=type_adapter.validate_python(results),
+            results_per_page=page.page_size,
+            cursor=next_cursor,
             total=total,
-            limit=limit_offset.limit,
-            offset=limit_offset.offset,
         )
 
     @post(path="/incomings")
     async def create_incoming(
         self,
         incomings_repo: IncomingRepository,
+        strategys_repo: StrategyRepository,
         data: WriteDTO,
     ) -> ReadDTO:
         """Create a new incoming."""
+        await strategys_repo.check_known([data.strategy_id])
         obj = await incomings_repo.add(
             IncomingModel(**data.model_dump(exclude_unset=True, exclude_none=True)),
         )
         await incomings_repo.session.commit()
-        return ReadDTO.model_validate(obj)
+        incoming = ReadDTO.model_validate(obj)
+        feed.publish(INCOMING_KIND, [incoming.model_dump()])
+        return incoming
+
+    @post(path="/incomings/batch")
+    async def create_incomings_batch(
+        self,
+        incomings_repo: IncomingRepository,
+        strategys_repo: StrategyRepository,
+        request: Request,
+    ) -> BatchDTO:
+        """Create incomings from a JSON array or NDJSON body in one transaction."""
+        items = parse_batch(await request.body(), request.content_type[0], WriteDTO)
+        incomings = [item.model_dump() for item in items]
+        await strategys_repo.check_known({item.strategy_id for item in items})
+        rows = await incomings_repo.insert_many(incomings)
+        await incomings_repo.session.commit()
+        feed.publish(INCOMING_KIND, rows)
+        return BatchDTO(total=len(rows))
@@ -1,47 +1,98 @@
-from litestar import get, post
+from typing import Optional
+from uuid import UUID
+
+from litestar import Request, get, post
 from litestar.controller import Controller
 from litestar.di import Provide
 from litestar.handlers.http_handlers.decorators import post
-from litestar.pagination import OffsetPagination
-from litestar.repository.filters import LimitOffset
+from litestar.params import Parameter
+from litestar.repository.filters import BeforeAfter
 from pydantic import TypeAdapter
 
+from admin_service.dto.batch import BatchDTO
 from admin_service.dto.order import ReadDTO, WriteDTO
 from admin_service.model import OrderModel
+from admin_service.pkg.batch import parse_batch
+from admin_service.pkg.feed import ORDER_KIND, feed
+from admin_service.pkg.pagination import CursorPage, CursorParams
 from admin_service.repo.order import OrderRepository, provide_orders_repo
+from admin_service.repo.stats import StatsRepository, provide_stats_repo
+from admin_service.repo.strategy import StrategyRepository, provide_strategys_repo
 
 
 class OrderController(Controller):
     """Order CRUD"""
 
     tags = ["Order"]
-    dependencies = {"orders_repo": Provide(provide_orders_repo)}
+    dependencies = {
+        "orders_repo": Provide(provide_orders_repo),
+        "stats_repo": Provide(provide_stats_repo),
+        "strategys_repo": Provide(provide_strategys_repo),
+    }
 
     @get(path="/orders")
     async def list_orders(
         self,
         orders_repo: OrderRepository,
-        limit_offset: LimitOffset,
-    ) -> OffsetPagination[ReadDTO]:
-        """List of orders."""
-        results, total = await orders_repo.list_and_count(limit_offset)
+        page: CursorParams,
+        created: BeforeAfter,
+        strategy_id: Optional[UUID] = Parameter(
+            query="strategyId", default=None, required=False
+        ),
+        instrument: Optional[str] = None,
+        status: Optional[str] = None,
+        kind: Optional[str] = None,
+    ) -> CursorPage[ReadDTO]:
+        """List of orders, newest first, filtered by strategy, time and data fields."""
+        filters: list = [created]
+        fields = {"instrument": instrument, "status": status, "kind": kind}
+        if fields := {key: value for key, value in fields.items() if value}:
+            filters.append(orders_repo.data_matches(fields))
+        kwargs = {"strategy_id": strategy_id} if strategy_id else {}
+        results, next_cursor, total = await orders_repo.list_page(
+            page, *filters, **kwargs
+        )
         type_adapter = TypeAdapter(list[ReadDTO])
-        return OffsetPagination[ReadDTO](
+        return CursorPage[ReadDTO](
             items=type_adapter.validate_python(results),
+            results_per_page=page.page_size,
+            cursor=next_cursor,
             total=total,
-            limit=limit_offset.limit,
-            offset=limit_offset.offset,
         )
 
     @post(path="/orders")
     async def create_order(
         self,
         orders_repo: OrderRepository,
+        stats_repo: StatsRepository,
+        strategys_repo: StrategyRepository,
         data: WriteDTO,
     ) -> ReadDTO:
         """Create a new order."""
+        await strategys_repo.check_known([data.strategy_id])
         obj = await orders_repo.add(
             OrderModel(**data.model_dump(exclude_unset=True, exclude_none=True)),
         )
+        await stats_repo.record_orders([data.model_dump()])
+        await orders_repo.session.commit()
+        order = ReadDTO.model_validate(obj)
+        feed.publish(ORDER_KIND, [order.model_dump()])
+        return order
+
+    @post(path="/orders/batch")
+    async def create_orders_batch(
+        self,
+        orders_repo: OrderRepository,
+        stats_repo: StatsRepository,
+        strategys_repo: StrategyRepository,
+        request: Request,
+    ) -> BatchDTO:
+        """Create orders from a JSON array or NDJSON body in one transaction."""
+        items = parse_batch(await request.body(), request.content_type[0], WriteDTO)
+        orders = [item.model_dump() for item in items]
+        await strategys_repo.check_known({item.strategy_id for item in items})
+        rows = await orders_repo.insert_many(orders)
+        await stats_repo.record_orders(orders)
         await orders_repo.session.commit()
-        return ReadDTO.model_validate(obj)
+        feed.publish(ORDER_KIND, rows)
+        return BatchDTO(total=len(rows))
@@ -1,13 +1,17 @@
+from uuid import UUID
+
 from litestar import get, post
 from litestar.controller import Controller
 from litestar.di import Provide
 from litestar.handlers.http_handlers.decorators import post
-from litestar.pagination import OffsetPagination
-from litestar.repository.filters import LimitOffset
+from litestar.params import Parameter
 from pydantic import TypeAdapter
 
+from admin_service.dto.stats import DailyStatsDTO, StatsDTO
 from admin_service.dto.strategy import ReadDTO, WriteDTO
 from admin_service.model import StrategyModel
+from admin_service.pkg.pagination import CursorPage, CursorParams
+from admin_service.repo.stats import StatsRepository, provide_stats_repo
 from admin_service.repo.strategy import StrategyRepository, provide_strategys_repo
 
 
@@ -15,22 +19,25 @@ class StrategyController(Controller):
     """Strategy CRUD"""
 
     tags = ["Strategy"]
-    dependencies = {"strategys_repo": Provide(provide_strategys_repo)}
+    dependencies = {
+        "strategys_repo": Provide(provide_strategys_repo),
+        "stats_repo": Provide(provide_stats_repo),
+    }
 
     @get(path="/strategies")
     async def list_strategys(
         self,
         strategys_repo: StrategyRepository,
-        limit_offset: LimitOffset,
-    ) -> OffsetPagination[ReadDTO]:
-        """List of strategys."""
-        results, total = await strategys_repo.list_and_count(limit_offset)
+        page: CursorParams,
+    ) -> CursorPage[ReadDTO]:
+        """List of strategys, newest first."""
+        results, next_cursor, total = await strategys_repo.list_page(page)
         type_adapter = TypeAdapter(list[ReadDTO])
-        return OffsetPagination[ReadDTO](
+        return CursorPage[ReadDTO](
             items=type_adapter.validate_python(results),
+            results_per_page=page.page_size,
+            cursor=next_cursor,
             total=total,
-            limit=limit_offset.limit,
-            offset=limit_offset.offset,
         )
 
     @post(path="/strategies")
@@ -39,9 +46,30 @@ class StrategyController(Controller):
         strategys_repo: StrategyRepository,
         data: WriteDTO,
     ) -> ReadDTO:
-        """Create a new strategy."""
+        """Create a new strategy, or return the existing one with the same id."""
+        if data.id and (obj := await strategys_repo.get_one_or_none(id=data.id)):
+            return ReadDTO.model_validate(obj)
         obj = await strategys_repo.add(
             StrategyModel(**data.model_dump(exclude_unset=True, exclude_none=True)),
         )
         await strategys_repo.session.commit()
         return ReadDTO.model_validate(obj)
+
+    @get(path="/strategies/{strategy_id:uuid}/stats")
+    async def get_strategy_stats(
+        self,
+        stats_repo: StatsRepository,
+        strategy_id: UUID,
+        days: int = Parameter(query="days", ge=0, le=366, default=30, required=False),
+    ) -> StatsDTO:
+        """Running PnL and performance of a strategy with the latest daily buckets."""
+        stats = await stats_repo.get_one_or_none(strategy_id=strategy_id)
+        if stats is None:
+            return StatsDTO(strategy_id=strategy_id)
+
+        daily = await stats_repo.get_daily(strategy_id, days) if days else []
+        result = StatsDTO.model_validate(stats)
+        result.daily = TypeAdapter(list[DailyStatsDTO]).validate_python(daily)
+        if stats.trade_count:
+            result.win_rate = stats.win_count / stats.trade_count
+        return result
@@ -0,0 +1,5 @@
+from admin_service.pkg.base import BaseModel
+
+
+class BatchDTO(BaseModel):
+    total: int
@@ -0,0 +1,26 @@
+from datetime import date
+from typing import Optional
+from uuid import UUID
+
+from admin_service.pkg.base import BaseModel
+
+
+class DailyStatsDTO(BaseModel):
+    day: date
+    pnl: float
+    trade_count: int
+    equity: float
+
+
+class StatsDTO(BaseModel):
+    strategy_id: UUID
+
+    realized_pnl: float = 0.0
+    trade_count: int = 0
+    win_count: int = 0
+    win_rate: Optional[float] = None
+    max_drawdown: float = 0.0
+    exposure: float = 0.0
+    open_orders: int = 0
+
+    daily: list[DailyStatsDTO] = []
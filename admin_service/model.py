@@ -1,12 +1,26 @@
+from datetime import date, datetime, timezone
 from uuid import UUID
 
 from litestar.contrib.sqlalchemy.base import UUIDAuditBase
-from sqlalchemy import ForeignKey
+from litestar.contrib.sqlalchemy.types import DateTimeUTC
+from sqlalchemy import ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship, selectinload
 
 
+class TimePartitioned:
+    # Range partitioned by created_at on PostgreSQL, see pkg/partition.py. The
+    # partition key has to be part of the primary key there, and the (created_at, id)
+    # primary key also serves the keyset pagination.
+    created_at: Mapped[datetime] = mapped_column(
+        DateTimeUTC(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        primary_key=True,
+    )
+
+
 class StrategyModel(UUIDAuditBase):
     __tablename__ = "strategy"
+    __table_args__ = (Index("ix_strategy_created_at_id", "created_at", "id"),)
 
     name: Mapped[str]
     description: Mapped[str]
@@ -15,6 +29,7 @@ class StrategyModel(UUIDAuditBase):
 
 class ConfigModel(UUIDAuditBase):
     __tablename__ = "config"
+    __table_args__ = (Index("ix_config_created_at_id", "created_at", "id"),)
 
     comment: Mapped[str]
     is_actual: Mapped[bool]
@@ -26,8 +41,12 @@ class ConfigModel(UUIDAuditBase):
     )
 
 
-class IncomingModel(UUIDAuditBase):
+class IncomingModel(TimePartitioned, UUIDAuditBase):
     __tablename__ = "incoming"
+    __table_args__ = (
+        Index("ix_incoming_strategy_id_created_at", "strategy_id", "created_at", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     data: Mapped[dict]
 
@@ -37,8 +56,19 @@ class IncomingModel(UUIDAuditBase):
     )
 
 
-class OrderModel(UUIDAuditBase):
+class OrderModel(TimePartitioned, UUIDAuditBase):
     __tablename__ = "order"
+    __table_args__ = (
+        Index("ix_order_strategy_id_created_at", "strategy_id", "created_at", "id"),
+        # Containment filters on instrument, status, kind etc., see JsonFilterMixin
+        Index(
+            "ix_order_data",
+            "data",
+            postgresql_using="gin",
+            postgresql_ops={"data": "jsonb_path_ops"},
+        ).ddl_if(dialect="postgresql"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     data: Mapped[dict]
 
@@ -46,3 +76,46 @@ class OrderModel(UUIDAuditBase):
     strategy: Mapped[StrategyModel] = relationship(
         lazy="joined", innerjoin=True, viewonly=True
     )
+
+
+class StrategyStatsModel(UUIDAuditBase):
+    # Running totals over the orders of one strategy, see repo/stats.py
+    __tablename__ = "strategy_stats"
+
+    realized_pnl: Mapped[float]
+    trade_count: Mapped[int]
+    win_count: Mapped[int]
+    peak_pnl: Mapped[float]
+    max_drawdown: Mapped[float]
+    exposure: Mapped[float]
+    open_orders: Mapped[int]
+
+    strategy_id: Mapped[UUID] = mapped_column(ForeignKey("strategy.id"), unique=True)
+
+
+class StrategyDailyStatsModel(UUIDAuditBase):
+    __tablename__ = "strategy_daily_stats"
+    __table_args__ = (UniqueConstraint("strategy_id", "day"),)
+
+    day: Mapped[date]
+    pnl: Mapped[float]
+    trade_count: Mapped[int]
+    # Realized PnL of the strategy at the end of the day
+    equity: Mapped[float]
+
+    strategy_id: Mapped[UUID] = mapped_column(ForeignKey("strategy.id"))
+
+
+class StrategyOrderEventModel(UUIDAuditBase):
+    # Order events already folded into the stats, the observer delivers at least once
+    __tablename__ = "strategy_order_event"
+    __table_args__ = (
+        UniqueConstraint("order_id", "status"),
+        # Events past settings.order_event_retention are purged, see app.py
+        Index("ix_strategy_order_event_created_at", "created_at"),
+    )
+
+    order_id: Mapped[str]
+    status: Mapped[str]
+
+    strategy_id: Mapped[UUID] = mapped_column(ForeignKey("strategy.id"))
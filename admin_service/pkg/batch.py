@@ -0,0 +1,59 @@
+from typing import TypeVar
+
+from litestar.exceptions import ValidationException
+from orjson import JSONDecodeError, loads
+from pydantic import TypeAdapter, ValidationError
+
+from admin_service.setting import settings
+
+T = TypeVar("T")
+
+NDJSON_MEDIA_TYPES = {"application/x-ndjson", "application/jsonl"}
+
+
+def parse_batch(body: bytes, media_type: str, item_type: type[T]) -> list[T]:
+    """Validate a JSON array or NDJSON body.
+
+    The batch size is checked before any item is validated, from the line count
+    for NDJSON and from the parsed array otherwise. Each NDJSON line is validated
+    on its own, so a line holding several objects is rejected.
+
+    Parameters
+    ----------
+    body : bytes
+        Raw request body.
+    media_type : str
+        Request content type, NDJSON when in `NDJSON_MEDIA_TYPES`.
+    item_type : type
+        Model of a single item.
+    """
+    if media_type in NDJSON_MEDIA_TYPES:
+        lines = [line for line in body.splitlines() if line.strip()]
+        _check_size(len(lines))
+        adapter = TypeAdapter(item_type)
+        items = []
+        for number, line in enumerate(lines, 1):
+            try:
+                items.append(adapter.validate_json(line))
+            except ValidationError as exc:
+                raise ValidationException(detail=f"Line {number}: {exc}") from exc
+        return items
+
+    try:
+        raw = loads(body)
+    except JSONDecodeError as exc:
+        raise ValidationException(detail=str(exc)) from exc
+    if isinstance(raw, list):
+        _check_size(len(raw))
+
+    try:
+        return TypeAdapter(list[item_type]).validate_python(raw)
+    except ValidationError as exc:
+        raise ValidationException(detail=str(exc)) from exc
+
+
+def _check_size(size: int) -> None:
+    if size > settings.batch_max_size:
+        raise ValidationException(
+            detail=f"Batch of {size} exceeds {settings.batch_max_size} items"
+        )
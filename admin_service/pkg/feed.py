@@ -0,0 +1,91 @@
+import asyncio
+from collections import defaultdict
+from typing import AsyncIterator, Optional
+from uuid import UUID
+
+from orjson import dumps
+
+from admin_service.setting import settings
+
+ORDER_KIND = "order"
+INCOMING_KIND = "incoming"
+KINDS = frozenset({ORDER_KIND, INCOMING_KIND})
+
+
+class Subscription:
+    """Bounded queue of encoded events for one live feed client.
+
+    A slow client never blocks publishers: when its queue is full the oldest
+    event is dropped, and the client gets a `lagged` event with the number of
+    dropped ones before the next event, so it can catch up through the list
+    endpoints.
+    """
+
+    def __init__(
+        self, strategy_id: Optional[UUID], kinds: frozenset[str], max_size: int
+    ) -> None:
+        self.strategy_id = strategy_id
+        self.kinds = kinds
+        self.dropped = 0
+        self._queue: asyncio.Queue[bytes] = asyncio.Queue(max_size)
+
+    def offer(self, payload: bytes) -> None:
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(payload)
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        while True:
+            payload = await self._queue.get()
+            if self.dropped:
+                yield dumps({"kind": "lagged", "dropped": self.dropped})
+                self.dropped = 0
+            yield payload
+
+
+class Feed:
+    """In-process fan-out of ingested orders and incomings to live subscribers.
+
+    Events are published after their transaction commits and encoded once,
+    whatever the number of subscribers. Subscribers are indexed by strategy,
+    None receives every strategy.
+    """
+
+    def __init__(self, max_queue_size: int) -> None:
+        self.max_queue_size = max_queue_size
+        self._subscribers: dict[Optional[UUID], set[Subscription]] = defaultdict(set)
+
+    def subscribe(
+        self, strategy_id: Optional[UUID] = None, kinds: frozenset[str] = KINDS
+    ) -> Subscription:
+        subscription = Subscription(strategy_id, kinds, self.max_queue_size)
+        self._subscribers[strategy_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers[subscription.strategy_id]
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.strategy_id]
+
+    def publish(self, kind: str, items: list[dict]) -> None:
+        """Offer `items`, dicts with `strategy_id` and `data`, to their subscribers."""
+        if not self._subscribers:
+            return
+        for item in items:
+            strategy_id = item["strategy_id"]
+            targets = [
+                subscription
+                for key in (strategy_id, None)
+                for subscription in self._subscribers.get(key, ())
+                if kind in subscription.kinds
+            ]
+            if not targets:
+                continue
+            payload = dumps({"kind": kind, **item})
+            for subscription in targets:
+                subscription.offer(payload)
+
+
+feed = Feed(max_queue_size=settings.feed_queue_size)
@@ -0,0 +1,47 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Generic, Optional, TypeVar
+from uuid import UUID
+
+from litestar.exceptions import ValidationException
+from litestar.pagination import CursorPagination
+
+T = TypeVar("T")
+
+Keyset = tuple[datetime, UUID]
+
+
+@dataclass
+class CursorParams:
+    """Page request for keyset pagination on (created_at, id)."""
+
+    page_size: int
+    after: Optional[Keyset] = None
+    with_total: bool = False
+
+
+@dataclass
+class CursorPage(CursorPagination[str, T], Generic[T]):
+    """Cursor page, `cursor` is None on the last page.
+
+    `total` is only filled on request and may be an estimate.
+    """
+
+    total: Optional[int] = None
+
+
+def encode_cursor(created_at: datetime, id: UUID) -> str:
+    """Opaque token for the position right after the given row."""
+    raw = f"{created_at.isoformat()}|{id.hex}".encode()
+    return urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> Keyset:
+    """Inverse of `encode_cursor`, raises a 400 on a malformed token."""
+    try:
+        raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, id = raw.split("|")
+        return datetime.fromisoformat(created_at), UUID(hex=id)
+    except ValueError as exc:
+        raise ValidationException(detail=f"Invalid cursor {cursor!r}") from exc
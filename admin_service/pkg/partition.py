@@ -0,0 +1,146 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from logging import getLogger
+from typing import Literal, Optional
+
+from sqlalchemy import Connection, text
+
+logger = getLogger("partition")
+
+Interval = Literal["day", "month"]
+
+NAME_FORMATS = {"day": "%Y%m%d", "month": "%Y%m"}
+
+
+@dataclass
+class PartitionPolicy:
+    """Range partitions by created_at.
+
+    Parameters
+    ----------
+    interval : {"day", "month"}
+        Time span of one partition.
+    premake : int
+        Partitions created ahead of the current one.
+    retention : int
+        Partitions kept behind the current one, 0 keeps everything.
+    """
+
+    interval: Interval = "day"
+    premake: int = 7
+    retention: int = 0
+
+
+@dataclass
+class Partition:
+    name: str
+    start: date
+    end: date
+
+
+def period_start(day: date, interval: Interval) -> date:
+    return day if interval == "day" else day.replace(day=1)
+
+
+def shift(start: date, periods: int, interval: Interval) -> date:
+    if interval == "day":
+        return start + timedelta(days=periods)
+    month = start.year * 12 + start.month - 1 + periods
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def partition_for(table: str, start: date, interval: Interval) -> Partition:
+    name = f"{table}_p{start.strftime(NAME_FORMATS[interval])}"
+    return Partition(name, start, shift(start, 1, interval))
+
+
+def parse_partition(table: str, name: str, interval: Interval) -> Optional[Partition]:
+    """Partition of a name made by `partition_for`, None for any other table."""
+    prefix = f"{table}_p"
+    if not name.startswith(prefix):
+        return None
+    try:
+        start = datetime.strptime(name[len(prefix) :], NAME_FORMATS[interval]).date()
+    except ValueError:
+        return None
+    return partition_for(table, start, interval)
+
+
+def plan_partitions(
+    table: str, existing: list[str], policy: PartitionPolicy, today: date
+) -> tuple[list[Partition], list[Partition]]:
+    """Partitions to create and to drop so that the policy holds on `today`."""
+    current = period_start(today, policy.interval)
+    wanted = [
+        partition_for(table, shift(current, i, policy.interval), policy.interval)
+        for i in range(policy.premake + 1)
+    ]
+    to_create = [partition for partition in wanted if partition.name not in existing]
+
+    to_drop = []
+    if policy.retention:
+        cutoff = shift(current, -policy.retention, policy.interval)
+        for name in existing:
+            partition = parse_partition(table, name, policy.interval)
+            if partition is not None and partition.end <= cutoff:
+                to_drop.append(partition)
+    return to_create, to_drop
+
+
+def maintain_partitions(
+    conn: Connection, tables: list[str], policy: PartitionPolicy, today: date
+) -> None:
+    """Create upcoming partitions and drop expired ones, PostgreSQL only.
+
+    Expired rows go away with their partition, no DELETE and no vacuum debt.
+    """
+    if conn.dialect.name != "postgresql":
+        return
+
+    for table in tables:
+        if not _is_partitioned(conn, table):
+            logger.warning("Table %s is not partitioned, recreate it to manage", table)
+            continue
+
+        to_create, to_drop = plan_partitions(
+            table, _partitions(conn, table), policy, today
+        )
+        for partition in to_create:
+            conn.execute(
+                text(
+                    f'CREATE TABLE IF NOT EXISTS "{partition.name}" '
+                    f'PARTITION OF "{table}" '
+                    f"FOR VALUES FROM ('{partition.start} UTC') "
+                    f"TO ('{partition.end} UTC')"
+                )
+            )
+            logger.info("Created partition %s", partition.name)
+        for partition in to_drop:
+            conn.execute(text(f'DROP TABLE IF EXISTS "{partition.name}"'))
+            logger.info("Dropped partition %s", partition.name)
+
+
+def _is_partitioned(conn: Connection, table: str) -> bool:
+    return bool(
+        conn.scalar(
+            text(
+                "SELECT 1 FROM pg_partitioned_table p "
+                "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :table"
+            ),
+            {"table": table},
+        )
+    )
+
+
+def _partitions(conn: Connection, table: str) -> list[str]:
+    return list(
+        conn.scalars(
+            text(
+                "SELECT child.relname FROM pg_inherits i "
+                "JOIN pg_class parent ON parent.oid = i.inhparent "
+                "JOIN pg_class child ON child.oid = i.inhrelid "
+                "WHERE parent.relname = :table"
+            ),
+            {"table": table},
+        )
+    )
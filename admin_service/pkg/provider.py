@@ -1,7 +1,7 @@
 from __future__ import annotations
 
-from datetime import date
-from typing import TYPE_CHECKING
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Optional
 from uuid import UUID
 
 from litestar import Litestar, get
@@ -17,31 +17,60 @@ from litestar.di import Provide
 from litestar.handlers.http_handlers.decorators import delete, patch, post
 from litestar.pagination import OffsetPagination
 from litestar.params import Parameter
-from litestar.repository.filters import LimitOffset
+from litestar.repository.filters import BeforeAfter, LimitOffset
 from pydantic import BaseModel as _BaseModel
 from pydantic import TypeAdapter
 from sqlalchemy import ForeignKey, select
 from sqlalchemy.orm import Mapped, mapped_column, relationship, selectinload
 
+from admin_service.pkg.pagination import CursorParams, decode_cursor
 
-def provide_limit_offset_pagination(
-    current_page: int = Parameter(ge=1, query="currentPage", default=1, required=False),
+
+def provide_cursor_pagination(
+    cursor: Optional[str] = Parameter(query="cursor", default=None, required=False),
     page_size: int = Parameter(
         query="pageSize",
         ge=1,
+        le=1000,
         default=10,
         required=False,
     ),
-) -> LimitOffset:
-    """Add offset/limit pagination.
+    with_total: bool = Parameter(query="withTotal", default=False, required=False),
+) -> CursorParams:
+    """Add keyset pagination.
 
-    Return type consumed by `Repository.apply_limit_offset_pagination()`.
+    Return type consumed by `KeysetPaginationMixin.list_page()`.
 
     Parameters
     ----------
-    current_page : int
-        LIMIT to apply to select.
+    cursor : str, optional
+        Token of the previous page, the first page when omitted.
     page_size : int
-        OFFSET to apply to select.
+        LIMIT to apply to select.
+    with_total : bool
+        Also return the, possibly estimated, number of rows.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    return CursorParams(page_size=page_size, after=after, with_total=with_total)
+
+
+def provide_created_filter(
+    before: Optional[datetime] = Parameter(
+        query="createdBefore", default=None, required=False
+    ),
+    after: Optional[datetime] = Parameter(
+        query="createdAfter", default=None, required=False
+    ),
+) -> BeforeAfter:
+    """Add a created_at range filter.
+
+    Return type consumed by `KeysetPaginationMixin.list_page()`.
+
+    Parameters
+    ----------
+    before : datetime, optional
+        Only rows created strictly before.
+    after : datetime, optional
+        Only rows created strictly after.
     """
-    return LimitOffset(page_size, page_size * (current_page - 1))
+    return BeforeAfter("created_at", before, after)
@@ -0,0 +1,37 @@
+from datetime import date, datetime
+from typing import Optional
+
+# Order events as sent by trading_service.pkg.observer, i.e. OrderMetaData fields.
+# An order is posted once when opened and once more when closed or cancelled. A part
+# closed off an open order is posted once, closed, with the `parent_id` of the order.
+OPEN_STATUS = "open"
+CLOSE_STATUS = "close"
+CANCELLED_STATUS = "cancelled"
+
+
+def _ratio(kind: str) -> int:
+    return 1 if kind == "buy" else -1
+
+
+def order_notional(data: dict) -> float:
+    """Signed amount held by an open order, short orders are negative."""
+    return _ratio(data["kind"]) * float(data["open_price"]) * float(data["quantity"])
+
+
+def order_pnl(data: dict) -> Optional[float]:
+    """Realized PnL of a closed order, None for any other event.
+
+    Same as `MockedBrockerConnector._calc_profit` without the returned open amount,
+    commissions are not part of the order data.
+    """
+    if data.get("status") != CLOSE_STATUS or data.get("close_price") is None:
+        return None
+    price_change = float(data["close_price"]) - float(data["open_price"])
+    return _ratio(data["kind"]) * price_change * float(data["quantity"])
+
+
+def order_day(data: dict, default: date) -> date:
+    """Day a closed order lands in the equity buckets."""
+    if close_dt := data.get("close_dt"):
+        return datetime.fromisoformat(close_dt).date()
+    return default
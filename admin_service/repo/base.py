@@ -0,0 +1,123 @@
+from typing import Any, Optional
+
+from litestar.repository.filters import BeforeAfter, FilterTypes
+from sqlalchemy import ColumnElement, and_, func, insert, select, text, tuple_
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.expression import type_coerce
+
+from admin_service.pkg.pagination import CursorParams, encode_cursor
+
+# Keeps a multi-row INSERT under the bind parameter limit of asyncpg (32767)
+INSERT_CHUNK_SIZE = 1000
+
+TABLE_ESTIMATE = text("SELECT reltuples::bigint FROM pg_class WHERE relname = :name")
+PARTITIONS_ESTIMATE = text(
+    "SELECT sum(greatest(child.reltuples, 0))::bigint FROM pg_inherits i "
+    "JOIN pg_class parent ON parent.oid = i.inhparent "
+    "JOIN pg_class child ON child.oid = i.inhrelid "
+    "WHERE parent.relname = :name"
+)
+
+
+class BulkInsertMixin:
+    """Multi-row inserts for append-only repositories."""
+
+    model_type: Any
+    session: AsyncSession
+
+    async def insert_many(self, data: list[dict]) -> list[dict]:
+        """Insert rows with one multi-row INSERT per chunk, no ORM objects.
+
+        Returns the rows, in the given order, with their generated `id`,
+        `created_at` and `updated_at`.
+        """
+        model = self.model_type
+        statement = insert(model).returning(
+            model.id, model.created_at, model.updated_at, sort_by_parameter_order=True
+        )
+        rows = []
+        for start in range(0, len(data), INSERT_CHUNK_SIZE):
+            chunk = data[start : start + INSERT_CHUNK_SIZE]
+            result = await self.session.execute(statement, chunk)
+            rows.extend(
+                {**item, **generated._mapping} for item, generated in zip(chunk, result)
+            )
+        return rows
+
+
+class KeysetPaginationMixin:
+    """Newest first pages on the (created_at, id) index, no OFFSET scans."""
+
+    model_type: Any
+    session: AsyncSession
+
+    async def list_page(
+        self,
+        params: CursorParams,
+        *filters: FilterTypes | ColumnElement[bool],
+        **kwargs: Any,
+    ) -> tuple[list[Any], Optional[str], Optional[int]]:
+        """Rows of one page, the cursor of the next page and the total if asked.
+
+        `filters` and `kwargs` are applied as by `Repository.list()`.
+        """
+        created_at, id = self.model_type.created_at, self.model_type.id
+        statement = select(self.model_type).order_by(created_at.desc(), id.desc())
+        if params.after is not None:
+            statement = statement.where(tuple_(created_at, id) < params.after)
+
+        # One extra row tells whether there is a next page
+        statement = statement.limit(params.page_size + 1)
+        rows = await self.list(*filters, statement=statement, **kwargs)
+        cursor = None
+        if len(rows) > params.page_size:
+            rows = rows[: params.page_size]
+            cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+        total = None
+        if params.with_total:
+            # Filtered counts go through the same indexes as the page itself
+            filtered = any(_is_active(filter_) for filter_ in filters) or kwargs
+            if filtered:
+                total = await self.count(*filters, **kwargs)
+            else:
+                total = await self.estimate_count()
+        return rows, cursor, total
+
+    async def estimate_count(self) -> int:
+        """Planner row estimate on PostgreSQL, exact COUNT(*) elsewhere."""
+        if self.session.bind.dialect.name == "postgresql":
+            name = {"name": self.model_type.__tablename__}
+            # A partitioned parent is never analyzed, its rows are in the partitions.
+            # Partitions not analyzed yet, e.g. the premade ones, count as empty.
+            estimate = await self.session.scalar(PARTITIONS_ESTIMATE, name)
+            if estimate is None:
+                estimate = await self.session.scalar(TABLE_ESTIMATE, name)
+            # -1 until the table is first vacuumed or analyzed
+            if estimate is not None and estimate >= 0:
+                return estimate
+        return await self.session.scalar(
+            select(func.count()).select_from(self.model_type)
+        )
+
+
+class JsonFilterMixin:
+    """Filters on top-level keys of the `data` JSON column."""
+
+    model_type: Any
+    session: AsyncSession
+
+    def data_matches(self, fields: dict[str, str]) -> ColumnElement[bool]:
+        """Rows whose `data` has all the given key/value pairs."""
+        data = self.model_type.data
+        # Containment is what the jsonb_path_ops GIN index answers
+        if self.session.bind.dialect.name == "postgresql":
+            return type_coerce(data, JSONB).contains(fields)
+        return and_(*(data[key].as_string() == value for key, value in fields.items()))
+
+
+def _is_active(filter_: FilterTypes | ColumnElement[bool]) -> bool:
+    if isinstance(filter_, BeforeAfter):
+        return filter_.before is not None or filter_.after is not None
+    return True
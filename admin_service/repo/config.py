@@ -8,9 +8,10 @@ if TYPE_CHECKING:
     from sqlalchemy.ext.asyncio import AsyncSession
 
 from admin_service.model import ConfigModel
+from admin_service.repo.base import KeysetPaginationMixin
 
 
-class ConfigRepository(SQLAlchemyAsyncRepository[ConfigModel]):
+class ConfigRepository(KeysetPaginationMixin, SQLAlchemyAsyncRepository[ConfigModel]):
     """Config repository."""
 
     model_type = ConfigModel
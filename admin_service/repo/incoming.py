@@ -2,9 +2,12 @@ from litestar.contrib.sqlalchemy.repository import SQLAlchemyAsyncRepository
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from admin_service.model import IncomingModel
+from admin_service.repo.base import BulkInsertMixin, KeysetPaginationMixin
 
 
-class IncomingRepository(SQLAlchemyAsyncRepository[IncomingModel]):
+class IncomingRepository(
+    BulkInsertMixin, KeysetPaginationMixin, SQLAlchemyAsyncRepository[IncomingModel]
+):
     """Incoming repository."""
 
     model_type = IncomingModel
@@ -2,9 +2,19 @@ from litestar.contrib.sqlalchemy.repository import SQLAlchemyAsyncRepository
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from admin_service.model import OrderModel
+from admin_service.repo.base import (
+    BulkInsertMixin,
+    JsonFilterMixin,
+    KeysetPaginationMixin,
+)
 
 
-class OrderRepository(SQLAlchemyAsyncRepository[OrderModel]):
+class OrderRepository(
+    BulkInsertMixin,
+    JsonFilterMixin,
+    KeysetPaginationMixin,
+    SQLAlchemyAsyncRepository[OrderModel],
+):
     """Order repository."""
 
     model_type = OrderModel
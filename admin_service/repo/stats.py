@@ -0,0 +1,207 @@
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Any
+from uuid import UUID
+
+from litestar.contrib.sqlalchemy.repository import SQLAlchemyAsyncRepository
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from admin_service.model import (
+    StrategyDailyStatsModel,
+    StrategyOrderEventModel,
+    StrategyStatsModel,
+)
+from admin_service.pkg.stats import (
+    CANCELLED_STATUS,
+    OPEN_STATUS,
+    order_day,
+    order_notional,
+    order_pnl,
+)
+from admin_service.repo.base import INSERT_CHUNK_SIZE
+
+INSERT_IGNORE = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+class StatsRepository(SQLAlchemyAsyncRepository[StrategyStatsModel]):
+    """Per-strategy running statistics, updated in the order ingestion transaction."""
+
+    model_type = StrategyStatsModel
+
+    async def record_orders(self, orders: list[dict]) -> None:
+        """Fold order events, dicts with `strategy_id` and `data`, into the stats.
+
+        Events are applied in the given order, the drawdown assumes it is the
+        order the trades were closed in. An event seen before, by order id and
+        status, is skipped.
+        """
+        by_strategy: dict[UUID, list[dict]] = defaultdict(list)
+        for order in orders:
+            by_strategy[order["strategy_id"]].append(order["data"])
+
+        today = datetime.now(timezone.utc).date()
+        for strategy_id, events in by_strategy.items():
+            stats = await self._lock_stats(strategy_id)
+            events = await self._new_events(strategy_id, events)
+            closed_days = {
+                order_day(data, today)
+                for data in events
+                if order_pnl(data) is not None
+            }
+            days = await self._lock_days(strategy_id, closed_days)
+            for data in events:
+                self._apply(stats, days, data, today)
+
+    async def get_daily(
+        self, strategy_id: UUID, limit: int
+    ) -> list[StrategyDailyStatsModel]:
+        """Latest `limit` daily buckets, oldest first."""
+        result = await self.session.scalars(
+            select(StrategyDailyStatsModel)
+            .where(StrategyDailyStatsModel.strategy_id == strategy_id)
+            .order_by(StrategyDailyStatsModel.day.desc())
+            .limit(limit)
+        )
+        return list(result)[::-1]
+
+    @staticmethod
+    def _apply(
+        stats: StrategyStatsModel,
+        days: dict[date, StrategyDailyStatsModel],
+        data: dict,
+        today: date,
+    ) -> None:
+        status = data.get("status")
+        if status == OPEN_STATUS:
+            stats.exposure += order_notional(data)
+            stats.open_orders += 1
+            return
+        if status == CANCELLED_STATUS:
+            stats.exposure -= order_notional(data)
+            stats.open_orders -= 1
+            return
+        if (pnl := order_pnl(data)) is None:
+            return
+
+        stats.exposure -= order_notional(data)
+        # The order a part was closed off stays open
+        if not data.get("parent_id"):
+            stats.open_orders -= 1
+        stats.realized_pnl += pnl
+        stats.trade_count += 1
+        stats.win_count += pnl > 0
+        stats.peak_pnl = max(stats.peak_pnl, stats.realized_pnl)
+        stats.max_drawdown = max(
+            stats.max_drawdown, stats.peak_pnl - stats.realized_pnl
+        )
+
+        day = days[order_day(data, today)]
+        day.pnl += pnl
+        day.trade_count += 1
+        day.equity = stats.realized_pnl
+
+    async def _new_events(self, strategy_id: UUID, events: list[dict]) -> list[dict]:
+        # Claims (order_id, status) of every event, only the ones claimed by this
+        # call are applied, so redelivered batches leave the stats as they are
+        keyed = {}
+        for data in events:
+            key = (str(data.get("order_id")), str(data.get("status")))
+            keyed.setdefault(key, data)
+        if not keyed:
+            return []
+
+        claimed = await self._insert_ignore(
+            StrategyOrderEventModel,
+            [
+                {"strategy_id": strategy_id, "order_id": order_id, "status": status}
+                for order_id, status in keyed
+            ],
+            StrategyOrderEventModel.order_id,
+            StrategyOrderEventModel.status,
+        )
+        new_keys = set(map(tuple, claimed))
+        return [data for key, data in keyed.items() if key in new_keys]
+
+    async def _lock_stats(self, strategy_id: UUID) -> StrategyStatsModel:
+        # Create-if-missing then a row lock, concurrent ingestion of the same
+        # strategy serializes here instead of racing on the unique strategy_id
+        await self._insert_ignore(
+            StrategyStatsModel,
+            [
+                {
+                    "strategy_id": strategy_id,
+                    "realized_pnl": 0.0,
+                    "trade_count": 0,
+                    "win_count": 0,
+                    "peak_pnl": 0.0,
+                    "max_drawdown": 0.0,
+                    "exposure": 0.0,
+                    "open_orders": 0,
+                }
+            ],
+        )
+        return await self.session.scalar(
+            select(StrategyStatsModel)
+            .where(StrategyStatsModel.strategy_id == strategy_id)
+            .with_for_update()
+        )
+
+    async def _lock_days(
+        self, strategy_id: UUID, days: set[date]
+    ) -> dict[date, StrategyDailyStatsModel]:
+        if not days:
+            return {}
+        # Every bucket locked here gets a closed trade, which sets its equity
+        await self._insert_ignore(
+            StrategyDailyStatsModel,
+            [
+                {
+                    "strategy_id": strategy_id,
+                    "day": day,
+                    "pnl": 0.0,
+                    "trade_count": 0,
+                    "equity": 0.0,
+                }
+                for day in days
+            ],
+        )
+        result = await self.session.scalars(
+            select(StrategyDailyStatsModel)
+            .where(
+                StrategyDailyStatsModel.strategy_id == strategy_id,
+                StrategyDailyStatsModel.day.in_(days),
+            )
+            .with_for_update()
+        )
+        return {bucket.day: bucket for bucket in result}
+
+    async def _insert_ignore(
+        self, model: Any, rows: list[dict], *returning: Any
+    ) -> list[tuple]:
+        # Chunked like BulkInsertMixin, a full batch is over the bind parameter limit
+        insert = INSERT_IGNORE[self.session.bind.dialect.name]
+        inserted = []
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            statement = insert(model).values(rows[start : start + INSERT_CHUNK_SIZE])
+            statement = statement.on_conflict_do_nothing()
+            if returning:
+                statement = statement.returning(*returning)
+            result = await self.session.execute(statement)
+            if returning:
+                inserted.extend(result)
+        return inserted
+
+    async def purge_events(self, before: datetime) -> None:
+        """Forget order events seen before `before`, redeliveries come much sooner."""
+        await self.session.execute(
+            delete(StrategyOrderEventModel).where(
+                StrategyOrderEventModel.created_at < before
+            )
+        )
+
+
+async def provide_stats_repo(db_session: AsyncSession) -> StatsRepository:
+    """This provides the default Stats repository."""
+    return StatsRepository(session=db_session)
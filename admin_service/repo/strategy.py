@@ -1,14 +1,37 @@
+from typing import Iterable
+from uuid import UUID
+
 from litestar.contrib.sqlalchemy.repository import SQLAlchemyAsyncRepository
+from litestar.exceptions import NotFoundException
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from admin_service.model import StrategyModel
+from admin_service.repo.base import KeysetPaginationMixin
 
 
-class StrategyRepository(SQLAlchemyAsyncRepository[StrategyModel]):
+class StrategyRepository(
+    KeysetPaginationMixin, SQLAlchemyAsyncRepository[StrategyModel]
+):
     """Strategy repository."""
 
     model_type = StrategyModel
 
+    async def check_known(self, ids: Iterable[UUID]) -> None:
+        """Raise a 404 if any of the strategies does not exist.
+
+        Observers register a strategy once and cache it, the 404 tells them to
+        register it again instead of retrying a foreign key violation.
+        """
+        ids = set(ids)
+        known = await self.session.scalars(
+            select(StrategyModel.id).where(StrategyModel.id.in_(ids))
+        )
+        if missing := ids - set(known):
+            raise NotFoundException(
+                detail=f"Unknown strategies {sorted(map(str, missing))}"
+            )
+
 
 async def provide_strategys_repo(db_session: AsyncSession) -> StrategyRepository:
     """This provides the default Strategys repository."""
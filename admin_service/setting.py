@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 
 
@@ -7,6 +9,20 @@ class Settings(BaseSettings):
 
     connection_string: str = ""
 
+    batch_max_size: int = 10_000
+
+    # Events buffered per live feed client before the oldest are dropped
+    feed_queue_size: int = 1_000
+
+    # Incoming and order partitions, PostgreSQL only
+    partition_interval: Literal["day", "month"] = "day"
+    partition_premake: int = 7
+    partition_retention: int = 0
+    partition_check_interval: float = 3600.0
+
+    # Days order events are kept to skip redelivered ones in the stats, 0 keeps all
+    order_event_retention: int = 30
+
     allow_origins: list[str] = []
 
     debug: bool = False
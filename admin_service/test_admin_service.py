@@ -0,0 +1,359 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from uuid import UUID, uuid4
+
+_db_dir = tempfile.TemporaryDirectory()
+os.environ["connection_string"] = f"sqlite+aiosqlite:///{_db_dir.name}/admin.db"
+
+from litestar.exceptions import ValidationException  # noqa: E402
+from litestar.testing import TestClient  # noqa: E402
+from orjson import dumps  # noqa: E402
+from sqlalchemy import (  # noqa: E402
+    Engine,
+    event,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.ext.asyncio import AsyncSession  # noqa: E402
+
+from admin_service.app import app, on_startup, sqlalchemy_config  # noqa: E402
+from admin_service.model import OrderModel, StrategyOrderEventModel  # noqa: E402
+from admin_service.pkg.batch import parse_batch  # noqa: E402
+from admin_service.pkg.feed import INCOMING_KIND, ORDER_KIND, Feed  # noqa: E402
+from admin_service.pkg.pagination import decode_cursor, encode_cursor  # noqa: E402
+from admin_service.repo.stats import StatsRepository  # noqa: E402
+from admin_service.setting import settings  # noqa: E402
+
+# asyncpg refuses statements with more bind parameters
+MAX_BIND_PARAMETERS = 32767
+
+
+def make_strategy(client: TestClient) -> str:
+    strategy = {"name": "Test", "description": "Test strategy", "source_code": ""}
+    return client.post("/strategies", json=strategy).json()["id"]
+
+
+def make_order(strategy_id: str, order_id: str, status: str, **fields) -> dict:
+    data = {
+        "order_id": order_id,
+        "instrument": "SBER",
+        "kind": "buy",
+        "status": status,
+        "open_price": 100.0,
+        "quantity": 1,
+        **fields,
+    }
+    return {"strategy_id": strategy_id, "data": data}
+
+
+def insert_orders(strategy_id: str, rows: list[tuple[datetime, dict]]) -> list[str]:
+    # Straight into the table, the API stamps created_at itself
+    ids = [uuid4() for _ in rows]
+
+    async def insert_rows() -> None:
+        engine = sqlalchemy_config.get_engine()
+        async with engine.begin() as conn:
+            await conn.execute(
+                insert(OrderModel),
+                [
+                    {
+                        "id": id,
+                        "created_at": created_at,
+                        "updated_at": created_at,
+                        "strategy_id": UUID(strategy_id),
+                        "data": data,
+                    }
+                    for id, (created_at, data) in zip(ids, rows)
+                ],
+            )
+        await engine.dispose()
+
+    asyncio.run(insert_rows())
+    return [str(id) for id in ids]
+
+
+class TestStats(unittest.TestCase):
+    def test_full_batch_stays_under_bind_parameter_limit(self):
+        bind_counts = []
+
+        def count_binds(conn, cursor, statement, parameters, context, executemany):
+            bind_counts.append(len(parameters))
+
+        with TestClient(app) as client:
+            strategy_id = make_strategy(client)
+            order_ids = [str(uuid4()) for _ in range(settings.batch_max_size // 2)]
+            orders = [
+                make_order(strategy_id, order_id, "open") for order_id in order_ids
+            ]
+            orders += [
+                make_order(strategy_id, order_id, "close", close_price=101.0)
+                for order_id in order_ids
+            ]
+
+            event.listen(Engine, "before_cursor_execute", count_binds)
+            try:
+                response = client.post(
+                    "/orders/batch",
+                    content=b"\n".join(dumps(order) for order in orders),
+                    headers={"Content-Type": "application/x-ndjson"},
+                )
+                # A redelivered batch is skipped by the stats
+                client.post(
+                    "/orders/batch",
+                    content=dumps(orders),
+                    headers={"Content-Type": "application/json"},
+                )
+            finally:
+                event.remove(Engine, "before_cursor_execute", count_binds)
+            stats = client.get(f"/strategies/{strategy_id}/stats").json()
+
+        self.assertEqual(response.status_code, 201, response.text)
+        self.assertEqual(response.json(), {"total": settings.batch_max_size})
+        self.assertLessEqual(max(bind_counts), MAX_BIND_PARAMETERS)
+        self.assertEqual(stats["trade_count"], len(order_ids))
+        self.assertEqual(stats["win_count"], len(order_ids))
+        self.assertAlmostEqual(stats["realized_pnl"], len(order_ids))
+        self.assertEqual(stats["open_orders"], 0)
+        self.assertEqual(stats["max_drawdown"], 0.0)
+
+    def test_purge_forgets_old_order_events(self):
+        async def purge(before: datetime) -> int:
+            engine = sqlalchemy_config.get_engine()
+            async with engine.begin() as conn:
+                session = AsyncSession(conn)
+                await StatsRepository(session=session).purge_events(before)
+                count = select(func.count()).select_from(StrategyOrderEventModel)
+                left = await session.scalar(count)
+            await engine.dispose()
+            return left
+
+        with TestClient(app) as client:
+            strategy_id = make_strategy(client)
+            order = make_order(strategy_id, str(uuid4()), "open")
+            client.post("/orders", content=dumps(order))
+
+            now = datetime.now(timezone.utc)
+            self.assertGreater(asyncio.run(purge(now - timedelta(days=1))), 0)
+            self.assertEqual(asyncio.run(purge(now + timedelta(seconds=1))), 0)
+
+    def test_closed_part_keeps_its_order_open(self):
+        with TestClient(app) as client:
+            strategy_id = make_strategy(client)
+            order_id, part_id = str(uuid4()), str(uuid4())
+            orders = [
+                make_order(strategy_id, order_id, "open", quantity=10),
+                make_order(
+                    strategy_id,
+                    part_id,
+                    "close",
+                    quantity=7,
+                    close_price=101.0,
+                    parent_id=order_id,
+                ),
+            ]
+            client.post("/orders/batch", content=dumps(orders))
+            stats = client.get(f"/strategies/{strategy_id}/stats").json()
+
+        self.assertEqual(stats["open_orders"], 1)
+        self.assertAlmostEqual(stats["exposure"], 300.0)
+        self.assertAlmostEqual(stats["realized_pnl"], 7.0)
+
+
+class TestSchema(unittest.TestCase):
+    def test_startup_drops_indexes_duplicating_the_primary_key(self):
+        async def order_indexes() -> set[str]:
+            engine = sqlalchemy_config.get_engine()
+            async with engine.connect() as conn:
+                indexes = await conn.run_sync(
+                    lambda sync_conn: inspect(sync_conn).get_indexes("order")
+                )
+            await engine.dispose()
+            return {index["name"] for index in indexes}
+
+        async def create_stale_index() -> None:
+            engine = sqlalchemy_config.get_engine()
+            async with engine.begin() as conn:
+                await conn.execute(
+                    text(
+                        "CREATE INDEX ix_order_created_at_id "
+                        'ON "order" (created_at, id)'
+                    )
+                )
+            await engine.dispose()
+
+        with TestClient(app):
+            pass
+        asyncio.run(create_stale_index())
+        self.assertIn("ix_order_created_at_id", asyncio.run(order_indexes()))
+
+        asyncio.run(on_startup())
+        indexes = asyncio.run(order_indexes())
+        self.assertNotIn("ix_order_created_at_id", indexes)
+        self.assertIn("ix_order_strategy_id_created_at", indexes)
+
+
+class TestPagination(unittest.TestCase):
+    def test_cursor_round_trip(self):
+        created_at = datetime(2024, 1, 10, 10, 0, 0, 123456, tzinfo=timezone.utc)
+        id = uuid4()
+        cursor = encode_cursor(created_at, id)
+
+        self.assertNotIn("=", cursor)
+        self.assertEqual(decode_cursor(cursor), (created_at, id))
+        for malformed in ["", "not a cursor", cursor[:-4]]:
+            with self.assertRaises(ValidationException):
+                decode_cursor(malformed)
+        with TestClient(app) as client:
+            response = client.get("/orders", params={"cursor": "not a cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_pages_through_equal_created_at(self):
+        created_at = datetime(2024, 1, 10, 10, 0, tzinfo=timezone.utc)
+        with TestClient(app) as client:
+            strategy_id = make_strategy(client)
+            # Most rows share one created_at, the id breaks the tie
+            rows = [(created_at, {"i": i}) for i in range(7)]
+            rows += [(created_at + timedelta(seconds=1), {"i": 7})]
+            rows += [(created_at - timedelta(seconds=1), {"i": 8})]
+            ids = insert_orders(strategy_id, rows)
+
+            pages, cursor = [], None
+            while True:
+                params = {"strategyId": strategy_id, "pageSize": 2, "withTotal": True}
+                if cursor:
+                    params["cursor"] = cursor
+                page = client.get("/orders", params=params).json()
+                pages.append([item["id"] for item in page["items"]])
+                self.assertEqual(page["total"], len(rows))
+                if not (cursor := page["cursor"]):
+                    break
+
+        newest_first = sorted(
+            zip((created_at for created_at, _ in rows), map(UUID, ids)),
+            reverse=True,
+        )
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 2, 1])
+        self.assertEqual(
+            [UUID(id) for page in pages for id in page],
+            [id for _, id in newest_first],
+        )
+
+
+class TestBatch(unittest.TestCase):
+    def test_ndjson_lines_are_parsed_one_by_one(self):
+        body = b'{"a": 1}\n\n{"a": 2}\n'
+        self.assertEqual(
+            parse_batch(body, "application/x-ndjson", dict), [{"a": 1}, {"a": 2}]
+        )
+        with self.assertRaisesRegex(ValidationException, "Line 2"):
+            parse_batch(b'{"a": 1}\n{"a": 2},{"a": 3}', "application/x-ndjson", dict)
+
+    def test_size_is_checked_before_items_are_validated(self):
+        size = settings.batch_max_size + 1
+        ndjson = b"\n".join(b"0" for _ in range(size))
+        with self.assertRaisesRegex(ValidationException, "exceeds"):
+            parse_batch(ndjson, "application/x-ndjson", dict)
+        with self.assertRaisesRegex(ValidationException, "exceeds"):
+            parse_batch(dumps([0] * size), "application/json", dict)
+        with self.assertRaises(ValidationException):
+            parse_batch(b"[0", "application/json", dict)
+
+
+class TestFilters(unittest.TestCase):
+    def test_filters_orders_by_data_strategy_and_time(self):
+        created_at = datetime(2024, 1, 10, 10, 0, tzinfo=timezone.utc)
+        orders = [
+            {"instrument": "SBER", "status": "open", "kind": "buy"},
+            {"instrument": "SBER", "status": "close", "kind": "buy"},
+            {"instrument": "GAZP", "status": "open", "kind": "sell"},
+            {"instrument": "SBER", "status": "open", "kind": "sell", "extra": 1},
+        ]
+        with TestClient(app) as client:
+            strategy_id, other_id = make_strategy(client), make_strategy(client)
+            ids = insert_orders(
+                strategy_id,
+                [
+                    (created_at + timedelta(minutes=i), data)
+                    for i, data in enumerate(orders)
+                ],
+            )
+            insert_orders(other_id, [(created_at, orders[0])])
+
+            def found(**params) -> set[str]:
+                params = {"strategyId": strategy_id, "pageSize": 100, **params}
+                params = {key: value for key, value in params.items() if value}
+                response = client.get("/orders", params=params)
+                self.assertEqual(response.status_code, 200, response.text)
+                return {item["id"] for item in response.json()["items"]}
+
+            self.assertEqual(found(), set(ids))
+            self.assertEqual(found(instrument="SBER"), {ids[0], ids[1], ids[3]})
+            self.assertEqual(found(instrument="SBER", status="open"), {ids[0], ids[3]})
+            self.assertEqual(
+                found(instrument="SBER", status="open", kind="sell"), {ids[3]}
+            )
+            self.assertEqual(found(instrument="LKOH"), set())
+            self.assertEqual(
+                found(
+                    status="open",
+                    createdAfter=created_at.isoformat(),
+                    createdBefore=(created_at + timedelta(minutes=3)).isoformat(),
+                ),
+                {ids[2]},
+            )
+            # Without strategyId every strategy matches, other tests order today
+            before = (created_at + timedelta(days=1)).isoformat()
+            self.assertEqual(
+                len(
+                    found(
+                        strategyId=None,
+                        instrument="SBER",
+                        kind="buy",
+                        createdBefore=before,
+                    )
+                ),
+                3,
+            )
+
+
+class TestFeed(unittest.TestCase):
+    def test_slow_subscriber_drops_oldest_and_is_told(self):
+        async def receive(subscription, count: int) -> list[dict]:
+            events = []
+            async for payload in subscription:
+                events.append(json.loads(payload))
+                if len(events) == count:
+                    return events
+
+        feed = Feed(max_queue_size=2)
+        strategy_id, other_id = uuid4(), uuid4()
+        slow = feed.subscribe(strategy_id)
+        orders_only = feed.subscribe(None, frozenset({ORDER_KIND}))
+
+        # Publishing never waits for subscribers
+        feed.publish(
+            ORDER_KIND,
+            [{"strategy_id": strategy_id, "data": {"i": i}} for i in range(5)],
+        )
+        feed.publish(INCOMING_KIND, [{"strategy_id": other_id, "data": {"i": 5}}])
+        feed.publish(ORDER_KIND, [{"strategy_id": other_id, "data": {"i": 6}}])
+
+        self.assertEqual(
+            [event.get("data") for event in asyncio.run(receive(slow, 3))],
+            [None, {"i": 3}, {"i": 4}],
+        )
+        self.assertEqual(
+            [event.get("dropped") for event in asyncio.run(receive(orders_only, 3))],
+            [4, None, None],
+        )
+
+        feed.unsubscribe(slow)
+        feed.unsubscribe(orders_only)
+        self.assertFalse(feed._subscribers)
@@ -0,0 +1,174 @@
+import argparse
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import xarray as xr
+
+import moex_utils
+
+
+def make_synthetic_tradestats(n_rows, n_symbols=20, seed=0):
+    rng = np.random.default_rng(seed)
+    symbols = np.array([f"SYM{i:03d}" for i in range(n_symbols)])
+    minutes = rng.integers(0, 60 * 24 * 30, n_rows) // 5 * 5
+    df = pd.DataFrame({
+        'secid': rng.choice(symbols, n_rows),
+        'datetime': pd.Timestamp('2020-01-03 10:00') + pd.to_timedelta(minutes, unit='min'),
+        'pr_open': rng.random(n_rows) + 100,
+        'pr_high': rng.random(n_rows) + 101,
+        'pr_low': rng.random(n_rows) + 99,
+        'pr_close': rng.random(n_rows) + 100,
+        'vol': rng.integers(1, 100, n_rows).astype(float),
+        'val': rng.random(n_rows) * 1000,
+    })
+    df.loc[rng.random(n_rows) < 0.02, 'pr_open'] = np.nan
+    return df.sort_values('datetime', kind='stable').reset_index(drop=True)
+
+
+def legacy_get_xarray_from_df(df, interval='1D'):
+    # Per-symbol path that get_xarray_from_df used before the grouped builder
+    dataframes = {}
+    for symbol in df['secid'].unique():
+        symbol_df = df[df['secid'] == symbol]
+        dataframes[symbol] = moex_utils.create_market_candles(symbol_df, interval=interval)
+
+    return moex_utils.dataframes_to_xarray(dataframes)
+
+
+def legacy_add_is_liquid_field(data, vol_rolling_name, new_field_name='is_liquid', top_assets=100):
+    # Per-date loop that add_is_liquid_field used before the vectorized ranking
+    is_liquid_values = xr.DataArray(
+        np.zeros((data.sizes['time'], data.sizes['asset'])),
+        dims=['time', 'asset'],
+        coords={'time': data.coords['time'], 'asset': data.coords['asset']}
+    )
+
+    for time_ in data.coords['time'].values:
+        daily_vol_rolling = data.sel(field=vol_rolling_name, time=time_).fillna(0)
+        if daily_vol_rolling.sum() == 0:
+            continue
+        ranks = (-daily_vol_rolling).rank('asset')
+        top_assets_indices = ranks.where(ranks <= top_assets).dropna('asset').asset.values
+        is_liquid_values.loc[dict(time=time_, asset=top_assets_indices)] = 1
+
+    is_liquid_expanded = is_liquid_values.expand_dims({'field': [new_field_name]})
+    is_liquid_expanded = is_liquid_expanded.transpose('asset', 'field', 'time')
+
+    return xr.concat([data, is_liquid_expanded], dim='field')
+
+
+def make_synthetic_cube(n_times, n_assets=250, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.lognormal(10, 2, (1, n_times, n_assets))
+    values[rng.random(values.shape) < 0.1] = np.nan
+    return xr.DataArray(
+        values,
+        dims=['field', 'time', 'asset'],
+        coords={
+            'field': ['vol'],
+            'time': pd.date_range('2010-01-01', periods=n_times, freq='5min'),
+            'asset': [f"SYM{i:03d}" for i in range(n_assets)],
+        },
+    )
+
+
+def make_synthetic_market(n_times, n_assets=250, seed=0, freq='D'):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (n_times, n_assets)), axis=0))
+    open_ = close * np.exp(rng.normal(0, 0.005, (n_times, n_assets)))
+    values = np.stack([open_, np.maximum(open_, close) * 1.01, np.minimum(open_, close) * 0.99, close,
+                       rng.random((n_times, n_assets)) * 1e6])
+    values[:, rng.random((n_times, n_assets)) < 0.05] = np.nan
+    times = pd.date_range('2010-01-01', periods=n_times, freq=freq)
+    assets = [f"SYM{i:03d}" for i in range(n_assets)]
+    data = xr.DataArray(values, dims=['field', 'time', 'asset'],
+                        coords={'field': ['open', 'high', 'low', 'close', 'vol'], 'time': times, 'asset': assets})
+    weights = xr.DataArray((rng.random((n_times, n_assets)) > 0.3).astype(float), dims=['time', 'asset'],
+                           coords={'time': times, 'asset': assets})
+    return data, weights
+
+
+def rolling_momentum_weights(data, params):
+    # TRIX-like two-signal rule of the research notebook built on a rolling mean
+    s_ = data.sel(field='open').rolling(time=params[0]).mean()
+    w_1 = s_.shift(time=params[1]) > s_.shift(time=params[2])
+    w_2 = s_.shift(time=params[3]) > s_.shift(time=params[4])
+    return (w_1 * w_2).astype(float).fillna(0)
+
+
+def timeit(func, *args, **kwargs):
+    start_time = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start_time
+
+
+def bench_get_xarray_from_df(sizes, n_symbols=250, interval='5min'):
+    print(f"get_xarray_from_df: {n_symbols} symbols, interval={interval}")
+    for n_rows in sizes:
+        df = make_synthetic_tradestats(n_rows, n_symbols=n_symbols)
+        _, legacy_elapsed = timeit(legacy_get_xarray_from_df, df, interval=interval)
+        _, grouped_elapsed = timeit(moex_utils.get_xarray_from_df, df, interval=interval)
+        print(f"{n_rows:>10} rows  legacy {legacy_elapsed:8.2f}s  grouped {grouped_elapsed:8.2f}s  "
+              f"x{legacy_elapsed / grouped_elapsed:.1f}")
+
+
+def bench_add_is_liquid_field(sizes, n_assets=250, top_assets=100, legacy_limit=10_000):
+    print(f"add_is_liquid_field: {n_assets} assets, top {top_assets}")
+    for n_times in sizes:
+        data = moex_utils.add_rolling_vol(make_synthetic_cube(n_times, n_assets=n_assets), window=45)
+        _, vectorized_elapsed = timeit(moex_utils.add_is_liquid_field, data, 'vol_rolling', top_assets=top_assets)
+        if n_times > legacy_limit:
+            print(f"{n_times:>10} dates  legacy  skipped  vectorized {vectorized_elapsed:8.2f}s")
+            continue
+        _, legacy_elapsed = timeit(legacy_add_is_liquid_field, data, 'vol_rolling', top_assets=top_assets)
+        print(f"{n_times:>10} dates  legacy {legacy_elapsed:8.2f}s  vectorized {vectorized_elapsed:8.2f}s  "
+              f"x{legacy_elapsed / vectorized_elapsed:.1f}")
+
+
+def bench_run_backtest(sizes, n_assets=250, legacy_assets=10):
+    # backtesting.py is timed on a few assets and scaled, a full legacy run takes minutes
+    print(f"run_backtest: {n_assets} assets, legacy timed on {legacy_assets} assets")
+    for n_times in sizes:
+        data, weights = make_synthetic_market(n_times, n_assets=n_assets)
+        _, vectorized_elapsed = timeit(moex_utils.run_vectorized_backtest, data, weights)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            _, legacy_elapsed = timeit(moex_utils.run_backtest, data.isel(asset=slice(legacy_assets)),
+                                       weights.isel(asset=slice(legacy_assets)))
+        legacy_elapsed *= n_assets / legacy_assets
+        print(f"{n_times:>10} bars  legacy ~{legacy_elapsed:8.2f}s  vectorized {vectorized_elapsed:8.2f}s  "
+              f"x{legacy_elapsed / vectorized_elapsed:.1f}")
+
+
+def bench_sweep_weight_function(workers, n_candidates=32, n_times=2500, n_assets=250):
+    print(f"sweep_weight_function: {n_candidates} candidates, {n_assets} assets x {n_times} bars")
+    data, _ = make_synthetic_market(n_times, n_assets=n_assets)
+    param_space = [(10, 80), (1, 40), (1, 40), (1, 40), (1, 70)]
+    baseline = None
+    for max_workers in workers:
+        _, elapsed = timeit(moex_utils.sweep_weight_function, rolling_momentum_weights, data,
+                            param_space=param_space, n_iter=n_candidates, max_workers=max_workers)
+        baseline = baseline or elapsed
+        print(f"{max_workers:>4} workers  {elapsed:8.2f}s  x{baseline / elapsed:.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('bench', choices=['candles', 'is_liquid', 'backtest', 'sweep'])
+    parser.add_argument('--sizes', type=int, nargs='+')
+    parser.add_argument('--symbols', type=int, default=250)
+    parser.add_argument('--interval', default='5min')
+    args = parser.parse_args()
+
+    if args.bench == 'candles':
+        bench_get_xarray_from_df(args.sizes or [10_000, 1_000_000, 10_000_000],
+                                 n_symbols=args.symbols, interval=args.interval)
+    elif args.bench == 'is_liquid':
+        bench_add_is_liquid_field(args.sizes or [2_500, 250_000], n_assets=args.symbols)
+    elif args.bench == 'backtest':
+        bench_run_backtest(args.sizes or [2_500], n_assets=args.symbols)
+    elif args.bench == 'sweep':
+        bench_sweep_weight_function(args.sizes or [1, 2, 4, 8], n_assets=args.symbols)
@@ -5,35 +5,300 @@ import random
 from datetime import datetime, timedelta
 import numpy as np
 import xarray as xr
+import threading
 import time
 import logging
+import os
+import hashlib
+import itertools
+import weakref
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing import shared_memory
 from io import StringIO
 from backtesting import Backtest, Strategy
 import requests
+import sys
+
+# Lot sizing is shared with the trading service at the repo root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from trading_service.strategy import calculate_asset_lot_counts  # noqa: E402
+
+CANDLE_FIELDS = ['open', 'high', 'low', 'close', 'vol', 'vol_lot']
+STORE_META_FILE = 'store.json'
+ISS_URL = 'https://iss.moex.com'
+TRADESTATS_PAGE_SIZE = 1000
+TRADESTATS_MAX_PAGES = 25
+TRADESTATS_CHECKPOINT_INDEX = 'pages.jsonl'
+TRADESTATS_CACHE_INDEX = 'dates.json'
+BACKTEST_STATS = [
+    'Exposure Time [%]', 'Equity Final [$]', 'Equity Peak [$]', 'Return [%]',
+    'Buy & Hold Return [%]', 'Return (Ann.) [%]', 'Volatility (Ann.) [%]',
+    'Sharpe Ratio', 'Sortino Ratio', 'Calmar Ratio', 'Max. Drawdown [%]',
+    'Avg. Drawdown [%]', 'Max. Drawdown Duration', 'Avg. Drawdown Duration',
+    '# Trades', 'Win Rate [%]', 'Best Trade [%]', 'Worst Trade [%]',
+    'Avg. Trade [%]', 'Max. Trade Duration', 'Avg. Trade Duration',
+    'Profit Factor', 'Expectancy [%]', 'SQN'
+]
+
+
+def fetch_new_tradestats(api_dates, **kwargs):
+    return download_tradestats(api_dates, **kwargs)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def download_tradestats(api_dates, base_url=ISS_URL, max_workers=4, rate=5, max_retries=5, backoff=0.5,
+                        checkpoint_dir=None):
+    # Pages of one date are fetched in order (the last page is the first short one),
+    # different dates are fetched concurrently under a shared rate limit.
+    bucket = TokenBucket(rate)
+    local = threading.local()
+    lock = threading.Lock()
+    pages = _load_tradestats_checkpoint(checkpoint_dir) if checkpoint_dir else {}
+    # Today's pages are still growing, like the tradestats cache the checkpoint only keeps past dates
+    today = str(datetime.now().date())
+
+    def fetch_page(date, cursor):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        url = f'{base_url}/iss/datashop/algopack/eq/tradestats.csv'
+        params = {'date': date, 'start': cursor * TRADESTATS_PAGE_SIZE, 'iss.only': 'data'}
+
+        for attempt in range(max_retries + 1):
+            bucket.acquire()
+            try:
+                response = local.session.get(url, params=params, timeout=30)
+                response.raise_for_status()
+                break
+            except requests.RequestException as e:
+                status = e.response.status_code if e.response is not None else None
+                if (status is not None and status < 500 and status != 429) or attempt == max_retries:
+                    raise
+                time.sleep(backoff * 2 ** attempt)
+
+        try:
+            df = pd.read_csv(StringIO(response.text), sep=';', skiprows=2)
+        except pd.errors.EmptyDataError:
+            df = pd.DataFrame()
+
+        if checkpoint_dir and date < today:
+            with lock:
+                _save_tradestats_checkpoint(checkpoint_dir, date, cursor, df)
+        return df
+
+    def next_cursor(date):
+        # First cursor of the date that is not downloaded yet, None if the date is complete
+        cursor = 0
+        while (date, cursor) in pages:
+            if len(pages[(date, cursor)]) < TRADESTATS_PAGE_SIZE:
+                return None
+            cursor += 1
+        return cursor if cursor < TRADESTATS_MAX_PAGES else None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for date in map(str, api_dates):
+            if (cursor := next_cursor(date)) is not None:
+                futures[executor.submit(fetch_page, date, cursor)] = (date, cursor)
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                date, cursor = futures.pop(future)
+                pages[(date, cursor)] = future.result()
+                logging.info(f"Fetched tradestats for {date}, page {cursor}")
+                if (cursor := next_cursor(date)) is not None:
+                    futures[executor.submit(fetch_page, date, cursor)] = (date, cursor)
+
+    requested = set(map(str, api_dates))
+    frames = [pages[key] for key in sorted(pages) if key[0] in requested and not pages[key].empty]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def _load_tradestats_checkpoint(checkpoint_dir):
+    pages = {}
+    index_path = os.path.join(checkpoint_dir, TRADESTATS_CHECKPOINT_INDEX)
+    if not os.path.exists(index_path):
+        return pages
+
+    with open(index_path) as f:
+        for line in f:
+            entry = json.loads(line)
+            pages[(entry['date'], entry['cursor'])] = pd.read_pickle(os.path.join(checkpoint_dir, entry['file']))
+    return pages
+
+
+def _save_tradestats_checkpoint(checkpoint_dir, date, cursor, df):
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    file_name = f"{date}_{cursor}.pkl"
+    df.to_pickle(os.path.join(checkpoint_dir, file_name))
+
+    # The page file is written before its index entry, so a listed page is always complete
+    with open(os.path.join(checkpoint_dir, TRADESTATS_CHECKPOINT_INDEX), 'a') as f:
+        f.write(json.dumps({'date': date, 'cursor': cursor, 'file': file_name}) + '\n')
+
+
+def load_tradestats(api_dates, cache_dir, **kwargs):
+    # Cached days are read from disk, the rest is downloaded and cached once complete
+    api_dates = [pd.Timestamp(date).date() for date in api_dates]
+    cached = set(cached_tradestats_dates(cache_dir))
+    missing = [date for date in api_dates if date not in cached]
+
+    frames = []
+    if missing:
+        downloaded = download_tradestats(missing, **kwargs)
+        if not downloaded.empty:
+            downloaded = normalize_tradestats(downloaded)
+            # Today's tradestats are still growing, keep them out of the cache
+            today = datetime.now().date()
+            write_tradestats_cache(downloaded[downloaded['datetime'].dt.date < today], cache_dir)
+            frames.append(downloaded)
+
+    cached_dates = [date for date in api_dates if date in cached]
+    if cached_dates:
+        frames.insert(0, read_tradestats_cache(cache_dir, cached_dates))
+
+    if not frames:
+        return pd.DataFrame()
+    return _concat_tradestats(frames).sort_values('datetime', kind='stable', ignore_index=True)
+
+
+def normalize_tradestats(df):
+    # Typed columns for the cache: datetime64, categorical strings, float32 prices
+    df = df.copy()
+    if 'datetime' not in df.columns:
+        df.insert(0, 'datetime', pd.to_datetime(df['tradedate'] + ' ' + df['tradetime'], format='%Y-%m-%d %H:%M:%S'))
+        df = df.drop(columns=['tradedate', 'tradetime'])
+
+    for column in df.columns:
+        if column.startswith('pr_'):
+            df[column] = df[column].astype(np.float32)
+        elif df[column].dtype == object:
+            df[column] = df[column].astype('category')
+
+    return df
+
+
+def cached_tradestats_dates(cache_dir):
+    index_path = os.path.join(cache_dir, TRADESTATS_CACHE_INDEX)
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path) as f:
+        return [datetime.strptime(date, '%Y-%m-%d').date() for date in json.load(f)]
+
+
+def write_tradestats_cache(df, cache_dir):
+    if df.empty:
+        return []
+
+    os.makedirs(cache_dir, exist_ok=True)
+    df = normalize_tradestats(df)
+    dates = df['datetime'].dt.date
+
+    written = []
+    for date, day_df in df.groupby(dates, sort=True):
+        arrays = {'__columns__': np.array(day_df.columns, dtype=str)}
+        for column in day_df.columns:
+            values = day_df[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                arrays[column] = values.cat.codes.to_numpy()
+                arrays[column + '.categories'] = np.array(values.cat.categories, dtype=str)
+            else:
+                arrays[column] = values.to_numpy()
+
+        day_path = os.path.join(cache_dir, f"{date}.npz")
+        with open(day_path + '.tmp', 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(day_path + '.tmp', day_path)
+        written.append(date)
+
+    index = sorted(set(cached_tradestats_dates(cache_dir)) | set(written))
+    index_path = os.path.join(cache_dir, TRADESTATS_CACHE_INDEX)
+    with open(index_path + '.tmp', 'w') as f:
+        json.dump([str(date) for date in index], f)
+    os.replace(index_path + '.tmp', index_path)
+
+    return written
+
+
+def read_tradestats_cache(cache_dir, dates=None):
+    cached = cached_tradestats_dates(cache_dir)
+    if dates is not None:
+        wanted = {pd.Timestamp(date).date() for date in dates}
+        cached = [date for date in cached if date in wanted]
+
+    frames = []
+    for date in cached:
+        with np.load(os.path.join(cache_dir, f"{date}.npz")) as arrays:
+            columns = {}
+            for column in arrays['__columns__']:
+                if column + '.categories' in arrays:
+                    columns[column] = pd.Categorical.from_codes(arrays[column], arrays[column + '.categories'])
+                else:
+                    columns[column] = arrays[column]
+            frames.append(pd.DataFrame(columns))
 
+    if not frames:
+        return pd.DataFrame()
+    return _concat_tradestats(frames)
 
-def fetch_new_tradestats(api_dates):
-    new_tradestats = pd.DataFrame()
-    for date in api_dates:
-        print(f"Fetching data for {date}")
-        for cursor in range(25):
-            url = f'https://iss.moex.com/iss/datashop/algopack/eq/tradestats.csv?date={date}&start={cursor * 1000}&iss.only=data'
-            df = pd.read_csv(url, sep=';', skiprows=2)
-            new_tradestats = pd.concat([new_tradestats, df])
-            if df.shape[0] < 1000:
-                break
-            time.sleep(0.3)
 
-    return new_tradestats
+def _concat_tradestats(frames):
+    # Plain pd.concat turns categoricals with different categories into object columns
+    df = pd.concat(frames, ignore_index=True)
+    for column in frames[0].columns:
+        parts = [frame[column] for frame in frames if column in frame.columns]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            df[column] = pd.api.types.union_categoricals(parts)
+    return df
+
+
+def load_and_transform_data_from_cache(cache_dir, interval='1D', dates=None):
+    logging.info("Starting data loading and transformation process from cache.")
+    start_time = time.time()
+
+    concatenated_df = read_tradestats_cache(cache_dir, dates)
+    data = get_xarray_from_df(concatenated_df, interval=interval)
+
+    elapsed_time = time.time() - start_time
+    logging.info(f"Data loading and transformation process from cache completed in {elapsed_time:.2f} seconds.")
+
+    return data, concatenated_df
 
 
-def load_and_transform_data_from_csv(csv_path, interval='1D'):
+def load_and_transform_data_from_csv(csv_path, interval='1D', cache_dir=None):
     logging.info("Starting data loading and transformation process from CSV.")
     start_time = time.time()
 
     concatenated_df = pd.read_csv(csv_path, delimiter=';', parse_dates={'datetime': ['tradedate', 'tradetime']})
     data = get_xarray_from_df(concatenated_df, interval=interval)
 
+    if cache_dir is not None:
+        # Later rebuilds can use load_and_transform_data_from_cache and skip the CSV parser
+        write_tradestats_cache(concatenated_df, cache_dir)
+
     end_time = time.time()
     elapsed_time = end_time - start_time
     logging.info(f"Data loading and transformation process from CSV completed in {elapsed_time:.2f} seconds.")
@@ -42,17 +307,98 @@ def load_and_transform_data_from_csv(csv_path, interval='1D'):
 
 
 def get_xarray_from_df(df, interval='1D'):
-    dataframes = {}
-    unique_symbols = df['secid'].unique()
-    for symbol in unique_symbols:
-        symbol_df = df[df['secid'] == symbol]
-        market_candles = create_market_candles(symbol_df, interval=interval)
-        dataframes[symbol] = market_candles
-
-    dataset = dataframes_to_xarray(dataframes)
+    candles = create_multi_asset_candles(df, interval=interval)
+    dataset = candles_to_xarray(candles, assets=pd.unique(df['secid'].to_numpy()))
     return dataset
 
 
+def create_multi_asset_candles(dataframe, interval='1D', dropna=True):
+    # Single grouped pass over all tickers; same aggregation as create_market_candles.
+    # pd.Grouper bins exactly like resample for intervals that divide a day (and for W/M).
+    candles = dataframe.groupby(['secid', pd.Grouper(key='datetime', freq=interval)], sort=False, observed=True).agg(
+        open=('pr_open', 'first'),
+        high=('pr_high', 'max'),
+        low=('pr_low', 'min'),
+        close=('pr_close', 'last'),
+        vol=('val', 'sum'),
+        vol_lot=('vol', 'sum'),
+    )
+
+    return candles.dropna() if dropna else candles
+
+
+def resample_multi_asset_candles(candles, interval, dropna=True):
+    # Coarser candles from finer ones, candles are indexed by (secid, datetime)
+    grouped = candles.groupby([pd.Grouper(level=0), pd.Grouper(level=1, freq=interval)], sort=False, observed=True)
+    resampled = grouped.agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'vol': 'sum',
+                             'vol_lot': 'sum'})
+
+    return resampled.dropna() if dropna else resampled
+
+
+def create_candle_pyramid(df, intervals=('5min', '1h', '1D', '1W')):
+    # Only the finest interval touches the raw rows, each coarser one is built from the coarsest finer level
+    # that nests into it, e.g. months from days and never from weeks whose buckets cross month boundaries.
+    # Incomplete buckets are kept until the end, so every level matches get_xarray_from_df(df, interval).
+    intervals = sorted(intervals, key=_interval_length)
+    sources = {}
+    for i, interval in enumerate(intervals[1:], start=1):
+        nesting = [finer for finer in intervals[:i] if _nests(finer, interval)]
+        if not nesting:
+            raise ValueError(f"Interval {interval} does not nest into any of {intervals[:i]}")
+        sources[interval] = nesting[-1]
+
+    assets = pd.unique(df['secid'].to_numpy())
+    pyramid = {}
+    levels = {}
+    for interval in intervals:
+        if interval not in sources:
+            levels[interval] = create_multi_asset_candles(df, interval=interval, dropna=False)
+        else:
+            levels[interval] = resample_multi_asset_candles(levels[sources[interval]], interval, dropna=False)
+        pyramid[interval] = candles_to_xarray(levels[interval].dropna(), assets=assets)
+
+    return pyramid
+
+
+def _nests(finer, coarser):
+    # True when every coarser bucket is a union of whole finer buckets. Calendar periods (W, ME, ...) start
+    # at midnight, so they nest fixed intervals dividing a day but not each other: weeks cross months.
+    if not isinstance(pd.tseries.frequencies.to_offset(finer), pd.offsets.Tick):
+        return False
+    if isinstance(pd.tseries.frequencies.to_offset(coarser), pd.offsets.Tick):
+        return not _interval_length(coarser) % _interval_length(finer)
+    return not pd.Timedelta('1D') % _interval_length(finer)
+
+
+def _interval_length(interval):
+    start = pd.Timestamp('2000-01-01')
+    return (start + pd.tseries.frequencies.to_offset(interval)) - start
+
+
+def candles_to_xarray(candles, assets=None):
+    # candles: frame indexed by (secid, datetime) with CANDLE_FIELDS columns
+    secids = candles.index.get_level_values(0)
+    dates = candles.index.get_level_values(1)
+
+    if assets is None:
+        assets = pd.unique(np.asarray(secids))
+    assets = pd.Index(assets, name='asset')
+    times = pd.DatetimeIndex(dates.unique()).sort_values()
+
+    asset_codes = assets.get_indexer(secids)
+    time_codes = times.get_indexer(dates)
+
+    values = np.full((len(assets), len(CANDLE_FIELDS), len(times)), np.nan)
+    values[asset_codes, :, time_codes] = candles[CANDLE_FIELDS].to_numpy(dtype=np.float64)
+
+    return xr.DataArray(
+        values,
+        dims=['asset', 'field', 'time'],
+        coords={'asset': assets.values, 'field': CANDLE_FIELDS, 'time': times.values},
+    )
+
+
 def create_market_candles(dataframe, interval='1D'):
     df = dataframe.copy()
     df.set_index('datetime', inplace=True)
@@ -83,6 +429,11 @@ def dataframes_to_xarray(dataframes_dict):
 
 
 def update_market_candles(nc_file_path, output_file_path='updated_market_candles.nc'):
+    # Both a single file and a market store return only the fetched days, from the last stored day
+    # on, or None when there is nothing new. The file is rewritten whole to `output_file_path`.
+    if os.path.isdir(nc_file_path):
+        return update_market_store(nc_file_path)
+
     dataarray = xr.open_dataarray(nc_file_path).load()
 
     last_date = pd.to_datetime(dataarray.time.values[-1]).date()
@@ -106,8 +457,95 @@ def update_market_candles(nc_file_path, output_file_path='updated_market_candles
 
         updated_dataarray.to_netcdf(output_file_path)
         print("Dataset updated successfully.")
-        return updated_dataarray
-    return dataarray
+        return new_data
+    return None
+
+
+def write_market_store(dataarray, store_path, partition='D'):
+    # Time-partitioned store: one NetCDF file per period, only touched partitions are rewritten
+    os.makedirs(store_path, exist_ok=True)
+    meta_path = os.path.join(store_path, STORE_META_FILE)
+    if os.path.exists(meta_path):
+        partition = read_market_store_meta(store_path)['partition']
+    else:
+        with open(meta_path, 'w') as f:
+            json.dump({'partition': partition}, f)
+
+    periods = pd.DatetimeIndex(dataarray.time.values).to_period(partition)
+    for period in periods.unique():
+        part = dataarray.isel(time=np.flatnonzero(periods == period))
+        part_path = _market_store_partition_path(store_path, period)
+
+        if os.path.exists(part_path):
+            with xr.open_dataarray(part_path, engine='scipy') as existing:
+                existing = existing.load()
+            existing = existing.sel(time=~existing.time.isin(part.time.values))
+            if existing.sizes['time'] > 0:
+                part = xr.concat([existing, part], dim='time', join='outer', fill_value=np.nan).sortby('time')
+
+        # Write next to the partition and swap it in, so readers never see a half-written file
+        tmp_path = part_path + '.tmp'
+        part.to_netcdf(tmp_path, engine='scipy')
+        os.replace(tmp_path, part_path)
+
+    return list(periods.unique())
+
+
+def read_market_store_meta(store_path):
+    with open(os.path.join(store_path, STORE_META_FILE)) as f:
+        return json.load(f)
+
+
+def market_store_partitions(store_path):
+    partition = read_market_store_meta(store_path)['partition']
+    periods = [pd.Period(name[:-len('.nc')], freq=partition)
+               for name in os.listdir(store_path) if name.endswith('.nc')]
+    return sorted(periods)
+
+
+def open_market_store(store_path, start=None, end=None):
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+
+    # Only partitions overlapping [start, end] are opened
+    parts = []
+    for period in market_store_partitions(store_path):
+        if start is not None and period.end_time < start:
+            continue
+        if end is not None and period.start_time > end:
+            continue
+        with xr.open_dataarray(_market_store_partition_path(store_path, period), engine='scipy') as part:
+            parts.append(part.sel(time=slice(start, end)).load())
+
+    if not parts:
+        raise ValueError(f"No market data in {store_path} between {start} and {end}")
+
+    return xr.concat(parts, dim='time', join='outer', fill_value=np.nan)
+
+
+def update_market_store(store_path, interval='1D'):
+    # Returns only the appended days or None, the rest of the history is never loaded
+    last_period = market_store_partitions(store_path)[-1]
+    last_time = open_market_store(store_path, start=last_period.start_time).time.values[-1]
+    last_date = pd.to_datetime(last_time).date()
+
+    current_date = datetime.now().date()
+    api_dates = [last_date + timedelta(days=x) for x in range((current_date - last_date).days + 1)]
+
+    new_tradestats = fetch_new_tradestats(api_dates)
+
+    if new_tradestats.empty:
+        return None
+
+    new_tradestats['datetime'] = pd.to_datetime(new_tradestats['tradedate'] + ' ' + new_tradestats['tradetime'])
+    new_data = get_xarray_from_df(new_tradestats, interval=interval)
+    write_market_store(new_data, store_path)
+    print("Market store updated successfully.")
+    return new_data
+
+
+def _market_store_partition_path(store_path, period):
+    return os.path.join(store_path, f"{period}.nc")
 
 
 def add_rolling_vol(dataarray, window=30, new_field_name='vol_rolling'):
@@ -140,28 +578,17 @@ def add_is_liquid_field(data, vol_rolling_name, new_field_name='is_liquid', top_
     if vol_rolling_name not in data.field.values:
         raise KeyError(vol_rolling_name + " field not found in the DataArray")
 
-    is_liquid_values = xr.DataArray(
-        np.zeros((data.sizes['time'], data.sizes['asset'])),
-        dims=['time', 'asset'],
-        coords={'time': data.coords['time'], 'asset': data.coords['asset']}
-    )
-
-    for time in data.coords['time'].values:
-        # Select and prepare data for the given time
-        daily_vol_rolling = data.sel(field=vol_rolling_name, time=time).fillna(0)
-
-        # Skip if the total volume is 0
-        if daily_vol_rolling.sum() == 0:
-            continue
+    # Select and prepare data for all dates at once
+    vol_rolling = data.sel(field=vol_rolling_name, drop=True).fillna(0).transpose('time', 'asset')
 
-        # Rank the assets based on volume, lower rank means higher volume
-        ranks = (-daily_vol_rolling).rank('asset')
+    # Rank the assets based on volume along the asset axis, lower rank means higher volume
+    ranks = (-vol_rolling).rank('asset')
 
-        # Select top assets by rank
-        top_assets_indices = ranks.where(ranks <= top_assets).dropna('asset').asset.values
+    # Dates with zero total volume have no liquid assets
+    has_volume = vol_rolling.sum('asset') != 0
 
-        # Mark the top assets as liquid
-        is_liquid_values.loc[dict(time=time, asset=top_assets_indices)] = 1
+    # Mark the top assets as liquid
+    is_liquid_values = ((ranks <= top_assets) & has_volume).astype(np.float64)
 
     is_liquid_expanded = is_liquid_values.expand_dims({'field': [new_field_name]})
     is_liquid_expanded = is_liquid_expanded.transpose('asset', 'field', 'time')
@@ -171,8 +598,139 @@ def add_is_liquid_field(data, vol_rolling_name, new_field_name='is_liquid', top_
     return data_with_is_liquid
 
 
-def load_data_and_create_data_array(filename, dims, transpose_order):
-    ds = xr.open_dataset(filename, engine='scipy').load()
+def ema(series, period):
+    # alpha = 2 / (period + 1) seeded with the first value, NaNs are skipped and the first
+    # period - 1 valid values are warm-up
+    alpha = 2 / (period + 1)
+    dims = ['time'] + [dim for dim in series.dims if dim != 'time']
+    values = series.transpose(*dims).values
+
+    result = np.full(values.shape, np.nan)
+    state = np.full(values.shape[1:], np.nan)
+    count = np.zeros(values.shape[1:], dtype=np.int64)
+    for t in range(len(values)):
+        x = values[t]
+        valid = ~np.isnan(x)
+        state = np.where(valid, np.where(count == 0, x, alpha * x + (1 - alpha) * state), state)
+        count += valid
+        result[t] = np.where(valid & (count >= period), state, np.nan)
+
+    return xr.DataArray(result, dims=dims, coords=series.transpose(*dims).coords).transpose(*series.dims)
+
+
+def trix(series, period):
+    # One bar rate of change of the triple EMA, in percent
+    triple = ema(ema(ema(series, period), period), period)
+    return (triple / triple.shift(time=1) - 1) * 100
+
+
+def rolling_mean(series, window):
+    return series.fillna(0).rolling({"time": window}).mean()
+
+
+INDICATORS = {
+    'ema': ema,
+    'trix': trix,
+    'rolling_mean': rolling_mean,
+}
+
+
+class IndicatorCache:
+    # Memoizes indicator results by (content hash of the cube, field, indicator, params).
+    # Results live in an LRU bounded by max_bytes and, with cache_dir, in NetCDF files shared
+    # between sessions and sweep workers. Cached cubes and results must be treated as read-only.
+    def __init__(self, max_bytes=256 * 2 ** 20, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._tokens = {}
+
+    def compute(self, data, indicator, *params, field=None, name=None, **kwargs):
+        func = INDICATORS[indicator] if isinstance(indicator, str) else indicator
+        if name is None:
+            name = indicator if isinstance(indicator, str) else self.indicator_name(func)
+        key_source = repr((self.data_token(data), field, name, params, sorted(kwargs.items())))
+        key = hashlib.blake2b(key_source.encode(), digest_size=16).hexdigest()
+
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        disk_path = os.path.join(self.cache_dir, f"{key}.nc") if self.cache_dir else None
+        if disk_path and os.path.exists(disk_path):
+            with xr.open_dataarray(disk_path, engine='scipy') as cached:
+                result = cached.load()
+            self.disk_hits += 1
+        else:
+            result = func(data.sel(field=field) if field is not None else data, *params, **kwargs)
+            self.misses += 1
+            if disk_path and isinstance(result, xr.DataArray):
+                os.makedirs(self.cache_dir, exist_ok=True)
+                result.to_netcdf(disk_path + f".{os.getpid()}.tmp", engine='scipy')
+                os.replace(disk_path + f".{os.getpid()}.tmp", disk_path)
+
+        self._remember(key, result)
+        return result
+
+    @staticmethod
+    def indicator_name(func):
+        # Lambdas and closures share a qualname while computing different things, they need an explicit name
+        qualname = getattr(func, '__qualname__', None)
+        if qualname is None or '<lambda>' in qualname or '<locals>' in qualname:
+            raise ValueError(f"Cannot derive a cache key for {func!r}, pass name= to IndicatorCache.compute")
+        return f"{func.__module__}.{qualname}"
+
+    def data_token(self, data):
+        # Hashing a cube costs a full pass over it, so the token is kept while the object lives
+        cached = self._tokens.get(id(data))
+        if cached is not None and cached[0]() is data:
+            return cached[1]
+
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr((data.dims, data.shape, str(data.dtype))).encode())
+        for dim in data.dims:
+            coord = data[dim].values
+            if coord.dtype == object:
+                digest.update('\x00'.join(map(str, coord)).encode())
+            else:
+                digest.update(np.ascontiguousarray(coord).tobytes())
+        digest.update(np.ascontiguousarray(data.values).tobytes())
+        token = digest.hexdigest()
+
+        data_id = id(data)
+        self._tokens[data_id] = (weakref.ref(data, lambda _: self._tokens.pop(data_id, None)), token)
+        return token
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def _remember(self, key, result):
+        nbytes = getattr(result, 'nbytes', 0)
+        if nbytes > self.max_bytes:
+            return
+
+        self.entries[key] = result
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.nbytes -= getattr(evicted, 'nbytes', 0)
+
+
+indicator_cache = IndicatorCache()
+
+
+def load_data_and_create_data_array(filename, dims, transpose_order, start=None, end=None):
+    if os.path.isdir(filename):
+        ds = open_market_store(filename, start=start, end=end).to_dataset(name='market_data')
+    else:
+        with xr.open_dataset(filename, engine='scipy') as nc_ds:
+            ds = nc_ds.sel(time=slice(start, end)).load()
     dataset_name = list(ds.data_vars)[0]
     values = ds[dataset_name].transpose(*transpose_order).values
     coords = {dim: ds[dim].values for dim in dims}
@@ -180,15 +738,7 @@ def load_data_and_create_data_array(filename, dims, transpose_order):
 
 
 def calculate_mean_statistics(backtest_results):
-    stats_to_average = [
-        'Exposure Time [%]', 'Equity Final [$]', 'Equity Peak [$]', 'Return [%]',
-        'Buy & Hold Return [%]', 'Return (Ann.) [%]', 'Volatility (Ann.) [%]',
-        'Sharpe Ratio', 'Sortino Ratio', 'Calmar Ratio', 'Max. Drawdown [%]',
-        'Avg. Drawdown [%]', 'Max. Drawdown Duration', 'Avg. Drawdown Duration',
-        '# Trades', 'Win Rate [%]', 'Best Trade [%]', 'Worst Trade [%]',
-        'Avg. Trade [%]', 'Max. Trade Duration', 'Avg. Trade Duration',
-        'Profit Factor', 'Expectancy [%]', 'SQN'
-    ]
+    stats_to_average = BACKTEST_STATS
 
     total_stats = {stat: 0 for stat in stats_to_average}
     count_stats = {stat: 0 for stat in stats_to_average}  # To count non-NaN entries
@@ -269,7 +819,6 @@ def run_backtest(data, weights, per_asset=False):
             stats[asset] = run_asset_backtest(asset_df, asset_weights)
         except Exception as e:
             print(f"Error for asset {asset}: {e}")
-            stats[asset] = run_asset_backtest(asset_df, asset_weights)
 
     return stats
 
@@ -287,18 +836,260 @@ def run_asset_backtest(asset_df, weights_pd):
     }
 
 
-def calculate_asset_lot_counts(capital, prices, lots, weights):
-    # Ensure that the weights are aligned with the prices and lots
-    aligned_weights = weights.sel(asset=prices.asset)
+def run_vectorized_backtest(data, weights, per_asset=False, cash=1000000, commission=.002):
+    # Same trading rules as run_backtest/CustomStrategy, simulated for all assets at once:
+    # every asset has its own cash, the weight > 0 signal of a bar is executed at the next bar's open
+    # with all available cash, and bars with missing OHLCV are skipped per asset.
+    if per_asset:
+        weights_ = weights
+    else:
+        weights_ = normalize_weights(weights)
+
+    times = pd.DatetimeIndex(data.time.values)
+    assets = data.asset.values
+    prices = data.sel(field=['open', 'high', 'low', 'close', 'vol']).transpose('field', 'time', 'asset').values
+    open_, close = prices[0], prices[3]
+    signal = weights_.sel(time=data.time, asset=data.asset).transpose('time', 'asset').values
+    traded = np.nansum(signal, axis=0) != 0
+    valid = ~np.isnan(prices).any(axis=0) & traded
+    signal = signal > 0
+    bar_index = np.cumsum(valid, axis=0) - 1
+
+    n_assets = len(assets)
+    asset_cash = np.full(n_assets, float(cash))
+    size = np.zeros(n_assets)
+    entry_price = np.zeros(n_assets)
+    entry_bar = np.zeros(n_assets, dtype=np.int64)
+    pending = np.zeros(n_assets, dtype=np.int8)  # 1 - buy, -1 - close at the next open
+    equity = np.full((len(times), n_assets), np.nan)
+    trades = []
+
+    # backtesting.py sizes orders with a fraction just below 1 of the equity
+    full_equity = 1 - np.finfo(float).eps
+    for t in range(len(times)):
+        active = valid[t]
+        if not active.any():
+            continue
+        price = open_[t]
+
+        buy = active & (pending == 1)
+        if buy.any():
+            adjusted_price = price[buy] + full_equity * price[buy] * commission / full_equity
+            buy_size = np.floor_divide(asset_cash[buy] * full_equity, adjusted_price)
+            filled = np.flatnonzero(buy)[buy_size > 0]
+            size[filled] = buy_size[buy_size > 0]
+            entry_price[filled] = price[filled]
+            entry_bar[filled] = t
+            asset_cash[filled] -= size[filled] * price[filled] * commission
+
+        sell = np.flatnonzero(active & (pending == -1))
+        if len(sell):
+            exit_commission = size[sell] * price[sell] * commission
+            asset_cash[sell] += size[sell] * (price[sell] - entry_price[sell]) - exit_commission
+            trades.append((sell, size[sell], entry_bar[sell], np.full(len(sell), t), entry_price[sell], price[sell],
+                           exit_commission + size[sell] * entry_price[sell] * commission))
+            size[sell] = 0
+
+        pending[active] = 0
+        equity[t, active] = asset_cash[active] + (close[t, active] * size[active] - size[active] * entry_price[active])
+
+        # CustomStrategy.next() is not called on the first bar of an asset
+        decide = active & (bar_index[t] >= 1)
+        pending[decide & signal[t] & (size == 0)] = 1
+        pending[decide & ~signal[t] & (size > 0)] = -1
+
+    columns = [np.concatenate(column) if trades else np.array([]) for column in zip(*trades)] or [np.array([])] * 7
+    trade_asset, trade_size, trade_entry, trade_exit, trade_entry_price, trade_exit_price, trade_commission = columns
+    trade_entry, trade_exit = trade_entry.astype(np.int64), trade_exit.astype(np.int64)
+    trades = pd.DataFrame({
+        'Size': trade_size,
+        'EntryBar': bar_index[trade_entry, trade_asset.astype(np.int64)],
+        'ExitBar': bar_index[trade_exit, trade_asset.astype(np.int64)],
+        'EntryPrice': trade_entry_price,
+        'ExitPrice': trade_exit_price,
+        'PnL': trade_size * (trade_exit_price - trade_entry_price) - trade_commission,
+        'Commission': trade_commission,
+        'ReturnPct': (trade_exit_price / trade_entry_price - 1) - trade_commission / (trade_size * trade_entry_price),
+        'EntryTime': times[trade_entry],
+        'ExitTime': times[trade_exit],
+    })
+    trades['Duration'] = trades['ExitTime'] - trades['EntryTime']
+    trades_by_asset = dict(list(trades.groupby(trade_asset.astype(np.int64), sort=False)))
+
+    stats = {}
+    for i in np.flatnonzero(valid.any(axis=0)):
+        asset_bars = valid[:, i]
+        asset_trades = trades_by_asset.get(i, trades.iloc[:0]).reset_index(drop=True)
+        output = compute_backtest_stats(equity[asset_bars, i], close[asset_bars, i], times[asset_bars], asset_trades)
+        stats[assets[i]] = {
+            'output': output,
+            'trades': output['_trades'],
+            'strategy': None
+        }
 
-    # Calculate capital allocation for each asset
-    capital_allocation = capital * aligned_weights
+    return stats
 
-    # Calculate the number of lots to trade for each asset
-    # Divide the allocated capital by the product of price and lot size
-    lots_counts = np.floor(capital_allocation / (prices * lots))
 
-    return lots_counts
+def compute_backtest_stats(equity, close, index, trades):
+    # NumPy port of backtesting.py compute_stats for BACKTEST_STATS, ~100x cheaper per asset
+    stats = {}
+    n_bars = len(index)
+    period = pd.Series(index[-100:]).diff().dropna().median()
+
+    def round_timedelta(value):
+        if not isinstance(value, pd.Timedelta):
+            return value
+        return value.ceil(period.resolution_string)
+
+    dd = 1 - equity / np.maximum.accumulate(equity)
+    iloc = np.unique(np.r_[np.flatnonzero(dd == 0), n_bars - 1])
+    prev, cur = iloc[:-1], iloc[1:]
+    periods = cur > prev + 1
+    if periods.any():
+        dd_durations = pd.TimedeltaIndex(index[cur[periods]] - index[prev[periods]])
+        dd_peaks = np.maximum(np.maximum.reduceat(dd, prev), dd[cur])[periods]
+        max_dd_duration, avg_dd_duration = round_timedelta(dd_durations.max()), round_timedelta(dd_durations.mean())
+    else:
+        dd_peaks = dd[dd != 0]
+        max_dd_duration = dd_peaks.max() if len(dd_peaks) else np.nan
+        avg_dd_duration = dd_peaks.mean() if len(dd_peaks) else np.nan
+
+    have_position = np.zeros(n_bars + 1, dtype=np.int64)
+    np.add.at(have_position, trades['EntryBar'].to_numpy(), 1)
+    np.add.at(have_position, trades['ExitBar'].to_numpy() + 1, -1)
+    stats['Exposure Time [%]'] = (np.cumsum(have_position[:-1]) > 0).mean() * 100
+    stats['Equity Final [$]'] = equity[-1]
+    stats['Equity Peak [$]'] = equity.max()
+    stats['Return [%]'] = (equity[-1] - equity[0]) / equity[0] * 100
+    stats['Buy & Hold Return [%]'] = (close[-1] - close[0]) / close[0] * 100
+
+    freq_days = period.days
+    have_weekends = np.isin(index.dayofweek, [5, 6]).mean() > 2 / 7 * .6
+    annual_trading_days = {7: 52, 31: 12, 365: 1}.get(freq_days, 365 if have_weekends else 252)
+    freq = {7: 'W', 31: 'ME', 365: 'YE'}.get(freq_days, 'D')
+    if freq == 'D':
+        days = index.values.astype('datetime64[D]')
+        day_equity = equity[np.r_[days[1:] != days[:-1], True]]
+    else:
+        day_equity = pd.Series(equity, index=index).resample(freq).last().dropna().to_numpy()
+    day_returns = day_equity[1:] / day_equity[:-1] - 1
+    gmean_day_return = _geometric_mean(day_returns)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        day_returns_var = day_returns.var(ddof=1) if len(day_returns) > 1 else np.nan
+        annualized_return = (1 + gmean_day_return) ** annual_trading_days - 1
+        stats['Return (Ann.) [%]'] = annualized_return * 100
+        stats['Volatility (Ann.) [%]'] = np.sqrt(
+            (day_returns_var + (1 + gmean_day_return) ** 2) ** annual_trading_days
+            - (1 + gmean_day_return) ** (2 * annual_trading_days)) * 100
+        stats['Sharpe Ratio'] = stats['Return (Ann.) [%]'] / (stats['Volatility (Ann.) [%]'] or np.nan)
+        downside = np.sqrt(np.mean(day_returns.clip(-np.inf, 0) ** 2)) if len(day_returns) else np.nan
+        stats['Sortino Ratio'] = annualized_return / (downside * np.sqrt(annual_trading_days))
+    max_dd = -np.nan_to_num(dd.max())
+    stats['Calmar Ratio'] = annualized_return / (-max_dd or np.nan)
+    stats['Max. Drawdown [%]'] = max_dd * 100
+    stats['Avg. Drawdown [%]'] = -dd_peaks.mean() * 100 if len(dd_peaks) else np.nan
+    stats['Max. Drawdown Duration'] = max_dd_duration
+    stats['Avg. Drawdown Duration'] = avg_dd_duration
+
+    pl = trades['PnL']
+    returns = trades['ReturnPct']
+    durations = trades['Duration']
+    stats['# Trades'] = n_trades = len(trades)
+    stats['Win Rate [%]'] = (np.nan if not n_trades else (pl > 0).mean()) * 100
+    stats['Best Trade [%]'] = returns.max() * 100
+    stats['Worst Trade [%]'] = returns.min() * 100
+    stats['Avg. Trade [%]'] = _geometric_mean(returns.to_numpy()) * 100
+    stats['Max. Trade Duration'] = round_timedelta(durations.max())
+    stats['Avg. Trade Duration'] = round_timedelta(durations.mean())
+    stats['Profit Factor'] = returns[returns > 0].sum() / (abs(returns[returns < 0].sum()) or np.nan)
+    stats['Expectancy [%]'] = returns.mean() * 100
+    stats['SQN'] = np.sqrt(n_trades) * pl.mean() / (pl.std() or np.nan)
+
+    stats['_trades'] = trades
+    return stats
+
+
+def _geometric_mean(returns):
+    returns = np.nan_to_num(returns, nan=0) + 1
+    if np.any(returns <= 0):
+        return 0
+    return np.exp(np.log(returns).sum() / (len(returns) or np.nan)) - 1
+
+
+def sweep_weight_function(weight_function, data, param_grid=None, param_space=None, n_iter=50, max_workers=None,
+                          rank_by='Sharpe Ratio', seed=0, indicator_cache_dir=None):
+    # Evaluates weight_function(data, params) for every candidate with run_vectorized_backtest and
+    # ranks the calculate_mean_statistics results. The cube is placed once in shared memory and mapped
+    # by every worker, tasks only carry the params. weight_function must be importable (module level).
+    # Weight functions using indicator_cache share indicators between workers through indicator_cache_dir.
+    candidates = sweep_candidates(param_grid=param_grid, param_space=param_space, n_iter=n_iter, seed=seed)
+
+    if max_workers == 1:
+        if indicator_cache_dir is not None:
+            indicator_cache.cache_dir = indicator_cache_dir
+        rows = [_evaluate_sweep_candidate(weight_function, data, params) for params in candidates]
+    else:
+        values = np.ascontiguousarray(data.values)
+        shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        try:
+            np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[...] = values
+            coords = {dim: data.coords[dim].values for dim in data.dims}
+            initargs = (shm.name, values.shape, values.dtype, data.dims, coords, weight_function, indicator_cache_dir)
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_sweep_worker,
+                                     initargs=initargs) as executor:
+                rows = list(executor.map(_evaluate_shared_sweep_candidate, candidates))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    results = pd.DataFrame(rows)
+    return results.sort_values(rank_by, ascending=False, na_position='last', ignore_index=True)
+
+
+def sweep_candidates(param_grid=None, param_space=None, n_iter=50, seed=0):
+    # param_grid: options per position, every combination is evaluated
+    # param_space: options list or inclusive (low, high) int range per position, n_iter random draws
+    if param_grid is not None:
+        return [list(params) for params in itertools.product(*param_grid)]
+    if param_space is None:
+        raise ValueError("Either param_grid or param_space must be given")
+
+    rng = np.random.default_rng(seed)
+    candidates = []
+    for _ in range(n_iter):
+        params = []
+        for space in param_space:
+            if isinstance(space, tuple):
+                params.append(int(rng.integers(space[0], space[1] + 1)))
+            else:
+                params.append(space[rng.integers(len(space))])
+        candidates.append(params)
+    return candidates
+
+
+_sweep_worker = {}
+
+
+def _init_sweep_worker(shm_name, shape, dtype, dims, coords, weight_function, indicator_cache_dir):
+    if indicator_cache_dir is not None:
+        indicator_cache.cache_dir = indicator_cache_dir
+    shm = shared_memory.SharedMemory(name=shm_name)
+    values = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    values.flags.writeable = False
+    _sweep_worker['shm'] = shm  # keep the mapping alive
+    _sweep_worker['data'] = xr.DataArray(values, dims=dims, coords=coords)
+    _sweep_worker['weight_function'] = weight_function
+
+
+def _evaluate_shared_sweep_candidate(params):
+    return _evaluate_sweep_candidate(_sweep_worker['weight_function'], _sweep_worker['data'], params)
+
+
+def _evaluate_sweep_candidate(weight_function, data, params):
+    weights = weight_function(data, params)
+    mean_stats = calculate_mean_statistics(run_vectorized_backtest(data, weights))
+    return {'params': params, **mean_stats}
 
 
 def fetch_secid_lotsize():
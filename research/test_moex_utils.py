@@ -9,9 +9,19 @@ import numpy as np
 import xarray as xr
 import time
 import logging
+import os
+import tempfile
+import threading
+import warnings
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 from io import StringIO
 from backtesting import Backtest, Strategy
+import requests
 import moex_utils
+from bench_moex_utils import (legacy_add_is_liquid_field, legacy_get_xarray_from_df, make_synthetic_market,
+                              make_synthetic_tradestats, rolling_momentum_weights)
 
 
 class TestMarketDataTransformation(unittest.TestCase):
@@ -37,6 +47,184 @@ class TestMarketDataTransformation(unittest.TestCase):
             self.assertIsNotNone(dataset)
             self.assertEqual(len(concatenated_df), 6)
 
+    def test_get_xarray_from_df_matches_per_symbol_path(self):
+        test_df = make_synthetic_tradestats(5000, n_symbols=7, seed=1)
+        for interval in ['5min', '1h', '1D', '1W']:
+            expected = legacy_get_xarray_from_df(test_df, interval=interval)
+            actual = moex_utils.get_xarray_from_df(test_df, interval=interval)
+
+            self.assertEqual(actual.dims, ('asset', 'field', 'time'))
+            xr.testing.assert_equal(actual, expected)
+
+    def test_candle_pyramid_matches_direct_resample(self):
+        test_df = make_synthetic_tradestats(20000, n_symbols=5, seed=5)
+        # Buckets with only NaN opens must not leak into the coarser levels
+        test_df.loc[test_df.index[::3], 'pr_open'] = np.nan
+
+        pyramid = moex_utils.create_candle_pyramid(test_df, intervals=['1D', '5min', '1W', '1h'])
+        self.assertEqual(list(pyramid), ['5min', '1h', '1D', '1W'])
+        for interval, data in pyramid.items():
+            xr.testing.assert_allclose(data, moex_utils.get_xarray_from_df(test_df, interval=interval))
+
+        with self.assertRaises(ValueError):
+            moex_utils.create_candle_pyramid(test_df, intervals=['10min', '15min'])
+
+    def test_candle_pyramid_builds_months_from_days_not_weeks(self):
+        test_df = make_synthetic_tradestats(20000, n_symbols=3, seed=6)
+
+        pyramid = moex_utils.create_candle_pyramid(test_df, intervals=['1D', '1W', 'ME'])
+        xr.testing.assert_allclose(pyramid['ME'], moex_utils.get_xarray_from_df(test_df, interval='ME'))
+        xr.testing.assert_allclose(pyramid['1W'], moex_utils.get_xarray_from_df(test_df, interval='1W'))
+
+        # Weeks cross the end of January, months cant be built from them
+        with self.assertRaises(ValueError):
+            moex_utils.create_candle_pyramid(test_df, intervals=['1W', 'ME'])
+
+    def test_market_store_appends_only_new_partitions(self):
+        test_df = make_synthetic_tradestats(5000, n_symbols=7, seed=2)
+        data = moex_utils.get_xarray_from_df(test_df, interval='1D')
+        history, last_day = data.isel(time=slice(None, -1)), data.isel(time=slice(-1, None))
+
+        with tempfile.TemporaryDirectory() as store_path:
+            moex_utils.write_market_store(history, store_path)
+            partitions = moex_utils.market_store_partitions(store_path)
+            self.assertEqual(len(partitions), history.sizes['time'])
+            mtimes = {name: os.stat(os.path.join(store_path, name)).st_mtime_ns for name in os.listdir(store_path)}
+
+            moex_utils.write_market_store(last_day, store_path)
+            for name, mtime in mtimes.items():
+                self.assertEqual(os.stat(os.path.join(store_path, name)).st_mtime_ns, mtime)
+
+            xr.testing.assert_equal(moex_utils.open_market_store(store_path), data)
+
+            start, end = data.time.values[3], data.time.values[5]
+            xr.testing.assert_equal(moex_utils.open_market_store(store_path, start=start, end=end),
+                                    data.sel(time=slice(start, end)))
+
+            dims = ['field', 'time', 'asset']
+            sliced = moex_utils.load_data_and_create_data_array(store_path, dims, dims, start=start, end=end)
+            xr.testing.assert_equal(sliced, data.sel(time=slice(start, end)).transpose(*dims))
+
+    def test_market_store_merges_into_monthly_partition(self):
+        test_df = make_synthetic_tradestats(5000, n_symbols=7, seed=3)
+        data = moex_utils.get_xarray_from_df(test_df, interval='1D')
+        new_asset_day = data.isel(time=slice(-1, None)).assign_coords(asset=[f"NEW{i}" for i in range(7)])
+        expected = xr.concat([data.isel(time=slice(None, -1)), new_asset_day], dim='time', join='outer',
+                             fill_value=np.nan)
+
+        with tempfile.TemporaryDirectory() as store_path:
+            moex_utils.write_market_store(data.isel(time=slice(None, -1)), store_path, partition='M')
+            moex_utils.write_market_store(new_asset_day, store_path)
+            self.assertEqual(moex_utils.read_market_store_meta(store_path)['partition'], 'M')
+            xr.testing.assert_equal(moex_utils.open_market_store(store_path), expected)
+
+    def test_update_market_candles_returns_new_days_for_file_and_store(self):
+        test_df = make_synthetic_tradestats(5000, n_symbols=7, seed=4)
+        data = moex_utils.get_xarray_from_df(test_df, interval='1D')
+        history = data.isel(time=slice(None, -1))
+        # The last stored day is fetched again along with the new one
+        fetched_df = test_df[test_df['datetime'] >= pd.Timestamp(history.time.values[-1])]
+        tradestats = pd.DataFrame({'tradedate': fetched_df['datetime'].dt.strftime('%Y-%m-%d'),
+                                   'tradetime': fetched_df['datetime'].dt.strftime('%H:%M:%S'),
+                                   **fetched_df.drop(columns='datetime')})
+        new_days = data.isel(time=slice(-2, None))
+
+        with tempfile.TemporaryDirectory() as tmp_path:
+            file_path, store_path = os.path.join(tmp_path, 'candles.nc'), os.path.join(tmp_path, 'store')
+            history.to_netcdf(file_path)
+            moex_utils.write_market_store(history, store_path)
+
+            fetch = lambda api_dates: tradestats.copy()
+            with mock.patch.object(moex_utils, 'fetch_new_tradestats', fetch):
+                from_file = moex_utils.update_market_candles(file_path, output_file_path=file_path)
+                from_store = moex_utils.update_market_candles(store_path)
+            for updated in [from_file, from_store]:
+                xr.testing.assert_equal(updated.sel(asset=new_days.asset), new_days)
+            xr.testing.assert_equal(xr.load_dataarray(file_path).sel(asset=data.asset), data)
+            xr.testing.assert_equal(moex_utils.open_market_store(store_path).sel(asset=data.asset), data)
+
+            empty = lambda api_dates: pd.DataFrame()
+            with mock.patch.object(moex_utils, 'fetch_new_tradestats', empty):
+                self.assertIsNone(moex_utils.update_market_candles(file_path, output_file_path=file_path))
+                self.assertIsNone(moex_utils.update_market_candles(store_path))
+
+    def test_download_tradestats_resumes_from_checkpoint(self):
+        pages = {'2020-01-03': 2500, '2020-01-04': 1000, '2020-01-05': 10}
+        with FakeTradestatsServer(pages, failing_dates={'2020-01-04'}) as server:
+            with tempfile.TemporaryDirectory() as checkpoint_dir:
+                with self.assertRaises(requests.HTTPError):
+                    moex_utils.download_tradestats(list(pages), base_url=server.url, rate=100, max_retries=1,
+                                                   backoff=0, checkpoint_dir=checkpoint_dir)
+
+                served_before = set(server.served)
+                server.failing_dates.clear()
+                server.requests.clear()
+                result = moex_utils.download_tradestats(list(pages), base_url=server.url, rate=100, backoff=0,
+                                                        checkpoint_dir=checkpoint_dir)
+
+                self.assertTrue(served_before)
+                self.assertFalse(served_before & set(server.requests))
+                self.assertIn(('2020-01-04', 1000), server.requests)
+                self.assertEqual(len(result), sum(pages.values()))
+                self.assertEqual(list(result['secid']), [f"{date}-{i}" for date, rows in pages.items()
+                                                         for i in range(rows)])
+
+    def test_download_tradestats_does_not_checkpoint_today(self):
+        today = str(datetime.now().date())
+        pages = {'2020-01-03': 1500, today: 10}
+        with FakeTradestatsServer(pages) as server:
+            with tempfile.TemporaryDirectory() as checkpoint_dir:
+                moex_utils.download_tradestats(list(pages), base_url=server.url, rate=100, backoff=0,
+                                               checkpoint_dir=checkpoint_dir)
+                server.requests.clear()
+                result = moex_utils.download_tradestats(list(pages), base_url=server.url, rate=100, backoff=0,
+                                                        checkpoint_dir=checkpoint_dir)
+
+                self.assertEqual(server.requests, [(today, 0)])
+                self.assertEqual(len(result), sum(pages.values()))
+
+    def test_token_bucket_limits_rate(self):
+        bucket = moex_utils.TokenBucket(rate=50, capacity=1)
+        start_time = time.monotonic()
+        for _ in range(11):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.19)
+
+    def test_tradestats_cache_round_trip(self):
+        raw_df = make_synthetic_tradestats(3000, n_symbols=5, seed=4)
+        raw_df.insert(0, 'tradedate', raw_df['datetime'].dt.strftime('%Y-%m-%d'))
+        raw_df.insert(1, 'tradetime', raw_df['datetime'].dt.strftime('%H:%M:%S'))
+        raw_df = raw_df.drop(columns=['datetime'])
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            written = moex_utils.write_tradestats_cache(raw_df, cache_dir)
+            self.assertEqual(moex_utils.cached_tradestats_dates(cache_dir), written)
+
+            cached_df = moex_utils.read_tradestats_cache(cache_dir)
+            self.assertEqual(len(cached_df), len(raw_df))
+            self.assertIsInstance(cached_df['secid'].dtype, pd.CategoricalDtype)
+            self.assertEqual(cached_df['datetime'].dtype, np.dtype('datetime64[ns]'))
+            self.assertEqual(cached_df['pr_close'].dtype, np.float32)
+
+            expected = moex_utils.get_xarray_from_df(moex_utils.normalize_tradestats(raw_df), interval='1h')
+            data, _ = moex_utils.load_and_transform_data_from_cache(cache_dir, interval='1h')
+            xr.testing.assert_allclose(data.sortby('asset'), expected.sortby('asset'))
+
+            two_days = moex_utils.read_tradestats_cache(cache_dir, written[1:3])
+            self.assertEqual(set(two_days['datetime'].dt.date), set(written[1:3]))
+
+    def test_load_tradestats_downloads_only_missing_dates(self):
+        pages = {'2020-01-03': 1500, '2020-01-04': 20}
+        with FakeTradestatsServer(pages) as server:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                first = moex_utils.load_tradestats(list(pages), cache_dir, base_url=server.url, rate=100)
+                self.assertEqual(len(first), sum(pages.values()))
+
+                server.requests.clear()
+                second = moex_utils.load_tradestats(list(pages), cache_dir, base_url=server.url, rate=100)
+                self.assertEqual(server.requests, [])
+                pd.testing.assert_frame_equal(second, first)
+
     def test_rolling_vol_field(self):
         fields = ['open', 'high', 'low', 'close', 'vol']
         times = pd.date_range('2023-01-01', periods=10, freq='D')
@@ -56,6 +244,125 @@ class TestMarketDataTransformation(unittest.TestCase):
                                                   top_assets=1)
         self.assertIn('is_liquid', new_data.field.values)
 
+    def test_is_liquid_field_matches_per_date_loop(self):
+        times = pd.date_range('2023-01-01', periods=4, freq='D')
+        assets = ['Asset1', 'Asset2', 'Asset3', 'Asset4']
+        vol = np.array([
+            [np.nan, np.nan, np.nan, np.nan],  # zero total volume is skipped
+            [3.0, 2.0, 2.0, 1.0],  # tie on the top_assets boundary
+            [5.0, np.nan, 1.0, 0.0],
+            [1.0, 1.0, 1.0, 1.0],
+        ])
+        mock_data = xr.DataArray(vol.T[:, None, :], coords=[assets, ['vol_rolling'], times],
+                                 dims=["asset", "field", "time"])
+
+        for top_assets in [1, 2, 3, 4]:
+            expected = legacy_add_is_liquid_field(mock_data, 'vol_rolling', top_assets=top_assets)
+            actual = moex_utils.add_is_liquid_field(mock_data, 'vol_rolling', top_assets=top_assets)
+            xr.testing.assert_equal(actual, expected)
+
+        expected_top_2 = [[0, 0, 0, 0], [1, 0, 0, 0], [1, 0, 1, 0], [0, 0, 0, 0]]
+        is_liquid = moex_utils.add_is_liquid_field(mock_data, 'vol_rolling', top_assets=2)
+        np.testing.assert_array_equal(is_liquid.sel(field='is_liquid').transpose('time', 'asset'), expected_top_2)
+
+    def test_vectorized_backtest_matches_backtesting_py(self):
+        for seed, freq in enumerate(['D', 'B', 'h']):
+            data, weights = make_synthetic_market(300, n_assets=6, seed=seed, freq=freq)
+            weights[:, 0] = 0  # skipped like in run_backtest
+            weights[:, 1] = 0
+            weights[10, 1] = 1  # a single trade
+
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                expected = moex_utils.run_backtest(data, weights)
+            actual = moex_utils.run_vectorized_backtest(data, weights)
+
+            self.assertEqual(list(actual), list(expected))
+            for asset in expected:
+                for stat in moex_utils.BACKTEST_STATS:
+                    expected_value, actual_value = expected[asset]['output'][stat], actual[asset]['output'][stat]
+                    if isinstance(expected_value, float):
+                        np.testing.assert_allclose(actual_value, expected_value, rtol=1e-9, err_msg=stat)
+                    else:
+                        self.assertEqual(actual_value, expected_value, stat)
+
+            expected_mean = moex_utils.calculate_mean_statistics(expected)
+            actual_mean = moex_utils.calculate_mean_statistics(actual)
+            for stat in moex_utils.BACKTEST_STATS:
+                np.testing.assert_allclose(actual_mean[stat], expected_mean[stat], rtol=1e-9, err_msg=stat)
+
+    def test_sweep_weight_function_in_process_pool(self):
+        data, _ = make_synthetic_market(200, n_assets=5, seed=7)
+        param_grid = [[5, 10], [1], [2, 3], [1], [4]]
+
+        serial = moex_utils.sweep_weight_function(rolling_momentum_weights, data, param_grid=param_grid, max_workers=1)
+        parallel = moex_utils.sweep_weight_function(rolling_momentum_weights, data, param_grid=param_grid,
+                                                    max_workers=2)
+
+        self.assertEqual(len(parallel), 4)
+        self.assertTrue(parallel['Sharpe Ratio'].is_monotonic_decreasing)
+        pd.testing.assert_frame_equal(parallel, serial)
+
+        candidates = moex_utils.sweep_candidates(param_space=[(1, 3), ['a', 'b']], n_iter=20)
+        self.assertEqual(len(candidates), 20)
+        self.assertTrue(all(1 <= first <= 3 and second in ('a', 'b') for first, second in candidates))
+
+    def test_trix_matches_pandas_ewm(self):
+        data, _ = make_synthetic_market(300, n_assets=3, seed=8)
+        opens = data.sel(field='open')
+        dense = opens.isel(asset=0).dropna('time')
+
+        # Each EMA starts from the first warmed-up value of the previous one
+        expected = dense.to_pandas()
+        for _ in range(3):
+            expected = expected.dropna().ewm(span=20, adjust=False).mean()
+            expected.iloc[:20 - 1] = np.nan
+        expected = expected.reindex(dense.time.values)
+        expected = (expected / expected.shift(1) - 1) * 100
+
+        np.testing.assert_allclose(moex_utils.trix(dense, 20).values, expected.values, rtol=1e-10)
+        self.assertEqual(moex_utils.trix(opens, 20).dims, opens.dims)
+
+    def test_indicator_cache_memoizes_by_content(self):
+        data, _ = make_synthetic_market(100, n_assets=4, seed=9)
+        calls = []
+
+        def counted_trix(series, period):
+            calls.append(period)
+            return moex_utils.trix(series, period)
+
+        cache = moex_utils.IndicatorCache()
+        first = cache.compute(data, counted_trix, 5, field='open', name='counted_trix')
+        second = cache.compute(data.copy(deep=True), counted_trix, 5, field='open', name='counted_trix')
+        cache.compute(data, counted_trix, 6, field='open', name='counted_trix')
+        cache.compute(data, counted_trix, 5, field='close', name='counted_trix')
+
+        self.assertIs(second, first)
+        self.assertEqual(calls, [5, 6, 5])
+        xr.testing.assert_equal(first, moex_utils.trix(data.sel(field='open'), 5))
+
+        # Closures and lambdas share qualnames, they are only cached under an explicit name
+        with self.assertRaises(ValueError):
+            cache.compute(data, counted_trix, 5, field='open')
+        with self.assertRaises(ValueError):
+            cache.compute(data, lambda series: series * 2, field='open')
+        doubled = cache.compute(data, lambda series: series * 2, field='open', name='doubled')
+        tripled = cache.compute(data, lambda series: series * 3, field='open', name='tripled')
+        xr.testing.assert_equal(tripled, data.sel(field='open') * 3)
+        self.assertIsNot(tripled, doubled)
+
+        small_cache = moex_utils.IndicatorCache(max_bytes=first.nbytes * 2)
+        for period in [3, 4, 5]:
+            small_cache.compute(data, 'ema', period, field='open')
+        self.assertEqual(len(small_cache.entries), 2)
+        self.assertLessEqual(small_cache.nbytes, small_cache.max_bytes)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            rolling = moex_utils.IndicatorCache(cache_dir=cache_dir).compute(data, moex_utils.add_rolling_vol, window=5)
+            next_session = moex_utils.IndicatorCache(cache_dir=cache_dir)
+            xr.testing.assert_equal(next_session.compute(data, moex_utils.add_rolling_vol, window=5), rolling)
+            self.assertEqual((next_session.disk_hits, next_session.misses), (1, 0))
+
     def test_load_lotsize(self):
         lots_data = moex_utils.fetch_secid_lotsize()
         self.assertEqual(len(lots_data), 248)
@@ -150,6 +457,50 @@ class TestMarketDataTransformation(unittest.TestCase):
         self.assertIsInstance(r, pd.DataFrame)
 
 
+class FakeTradestatsServer:
+    # Local stand-in for the AlgoPack tradestats.csv endpoint, serving on `url` inside a with block
+    def __init__(self, pages, failing_dates=()):
+        self.pages = pages
+        self.failing_dates = set(failing_dates)
+        self.requests = []
+        self.served = []
+        self.url = None
+        self.httpd = None
+
+    def __enter__(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                date, start = query['date'][0], int(query['start'][0])
+                fake.requests.append((date, start))
+                if date in fake.failing_dates:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+
+                rows = range(start, min(start + 1000, fake.pages.get(date, 0)))
+                body = "tradestats\n\nsecid;tradedate;tradetime;pr_close\n" + "".join(
+                    f"{date}-{i};{date};10:00:00;{i}.5\n" for i in rows)
+                fake.served.append((date, start))
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(body.encode())
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
 def get_count_lots(capital=100000):
     import os
 
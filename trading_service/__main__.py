@@ -1,31 +1,109 @@
+import asyncio
 from logging import getLogger
 
 from trading_service.config import Config
 from trading_service.connector.brocker import (
     MockedBrockerConnector,
     OrderKind,
-    OrderMetaData,
+    SimulatedBrockerConnector,
 )
-from trading_service.connector.data import MoexDataConnector
+from trading_service.connector.data import (
+    AsyncMoexDataConnector,
+    PollingDataConnector,
+    ReplayDataConnector,
+)
+from trading_service.indicator import TRIX, CandleIndicators, RollingMean
 from trading_service.logger import init_logger
-from trading_service.strategy import mocked_ctrategy
+from trading_service.pkg import observer
+from trading_service.pkg.latency import recorder
+from trading_service.portfolio import PortfolioRunner
+from trading_service.strategy import mocked_ctrategy, momentum_weights
 
 init_logger()
 
 logger = getLogger("trading_service")
 
+
+async def run_portfolio(config: Config, brocker: MockedBrockerConnector) -> None:
+    connector = AsyncMoexDataConnector(config)
+    runner = PortfolioRunner(
+        momentum_weights,
+        config.weight_params,
+        brocker,
+        await connector.lot_sizes(),
+        config.capital,
+        config.window,
+    )
+
+    async for begin, candles in connector.snapshots():
+        logger.info("Get bar %s of %s instruments", begin, len(candles))
+        for order in runner.on_bar(begin, candles):
+            logger.info("Rebalance order %s", order)
+        logger.info("Positions %s", runner.positions)
+        if recorder.due():
+            logger.info("Latency, ms %s", recorder.summary())
+
+
+def replay_portfolio(config: Config) -> SimulatedBrockerConnector:
+    # Lot size 1 for every instrument, the cube does not keep lot sizes
+    connector = ReplayDataConnector(config, config.instruments)
+    brocker = SimulatedBrockerConnector(connector.clock, balance=config.capital)
+    runner = PortfolioRunner(
+        momentum_weights,
+        config.weight_params,
+        brocker,
+        dict.fromkeys(config.instruments, 1),
+        config.capital,
+        config.window,
+    )
+
+    for begin, candles in connector.snapshots():
+        for order in runner.on_bar(begin, candles):
+            logger.debug("Rebalance order %s", order)
+    logger.info("Latency, ms %s", recorder.summary())
+    logger.info(
+        "Replayed %s candles, balance %s, realized PnL %s",
+        connector.metrics.candles,
+        brocker.balance,
+        brocker.ledger.realized_pnl,
+    )
+    return brocker
+
+
 if __name__ == "__main__":
     config = Config()
+    observer.configure(config.observer_key, config.observer_dir)
+
+    if config.portfolio:
+        if config.replay_path:
+            replay_portfolio(config)
+        else:
+            brocker = MockedBrockerConnector()
+            brocker.balance = config.capital
+            asyncio.run(run_portfolio(config, brocker))
+        raise SystemExit
 
-    connector = MoexDataConnector(config)
-    brocker = MockedBrockerConnector()
-    open_orders: list[OrderMetaData] = []
+    if config.replay_path:
+        connector = ReplayDataConnector(config)
+        brocker = SimulatedBrockerConnector(connector.clock)
+    else:
+        connector = PollingDataConnector(config)
+        brocker = MockedBrockerConnector()
     quantity = 3
+    indicators = CandleIndicators(
+        {
+            "trix": ("open", TRIX(config.trix_period)),
+            "vol_rolling": ("value", RollingMean(config.vol_window)),
+        }
+    )
 
     for data in connector:
         logger.info("Get new data %s", data)
+        logger.info("Connector metrics %s", connector.metrics.summary())
+        logger.info("Indicators %s", indicators.update(data))
 
-        signal = mocked_ctrategy(data)
+        with recorder.span("strategy"):
+            signal = mocked_ctrategy(data)
         logger.info("Strategy signal %s", signal)
 
         if signal:
@@ -37,13 +115,20 @@ if __name__ == "__main__":
                 raise ValueError(
                     f"Balance {brocker.balance}, needed amount {data.close * quantity}"
                 )
-            open_orders.append(order)
+            recorder.since("candle", "candle_to_order")
             logger.info("Open order %s", order)
 
         else:
-            for order in open_orders:
-                if not (
-                    closed_order := brocker.close_order(order.order_id, data.close)
-                ):
-                    logger.error("Cant close order %s", order)
+            for closed_order in brocker.close_all(config.instrument, data.close):
                 logger.info("Close order %s", closed_order)
+
+        position = brocker.ledger.position(config.instrument)
+        logger.info(
+            "Position %s, realized PnL %s, unrealized PnL %s",
+            position.quantity,
+            position.realized_pnl,
+            position.unrealized_pnl(data.close),
+        )
+
+        if recorder.due():
+            logger.info("Latency, ms %s", recorder.summary())
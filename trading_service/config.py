@@ -1,8 +1,43 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
 @dataclass
 class Config:
     # Data connector
     instrument: str = "SBER"
+    # Multi-instrument connector
+    instruments: list[str] = field(default_factory=lambda: ["SBER"])
+    iss_url: str = "https://iss.moex.com/iss/engines/stock/markets/shares/boards/TQBR"
+    max_concurrency: int = 10
+    # Replay of a research candle cube instead of live data
+    replay_path: str | None = None
+    replay_start: str | None = None
+    replay_end: str | None = None
     period: int = 60
+    # Polling after each candle close, seconds
+    poll_interval: float = 2.0
+    poll_jitter: float = 0.5
+    max_poll_delay: float = 60.0
+
+    # Portfolio runner, trades `instruments` instead of `instrument`
+    portfolio: bool = False
+    capital: float = 1_000_000.0
+    window: int = 100
+    weight_params: tuple[int, int, int] = (20, 1, 5)
+
+    # Indicators
+    trix_period: int = 20
+    vol_window: int = 30
+
+    # Observer, events go to the admin service strategy named by strategy_key, by
+    # default one per kind of trader and instruments
+    strategy_key: str | None = None
+    observer_dir: str = ".observer"
+
+    @property
+    def observer_key(self) -> str:
+        if self.strategy_key:
+            return self.strategy_key
+        if self.portfolio:
+            return f"portfolio {','.join(self.instruments)} {self.weight_params}"
+        return f"signal {self.instrument}"
@@ -1,12 +1,13 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from datetime import datetime
 from enum import Enum
 from logging import getLogger
-from typing import Annotated, Protocol
+from typing import Annotated, Callable, Protocol
 from uuid import UUID, uuid4
 
 from annotated_types import Ge
 
+from trading_service.pkg.latency import recorder
 from trading_service.pkg.observer import observeit
 from trading_service.utils import now_dt_mostz
 
@@ -41,6 +42,129 @@ class OrderMetaData:
     open_dt: datetime
     close_dt: datetime | None
 
+    # Order a partly closed part was split off from
+    parent_id: UUID | None = None
+
+
+@dataclass
+class Position:
+    # Quantity and cost are signed, sells are negative
+    instrument: str
+    quantity: float = 0.0
+    cost: float = 0.0
+    realized_pnl: float = 0.0
+
+    @property
+    def avg_price(self) -> float | None:
+        return self.cost / self.quantity if self.quantity else None
+
+    def unrealized_pnl(self, price: float) -> float:
+        return self.quantity * price - self.cost
+
+
+@dataclass
+class PositionLedger:
+    # Open orders indexed by id, instrument and status, and positions aggregated per
+    # instrument. Closed orders only add to realized PnL, so the ledger size follows
+    # the open orders. Statuses of open orders change through set_status, the ledger
+    # keeps the status each order is indexed under.
+    orders: dict[UUID, OrderMetaData] = field(default_factory=dict)
+    positions: dict[str, Position] = field(default_factory=dict)
+    _by_instrument: dict[str, dict[UUID, OrderMetaData]] = field(default_factory=dict)
+    _by_status: dict[OrderStatus, dict[UUID, OrderMetaData]] = field(
+        default_factory=dict
+    )
+    _statuses: dict[UUID, OrderStatus] = field(default_factory=dict)
+
+    def add(self, order: OrderMetaData) -> None:
+        self._index(order)
+
+        ratio = _ratio(order.kind)
+        position = self.position(order.instrument)
+        position.quantity += ratio * order.quantity
+        position.cost += ratio * order.open_price * order.quantity
+
+    def split(self, order: OrderMetaData, quantity: float) -> OrderMetaData:
+        # Moves `quantity` of an open order into a new order with the same open price,
+        # the position stays as it is
+        part = replace(
+            order, order_id=uuid4(), quantity=quantity, parent_id=order.order_id
+        )
+        order.quantity -= quantity
+        self._index(part)
+        return part
+
+    def set_status(self, order: OrderMetaData, status: OrderStatus) -> None:
+        del self._by_status[self._statuses[order.order_id]][order.order_id]
+        order.status = self._statuses[order.order_id] = status
+        self._by_status.setdefault(status, {})[order.order_id] = order
+
+    def remove(self, order: OrderMetaData) -> float:
+        # The order may already have its closing status and price
+        del self.orders[order.order_id]
+        del self._by_instrument[order.instrument][order.order_id]
+        del self._by_status[self._statuses.pop(order.order_id)][order.order_id]
+
+        ratio = _ratio(order.kind)
+        position = self.position(order.instrument)
+        position.quantity -= ratio * order.quantity
+        position.cost -= ratio * order.open_price * order.quantity
+
+        pnl = 0.0
+        if order.close_price is not None:
+            pnl = ratio * (float(order.close_price) - order.open_price) * order.quantity
+            position.realized_pnl += pnl
+        return pnl
+
+    def get(self, order_id: UUID) -> OrderMetaData | None:
+        return self.orders.get(order_id, None)
+
+    def open_orders(
+        self, instrument: str | None = None, status: OrderStatus | None = None
+    ) -> list[OrderMetaData]:
+        if instrument is None and status is None:
+            return list(self.orders.values())
+        if status is None:
+            return list(self._by_instrument.get(instrument, {}).values())
+        by_status = self._by_status.get(status, {})
+        if instrument is None:
+            return list(by_status.values())
+        by_instrument = self._by_instrument.get(instrument, {})
+        smaller, other = sorted((by_status, by_instrument), key=len)
+        return [order for order_id, order in smaller.items() if order_id in other]
+
+    def position(self, instrument: str) -> Position:
+        if (position := self.positions.get(instrument)) is None:
+            position = self.positions[instrument] = Position(instrument)
+        return position
+
+    @property
+    def realized_pnl(self) -> float:
+        return sum(position.realized_pnl for position in self.positions.values())
+
+    def unrealized_pnl(self, prices: dict[str, float]) -> float:
+        held = {
+            instrument: position
+            for instrument, position in self.positions.items()
+            if position.quantity
+        }
+        if missing := held.keys() - prices.keys():
+            raise ValueError(f"No prices for held instruments {sorted(missing)}")
+        return sum(
+            position.unrealized_pnl(prices[instrument])
+            for instrument, position in held.items()
+        )
+
+    def _index(self, order: OrderMetaData) -> None:
+        self.orders[order.order_id] = order
+        self._by_instrument.setdefault(order.instrument, {})[order.order_id] = order
+        self._by_status.setdefault(order.status, {})[order.order_id] = order
+        self._statuses[order.order_id] = order.status
+
+
+def _ratio(kind: OrderKind) -> int:
+    return 1 if kind == OrderKind.BUY else -1
+
 
 class BrockerConnector(Protocol):
     def make_order(
@@ -52,15 +176,30 @@ class BrockerConnector(Protocol):
     ) -> OrderMetaData | None:
         ...
 
-    def close_order(self, order_id: UUID, price: NonNegative) -> OrderMetaData | None:
+    def close_order(
+        self,
+        order_id: UUID,
+        price: NonNegative,
+        quantity: NonNegative | None = None,
+    ) -> OrderMetaData | None:
         ...
 
 
 class MockedBrockerConnector:
+    # Orders go to the admin service through the observer
+    observed = True
+
     def __init__(self):
         self.balance: float = 50_000.0
-        self.orders: dict[UUID, OrderMetaData] = {}
+        # Fraction of the traded amount paid on open and on close
+        self.commission: float = 0.0
+        self.ledger = PositionLedger()
+
+    @property
+    def orders(self) -> dict[UUID, OrderMetaData]:
+        return self.ledger.orders
 
+    @recorder.timed("make_order")
     @observeit("order")
     def make_order(
         self,
@@ -69,9 +208,10 @@ class MockedBrockerConnector:
         quantity: NonNegative,
         kind: OrderKind,
     ) -> OrderMetaData | None:
-        if (amount := price * quantity) > self.balance or self.balance <= 0:
+        amount = price * quantity
+        if (cost := amount * (1 + self.commission)) > self.balance or self.balance <= 0:
             return None
-        self.balance -= amount
+        self.balance -= cost
 
         new_order = OrderMetaData(
             order_id=uuid4(),
@@ -81,28 +221,48 @@ class MockedBrockerConnector:
             open_price=price,
             close_price=None,
             quantity=quantity,
-            open_dt=now_dt_mostz(),
+            open_dt=self._now(),
             close_dt=None,
         )
-        self.orders[new_order.order_id] = new_order
+        self.ledger.add(new_order)
 
         return new_order
 
+    @recorder.timed("close_order")
     @observeit("order")
-    def close_order(self, order_id: UUID, price: NonNegative) -> OrderMetaData | None:
-        if not (order := self.orders.get(order_id, None)):
+    def close_order(
+        self,
+        order_id: UUID,
+        price: NonNegative,
+        quantity: NonNegative | None = None,
+    ) -> OrderMetaData | None:
+        # Closes `quantity` of the order, all of it by default. A part is split off
+        # into an order of its own and closed, the rest stays open.
+        if not (order := self.ledger.get(order_id)):
             return None
+        if quantity is not None and 0 < quantity < order.quantity:
+            order = self.ledger.split(order, quantity)
 
         order.status = OrderStatus.CLOSE
         order.close_price = price
-        order.close_dt = now_dt_mostz()
+        order.close_dt = self._now()
 
         profit = self._calc_profit(order)
-        self.balance += profit
+        self.balance += profit - float(price) * order.quantity * self.commission
 
-        del self.orders[order_id]
+        self.ledger.remove(order)
         return order
 
+    def close_all(self, instrument: str, price: NonNegative) -> list[OrderMetaData]:
+        return [
+            closed_order
+            for order in self.ledger.open_orders(instrument)
+            if (closed_order := self.close_order(order.order_id, price))
+        ]
+
+    def _now(self) -> datetime:
+        return now_dt_mostz()
+
     @staticmethod
     def _calc_profit(order: OrderMetaData) -> float:
         assert order.close_price is not None
@@ -111,3 +271,24 @@ class MockedBrockerConnector:
             ratio * (float(order.close_price) - order.open_price) * order.quantity
             + order.open_price * order.quantity
         )
+
+
+class SimulatedBrockerConnector(MockedBrockerConnector):
+    # Fills at the price passed in, the candle price of the replayed bar, on the
+    # replay clock instead of the wall clock. Replayed orders are not the live
+    # strategy's and are not sent to the admin service.
+    observed = False
+
+    def __init__(
+        self,
+        clock: Callable[[], datetime],
+        balance: float = 1_000_000.0,
+        commission: float = 0.002,
+    ):
+        super().__init__()
+        self.balance = balance
+        self.commission = commission
+        self._clock = clock
+
+    def _now(self) -> datetime:
+        return self._clock()
@@ -1,16 +1,30 @@
-from datetime import MINYEAR, datetime
+import asyncio
+import os
+from collections import deque
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from datetime import MINYEAR, date, datetime, timedelta
 from logging import getLogger
+from random import uniform
+from statistics import fmean
 from time import sleep
-from typing import Any, Generator, Protocol
+from typing import Any, AsyncContextManager, AsyncGenerator, Generator, Protocol
 
+import httpx
+import numpy as np
+import pandas as pd
+import xarray as xr
 from moexalgo import Ticker
 from moexalgo.models import Candle
 
 from trading_service.config import Config
-from trading_service.utils import nowday_mostz
+from trading_service.pkg.latency import recorder
+from trading_service.utils import now_dt_mostz, nowday_mostz
 
 logger = getLogger("data_connector")
 
+ISS_PAGE_SIZE = 500
+
 
 class DataConnector(Protocol):
     def __init__(self, config: Config):
@@ -33,6 +47,7 @@ class MoexDataConnector:
                 date=nowday_mostz(), period=self._period
             ):
                 if self._last_candle_td < candle.end:
+                    recorder.mark("candle")
                     yield candle
                     self._last_candle_td = candle.end
                 else:
@@ -41,3 +56,340 @@ class MoexDataConnector:
                     )
             # May be need to check data more often than the period
             sleep(self._period * 60)
+
+
+@dataclass
+class PollingMetrics:
+    # Latency is the time from candle close to the moment it is yielded, in seconds
+    candles: int = 0
+    polls: int = 0
+    latencies: deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+
+    def record(self, latency: float) -> None:
+        self.candles += 1
+        self.latencies.append(latency)
+
+    def summary(self) -> dict[str, float]:
+        if not self.latencies:
+            return {"candles": self.candles, "polls": self.polls}
+        return {
+            "candles": self.candles,
+            "polls": self.polls,
+            "last_latency": self.latencies[-1],
+            "mean_latency": fmean(self.latencies),
+            "max_latency": max(self.latencies),
+        }
+
+
+class PollingDataConnector(MoexDataConnector):
+    # Wakes up at each candle close and polls with a short jittered interval until the
+    # closed candle shows up. Only candles after the ones already consumed today are
+    # requested (ISS `start` offset), the still forming candle is never yielded.
+    def __init__(self, config: Config):
+        super().__init__(config)
+        self._poll_interval = config.poll_interval
+        self._poll_jitter = config.poll_jitter
+        self._max_poll_delay = timedelta(seconds=config.max_poll_delay)
+        self._period_td = timedelta(minutes=config.period)
+        self._day: date | None = None
+        self._offset = 0
+        self.metrics = PollingMetrics()
+
+    def __iter__(self) -> Generator[Candle, Any, None]:
+        # The first poll catches up on the candles closed earlier today
+        close_dt = now_dt_mostz()
+        while True:
+            self._sleep_until(close_dt)
+
+            while True:
+                new_candles = self._poll()
+                for candle in new_candles:
+                    latency = now_dt_mostz() - (candle.begin + self._period_td)
+                    self.metrics.record(latency.total_seconds())
+                    recorder.mark("candle")
+                    yield candle
+
+                if new_candles or now_dt_mostz() > close_dt + self._max_poll_delay:
+                    break
+                sleep(self._jittered(self._poll_interval))
+
+            close_dt = next_close(now_dt_mostz(), self._period_td)
+
+    def _poll(self) -> list[Candle]:
+        if (day := nowday_mostz()) != self._day:
+            self._day, self._offset = day, 0
+        self.metrics.polls += 1
+
+        now_dt = now_dt_mostz()
+        new_candles = []
+        for candle in self._ticker.candles(
+            date=day, period=self._period, offset=self._offset
+        ):
+            if candle.begin + self._period_td > now_dt:
+                break
+            self._offset += 1
+            if self._last_candle_td < candle.end:
+                new_candles.append(candle)
+                self._last_candle_td = candle.end
+            else:
+                logger.warn("Duplicated candle with timedelta=%s", candle.end)
+        return new_candles
+
+    def _sleep_until(self, dt: datetime) -> None:
+        if (delay := (dt - now_dt_mostz()).total_seconds()) > 0:
+            sleep(delay + self._jittered(self._poll_interval) / 2)
+
+    def _jittered(self, seconds: float) -> float:
+        return jittered(seconds, self._poll_jitter)
+
+
+class AsyncMoexDataConnector:
+    # Polls many instruments over one shared HTTP session, at most max_concurrency
+    # requests in flight. After each close it polls until every instrument has the
+    # closed candle or max_poll_delay passes, then yields one snapshot per bar.
+    # Candles published after that are yielded in a snapshot of their own bar before
+    # the next one.
+    def __init__(self, config: Config, client: httpx.AsyncClient | None = None):
+        self._instruments = list(config.instruments)
+        self._period = config.period
+        self._period_td = timedelta(minutes=config.period)
+        self._iss_url = config.iss_url
+        self._poll_interval = config.poll_interval
+        self._poll_jitter = config.poll_jitter
+        self._max_poll_delay = timedelta(seconds=config.max_poll_delay)
+        self._semaphore = asyncio.Semaphore(config.max_concurrency)
+        self._client = client
+
+        self._day: date | None = None
+        self._offsets = dict.fromkeys(self._instruments, 0)
+        self._last_candle_td = dict.fromkeys(
+            self._instruments, datetime(MINYEAR, 1, 1)
+        )
+        self.metrics = PollingMetrics()
+
+    async def __aiter__(self) -> AsyncGenerator[tuple[str, Candle], None]:
+        # Candles of all instruments ordered by time, then by instrument
+        async for _, candles in self.snapshots():
+            for instrument, candle in candles.items():
+                yield instrument, candle
+
+    async def snapshots(
+        self,
+    ) -> AsyncGenerator[tuple[datetime, dict[str, Candle]], None]:
+        # Cross-sectional candles of one bar keyed by instrument, in time order
+        async with self._session() as client:
+            close_dt = now_dt_mostz()
+            while True:
+                await self._sleep_until(close_dt)
+
+                # Begin of the last bar closed by close_dt
+                bar_begin = next_close(close_dt, self._period_td) - 2 * self._period_td
+                deadline = close_dt + self._max_poll_delay
+                waiting = self._instruments
+                new_candles: list[tuple[str, Candle]] = []
+                while True:
+                    new_candles += await self.poll(client, waiting)
+
+                    # Later polls only ask instruments still missing the closed bar
+                    waiting = [
+                        instrument
+                        for instrument, last_td in self._last_candle_td.items()
+                        if last_td < bar_begin
+                    ]
+                    if not waiting or now_dt_mostz() > deadline:
+                        break
+                    await asyncio.sleep(self._jittered(self._poll_interval))
+
+                # Held until here, so a bar is never split across snapshots by a
+                # candle that shows up on a later poll
+                for begin, candles in self._by_bar(new_candles):
+                    recorder.mark("candle")
+                    yield begin, candles
+
+                close_dt = next_close(now_dt_mostz(), self._period_td)
+
+    async def poll(
+        self, client: httpx.AsyncClient, instruments: list[str] | None = None
+    ) -> list[tuple[str, Candle]]:
+        if (day := nowday_mostz()) != self._day:
+            self._day = day
+            self._offsets = dict.fromkeys(self._instruments, 0)
+        self.metrics.polls += 1
+
+        instruments = self._instruments if instruments is None else instruments
+        fetched = await asyncio.gather(
+            *(self._fetch(client, instrument, day) for instrument in instruments)
+        )
+
+        now_dt = now_dt_mostz()
+        new_candles = []
+        for instrument, candles in zip(instruments, fetched):
+            for candle in candles:
+                if candle.begin + self._period_td > now_dt:
+                    break
+                self._offsets[instrument] += 1
+                if self._last_candle_td[instrument] < candle.begin:
+                    new_candles.append((instrument, candle))
+                    self._last_candle_td[instrument] = candle.begin
+                    latency = now_dt - (candle.begin + self._period_td)
+                    self.metrics.record(latency.total_seconds())
+        return new_candles
+
+    async def lot_sizes(self) -> dict[str, int]:
+        async with self._session() as client:
+            response = await client.get(
+                f"{self._iss_url}/securities.json",
+                params={
+                    "iss.meta": "off",
+                    "iss.only": "securities",
+                    "securities.columns": "SECID,LOTSIZE",
+                },
+            )
+            response.raise_for_status()
+        lot_sizes = dict(response.json()["securities"]["data"])
+        return {
+            instrument: lot_sizes.get(instrument, 1) for instrument in self._instruments
+        }
+
+    async def _fetch(
+        self, client: httpx.AsyncClient, instrument: str, day: date
+    ) -> list[Candle]:
+        url = f"{self._iss_url}/securities/{instrument}/candles.json"
+        params = {
+            "from": day.isoformat(),
+            "till": day.isoformat(),
+            "interval": self._period,
+            "iss.meta": "off",
+            "iss.only": "candles",
+        }
+        candles: list[Candle] = []
+        async with self._semaphore:
+            while True:
+                params["start"] = self._offsets[instrument] + len(candles)
+                try:
+                    response = await client.get(url, params=params)
+                    response.raise_for_status()
+                except httpx.HTTPError:
+                    logger.exception("Cant fetch candles of %s", instrument)
+                    break
+
+                page = response.json()["candles"]
+                for row in page["data"]:
+                    data = dict(zip(page["columns"], row))
+                    data["begin"] = datetime.fromisoformat(data["begin"])
+                    data["end"] = datetime.fromisoformat(data["end"])
+                    candles.append(Candle(**data))
+                if len(page["data"]) < ISS_PAGE_SIZE:
+                    break
+        return candles
+
+    def _by_bar(
+        self, candles: list[tuple[str, Candle]]
+    ) -> list[tuple[datetime, dict[str, Candle]]]:
+        bars: dict[datetime, dict[str, Candle]] = {}
+        for instrument, candle in sorted(candles, key=lambda x: (x[1].begin, x[0])):
+            bars.setdefault(candle.begin, {})[instrument] = candle
+        return list(bars.items())
+
+    def _session(self) -> AsyncContextManager[httpx.AsyncClient]:
+        # A client passed in is shared with the caller and closed by it
+        if self._client is not None:
+            return nullcontext(self._client)
+        return httpx.AsyncClient(timeout=30)
+
+    async def _sleep_until(self, dt: datetime) -> None:
+        if (delay := (dt - now_dt_mostz()).total_seconds()) > 0:
+            await asyncio.sleep(delay + self._jittered(self._poll_interval) / 2)
+
+    def _jittered(self, seconds: float) -> float:
+        return jittered(seconds, self._poll_jitter)
+
+
+class ReplayDataConnector:
+    # Replays a research candle cube, one NetCDF file or a market store directory of
+    # partitions, as fast as the loop consumes it. `vol` is the turnover in rubles and
+    # `vol_lot` the volume, as in research create_market_candles.
+    def __init__(self, config: Config, instruments: list[str] | None = None):
+        self._instruments = [config.instrument] if instruments is None else instruments
+        self._period_td = timedelta(minutes=config.period)
+
+        cube = load_candle_cube(config.replay_path).transpose("field", "time", "asset")
+        cube = cube.sel(
+            asset=self._instruments,
+            time=slice(config.replay_start, config.replay_end),
+        )
+        fields = list(cube.field.values)
+        self._values = np.stack(
+            [
+                cube.sel(field=name).values
+                if name in fields
+                else np.zeros(cube.shape[1:])
+                for name in ("open", "close", "high", "low", "vol", "vol_lot")
+            ],
+            axis=-1,
+        )
+        self._times = pd.DatetimeIndex(cube.time.values).to_pydatetime()
+
+        self.current_dt = datetime(MINYEAR, 1, 1)
+        self.metrics = PollingMetrics()
+
+    def __iter__(self) -> Generator[Candle, Any, None]:
+        instrument = self._instruments[0]
+        for _, candles in self.snapshots():
+            if candle := candles.get(instrument):
+                yield candle
+
+    def snapshots(self) -> Generator[tuple[datetime, dict[str, Candle]], Any, None]:
+        second = timedelta(seconds=1)
+        for begin, bar in zip(self._times, self._values):
+            close_dt = begin + self._period_td
+            candles = {}
+            for instrument, (open_, close, high, low, value, volume) in zip(
+                self._instruments, bar.tolist()
+            ):
+                # No trades in the bar
+                if close != close:
+                    continue
+                candles[instrument] = Candle(
+                    open=open_,
+                    close=close,
+                    high=high,
+                    low=low,
+                    value=value,
+                    volume=0 if volume != volume else int(volume),
+                    begin=begin,
+                    end=close_dt - second,
+                )
+
+            # The simulated broker fills on the close of the replayed bar
+            self.current_dt = close_dt
+            if candles:
+                self.metrics.candles += len(candles)
+                recorder.mark("candle")
+                yield begin, candles
+
+    def clock(self) -> datetime:
+        return self.current_dt
+
+
+def load_candle_cube(path: str) -> xr.DataArray:
+    if not os.path.isdir(path):
+        return xr.open_dataarray(path).load()
+
+    parts = []
+    for name in sorted(os.listdir(path)):
+        if name.endswith(".nc"):
+            with xr.open_dataarray(os.path.join(path, name)) as part:
+                parts.append(part.load())
+    if not parts:
+        raise ValueError(f"No candle files in {path}")
+    return xr.concat(parts, dim="time", join="outer", fill_value=np.nan)
+
+
+def next_close(now_dt: datetime, period: timedelta) -> datetime:
+    midnight = datetime(now_dt.year, now_dt.month, now_dt.day)
+    return midnight + ((now_dt - midnight) // period + 1) * period
+
+
+def jittered(seconds: float, jitter: float) -> float:
+    return max(0.0, seconds + uniform(-jitter, jitter))
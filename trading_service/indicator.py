@@ -0,0 +1,195 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from dataclasses import dataclass, field
+from math import isclose, isnan, nan
+from typing import Iterable, Protocol, Sequence
+
+from moexalgo.models import Candle
+
+
+class Indicator(Protocol):
+    value: float
+
+    def update(self, x: float) -> float:
+        ...
+
+
+# Streaming counterparts of the research batch indicators (research/moex_utils.py).
+# Every update is O(1) except RollingRank, which keeps a sorted window to search.
+
+
+@dataclass
+class EMA:
+    # alpha = 2 / (period + 1) seeded with the first value, NaNs are skipped and the
+    # first period - 1 valid values are warm-up, as moex_utils.ema
+    period: int
+    value: float = field(default=nan, init=False)
+    _state: float = field(default=nan, init=False, repr=False)
+    _count: int = field(default=0, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.period < 1:
+            raise ValueError(f"Period must be positive, got {self.period}")
+        self._alpha = 2 / (self.period + 1)
+
+    def update(self, x: float) -> float:
+        if isnan(x):
+            self.value = nan
+            return self.value
+
+        if self._count == 0:
+            self._state = x
+        else:
+            self._state = self._alpha * x + (1 - self._alpha) * self._state
+        self._count += 1
+
+        self.value = self._state if self._count >= self.period else nan
+        return self.value
+
+
+@dataclass
+class TRIX:
+    # One bar rate of change of the triple EMA, in percent, as moex_utils.trix
+    period: int
+    value: float = field(default=nan, init=False)
+
+    def __post_init__(self) -> None:
+        self._emas = (EMA(self.period), EMA(self.period), EMA(self.period))
+        self._prev_triple = nan
+
+    def update(self, x: float) -> float:
+        triple = x
+        for ema in self._emas:
+            triple = ema.update(triple)
+
+        self.value = (triple / self._prev_triple - 1) * 100
+        self._prev_triple = triple
+        return self.value
+
+
+@dataclass
+class RollingSum:
+    # NaNs count as zero and the first window - 1 values are warm-up, as add_rolling_vol
+    window: int
+    value: float = field(default=nan, init=False)
+
+    def __post_init__(self) -> None:
+        if self.window < 1:
+            raise ValueError(f"Window must be positive, got {self.window}")
+        self._values: deque[float] = deque(maxlen=self.window)
+        self._sum = 0.0
+        self._updates = 0
+
+    def update(self, x: float) -> float:
+        x = 0.0 if isnan(x) else x
+        if len(self._values) == self.window:
+            self._sum -= self._values[0]
+        self._values.append(x)
+        self._sum += x
+
+        # Resum the window once per window length to keep float drift bounded
+        self._updates += 1
+        if self._updates % self.window == 0:
+            self._sum = sum(self._values)
+
+        self.value = self._sum if len(self._values) == self.window else nan
+        return self.value
+
+
+@dataclass
+class RollingMean:
+    window: int
+    value: float = field(default=nan, init=False)
+
+    def __post_init__(self) -> None:
+        self._sum = RollingSum(self.window)
+
+    def update(self, x: float) -> float:
+        self.value = self._sum.update(x) / self.window
+        return self.value
+
+
+@dataclass
+class RollingRank:
+    # Average rank of the latest value in its window, 1 is the smallest, as pandas
+    # rolling(window).rank(); NaNs are not ranked and hold their slot in the window
+    window: int
+    value: float = field(default=nan, init=False)
+
+    def __post_init__(self) -> None:
+        if self.window < 1:
+            raise ValueError(f"Window must be positive, got {self.window}")
+        self._values: deque[float] = deque(maxlen=self.window)
+        self._sorted: list[float] = []
+
+    def update(self, x: float) -> float:
+        if len(self._values) == self.window:
+            if not isnan(oldest := self._values[0]):
+                del self._sorted[bisect_left(self._sorted, oldest)]
+        self._values.append(x)
+
+        if isnan(x):
+            self.value = nan
+            return self.value
+
+        insort(self._sorted, x)
+        if len(self._sorted) < self.window:
+            self.value = nan
+        else:
+            lower = bisect_left(self._sorted, x)
+            upper = bisect_right(self._sorted, x)
+            self.value = (lower + upper + 1) / 2
+        return self.value
+
+
+class CandleIndicators:
+    # Named indicators fed from one candle attribute each, e.g.
+    # CandleIndicators({"trix": ("open", TRIX(20)), "vol": ("value", RollingMean(30))})
+    def __init__(self, indicators: dict[str, tuple[str, Indicator]]):
+        self._indicators = indicators
+
+    def update(self, candle: Candle) -> dict[str, float]:
+        return {
+            name: indicator.update(float(getattr(candle, attribute)))
+            for name, (attribute, indicator) in self._indicators.items()
+        }
+
+    @property
+    def values(self) -> dict[str, float]:
+        return {
+            name: indicator.value for name, (_, indicator) in self._indicators.items()
+        }
+
+
+def stream(indicator: Indicator, values: Iterable[float]) -> list[float]:
+    return [indicator.update(float(x)) for x in values]
+
+
+def verify_indicator(
+    indicator: Indicator,
+    values: Iterable[float],
+    expected: Sequence[float],
+    rel_tol: float = 1e-9,
+    abs_tol: float = 1e-12,
+) -> None:
+    # Verification mode: replays the series through the streaming indicator and checks
+    # each bar against the batch result computed over the same series
+    streamed = stream(indicator, values)
+    if len(streamed) != len(expected):
+        raise ValueError(
+            f"Streamed {len(streamed)} values, batch result has {len(expected)}"
+        )
+
+    for i, (got, want) in enumerate(zip(streamed, expected)):
+        want = float(want)
+        if isnan(got) and isnan(want):
+            continue
+        if (
+            isnan(got)
+            or isnan(want)
+            or not isclose(got, want, rel_tol=rel_tol, abs_tol=abs_tol)
+        ):
+            raise ValueError(
+                f"{type(indicator).__name__} diverges at bar {i}: "
+                f"streamed {got}, batch {want}"
+            )
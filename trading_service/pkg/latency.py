@@ -0,0 +1,129 @@
+import os
+from contextlib import contextmanager
+from functools import wraps
+from time import monotonic, monotonic_ns
+from typing import Iterator
+
+# Values keep their top SUB_BUCKET_BITS + 1 bits, so a bucket is within 1/16 of
+# the value and a histogram never holds more than a few hundred buckets
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+
+def _bucket(value: int) -> int:
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) << SUB_BUCKET_BITS | (value >> shift) & (SUB_BUCKETS - 1)
+
+
+def _bucket_value(bucket: int) -> int:
+    if bucket < SUB_BUCKETS:
+        return bucket
+    shift = (bucket >> SUB_BUCKET_BITS) - 1
+    return (SUB_BUCKETS | bucket & (SUB_BUCKETS - 1)) << shift
+
+
+class Histogram:
+    # Nanosecond durations in log-linear buckets
+    def __init__(self) -> None:
+        self.counts: dict[int, int] = {}
+        self.count = 0
+        self.max = 0
+
+    def record(self, value: int) -> None:
+        bucket = _bucket(max(value, 0))
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> int:
+        rank = q * self.count
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(_bucket_value(bucket), self.max)
+        return self.max
+
+    def summary(self) -> dict[str, float]:
+        # Milliseconds
+        return {
+            "count": self.count,
+            "p50": self.percentile(0.5) / 1e6,
+            "p99": self.percentile(0.99) / 1e6,
+            "max": self.max / 1e6,
+        }
+
+
+class LatencyRecorder:
+    # Monotonic timestamps and durations of the candle to order path, every call is
+    # a single flag check while disabled
+    def __init__(self, enabled: bool = False, report_interval: float = 60.0) -> None:
+        self.enabled = enabled
+        self.report_interval = report_interval
+        self.histograms: dict[str, Histogram] = {}
+        self._marks: dict[str, int] = {}
+        self._last_report = monotonic()
+
+    def record(self, name: str, value: int) -> None:
+        if (histogram := self.histograms.get(name)) is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.record(value)
+
+    def mark(self, name: str) -> None:
+        if self.enabled:
+            self._marks[name] = monotonic_ns()
+
+    def since(self, mark: str, name: str) -> None:
+        # Records the time passed since `mark`, e.g. from candle receipt to order ack
+        if self.enabled and (start := self._marks.get(mark)) is not None:
+            self.record(name, monotonic_ns() - start)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        start = monotonic_ns()
+        try:
+            yield
+        finally:
+            self.record(name, monotonic_ns() - start)
+
+    def timed(self, name: str):
+        def wrapper(func):
+            @wraps(func)
+            def inner_wrapper(*args, **kwds):
+                if not self.enabled:
+                    return func(*args, **kwds)
+                start = monotonic_ns()
+                try:
+                    return func(*args, **kwds)
+                finally:
+                    self.record(name, monotonic_ns() - start)
+
+            return inner_wrapper
+
+        return wrapper
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        return {name: h.summary() for name, h in sorted(self.histograms.items())}
+
+    def due(self) -> bool:
+        # True once per report_interval, for periodic logging from the loop
+        if not self.enabled or monotonic() - self._last_report < self.report_interval:
+            return False
+        self._last_report = monotonic()
+        return True
+
+    def reset(self) -> None:
+        self.histograms.clear()
+        self._marks.clear()
+
+
+recorder = LatencyRecorder(
+    enabled=os.environ.get("LATENCY_ENABLED", "0") == "1",
+    report_interval=float(os.environ.get("LATENCY_REPORT_INTERVAL", "60")),
+)
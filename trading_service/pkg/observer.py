@@ -1,10 +1,29 @@
+import atexit
+import os
 from dataclasses import asdict
 from enum import Enum
 from functools import wraps
-from uuid import UUID
+from itertools import groupby
+from logging import getLogger
+from operator import itemgetter
+from threading import Condition, Lock, Thread
+from time import monotonic
+from uuid import UUID, uuid5
 
 import requests
-from orjson import dumps
+from orjson import dumps, loads
+
+from trading_service.pkg.latency import recorder
+from trading_service.pkg.spool import Position, Spool
+
+logger = getLogger("observer")
+
+# Strategy ids are derived from a stable key, so a restarted trader reports to the
+# same strategy without asking the admin service
+STRATEGY_NAMESPACE = UUID("5b0d6a2e-8f3c-4a41-9d2e-0c7f3b1e9a64")
+
+# Backtests and unit tests reuse the broker code offline with OBSERVER_ENABLED=0
+enabled = os.environ.get("OBSERVER_ENABLED", "1") != "0"
 
 
 class DataKind(str, Enum):
@@ -13,41 +32,296 @@ class DataKind(str, Enum):
 
 
 class ApiClient:
-    def __init__(self) -> None:
+    def __init__(
+        self, strategy_key: str = "Test", cache_path: str = ".observer/strategies"
+    ) -> None:
         self.base_url: str = "http://localhost:8000"
-        self.strategy_id: UUID | None = None
+        self.strategy_key = strategy_key
+        self.strategy_id: UUID = uuid5(STRATEGY_NAMESPACE, strategy_key)
+        # Ids of strategies already registered, one per line
+        self.cache_path = cache_path
+        self._registered: bool | None = None
+        # Keep-alive connection pool shared by every request to the admin service
+        self._session = requests.Session()
+        # Connect and read timeouts, a hung admin service must not stall the shipper
+        self.timeout = (3.05, 30.0)
 
-    def save_incoming(self, data: dict) -> None:
-        requests.post(f"{self.base_url}/incomings", data=self._serialize(data))
+    def save_many(self, datakind: DataKind, items: list[dict]) -> None:
+        path = "incomings" if datakind == DataKind.INCOMING else "orders"
+        response = self._session.post(
+            f"{self.base_url}/{path}/batch",
+            data=b"\n".join(self._serialize(data) for data in items),
+            headers={"Content-Type": "application/x-ndjson"},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
 
-    def save_order(self, data: dict) -> None:
-        requests.post(f"{self.base_url}/orders", data=self._serialize(data))
+    def ensure_strategy(self) -> None:
+        # Called before the first event is sent, the cache skips the request on restart
+        if self._registered is None:
+            self._registered = str(self.strategy_id) in self._load_cache()
+        if not self._registered:
+            self.init_strategy()
 
     def init_strategy(
-        self, name: str = "Test", description: str = "Some test strategy"
+        self, name: str | None = None, description: str = "Some test strategy"
     ):
+        # Idempotent, the admin service returns the existing strategy for a known id
         serielized = dumps(
-            {"name": name, "description": description, "source_code": ""}
+            {
+                "id": self.strategy_id,
+                "name": name or self.strategy_key,
+                "description": description,
+                "source_code": "",
+            }
         )
-        response = requests.post(f"{self.base_url}/strategies", data=serielized).json()
-        self.strategy_id = response["id"]
+        response = self._session.post(
+            f"{self.base_url}/strategies", data=serielized, timeout=self.timeout
+        )
+        response.raise_for_status()
+
+        self._registered = True
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        with open(self.cache_path, "a") as file:
+            file.write(f"{self.strategy_id}\n")
+
+    def forget_strategy(self) -> None:
+        # The admin service no longer knows the strategy, e.g. after a database reset,
+        # so the cached registration is dropped and the next ensure_strategy resends it
+        self._registered = False
+        cached = self._load_cache() - {str(self.strategy_id)}
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        with open(self.cache_path, "w") as file:
+            file.writelines(f"{strategy_id}\n" for strategy_id in cached)
+
+    def _load_cache(self) -> set[str]:
+        try:
+            with open(self.cache_path) as file:
+                return set(file.read().split())
+        except FileNotFoundError:
+            return set()
 
-    def _serialize(self, data: dict) -> str:
+    def _serialize(self, data: dict) -> bytes:
         return dumps({"strategy_id": self.strategy_id, "data": data})
 
 
+class OverflowPolicy(str, Enum):
+    DROP_NEWEST = "drop_newest"
+    DROP_OLDEST = "drop_oldest"
+    BLOCK = "block"
+
+
+class SpoolTransport:
+    # Events are appended to an on-disk spool first, a background shipper replays them
+    # to the admin service in order and acknowledges what was accepted. Delivery is
+    # at least once: a crash between a send and its ack resends that run. The spool
+    # holds at most max_bytes unshipped, past that the overflow policy applies, which
+    # drops whole segments for drop-oldest.
+    def __init__(
+        self,
+        client: ApiClient,
+        spool: Spool,
+        batch_size: int = 500,
+        sync_interval: float = 0.2,
+        max_backoff: float = 30.0,
+        max_bytes: int = 256 * 2**20,
+        overflow: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+    ) -> None:
+        self.client = client
+        self.spool = spool
+        self.batch_size = batch_size
+        self.sync_interval = sync_interval
+        self.max_backoff = max_backoff
+        self.max_bytes = max_bytes
+        self.overflow = overflow
+
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self.rejected = 0
+
+        self._cond = Condition()
+        self._flush_gen = 0
+        self._drained_gen = -1
+        self._submitted = 0
+        self._woken = False
+        self._closed = False
+        self._worker: Thread | None = None
+
+    def start(self) -> None:
+        with self._cond:
+            if self._worker is None:
+                self._worker = Thread(target=self._run, name="observer", daemon=True)
+                self._worker.start()
+
+    def submit(self, datakind: DataKind, data: dict) -> bool:
+        if self._closed:
+            return False
+        if self.spool.pending_bytes >= self.max_bytes and not self._make_room():
+            return False
+        self.spool.append(dumps({"kind": datakind, "data": data}))
+
+        # A full batch is shipped right away instead of on the next sync tick
+        self._submitted += 1
+        if self._submitted >= self.batch_size:
+            with self._cond:
+                self._submitted = 0
+                self._woken = True
+                self._cond.notify_all()
+        return True
+
+    def flush(self, timeout: float | None = None) -> bool:
+        self.start()
+        with self._cond:
+            self._flush_gen += 1
+            gen = self._flush_gen
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._drained_gen >= gen, timeout)
+
+    def close(self, timeout: float | None = 5.0) -> None:
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._worker is not None:
+            self._worker.join(timeout)
+        self.spool.close()
+
+    def _make_room(self) -> bool:
+        if self.overflow == OverflowPolicy.DROP_NEWEST:
+            self.dropped += 1
+            return False
+        if self.overflow == OverflowPolicy.BLOCK:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed or self.spool.pending_bytes < self.max_bytes
+                )
+            return not self._closed
+
+        while self.spool.pending_bytes >= self.max_bytes:
+            dropped = self.spool.drop_oldest()
+            self.dropped += dropped
+            logger.warning("Spool is full, dropped %s oldest events", dropped)
+        return True
+
+    def _run(self) -> None:
+        # The spool is synced every sync_interval whatever the backoff, a failed ship
+        # is retried after the backoff or on the next flush
+        backoff = self.sync_interval
+        retry_at = 0.0
+        while not self._closed:
+            self.spool.sync()
+            shipped = False
+            if monotonic() >= retry_at:
+                try:
+                    shipped = self._ship()
+                    backoff = self.sync_interval
+                except requests.RequestException as exc:
+                    logger.warning(
+                        "Admin service unavailable, retry in %.1fs: %s", backoff, exc
+                    )
+                    retry_at = monotonic() + backoff
+                    backoff = min(backoff * 2, self.max_backoff)
+
+            if not shipped:
+                with self._cond:
+                    gen = self._flush_gen
+                    self._cond.wait_for(
+                        lambda: self._closed or self._woken or self._flush_gen != gen,
+                        self.sync_interval,
+                    )
+                    if self._flush_gen != gen:
+                        retry_at = 0.0
+                    self._woken = False
+
+    def _ship(self) -> bool:
+        self.client.ensure_strategy()
+
+        with self._cond:
+            gen = self._flush_gen
+        if not (records := self.spool.read(self.batch_size)):
+            with self._cond:
+                self._drained_gen = gen
+                self._cond.notify_all()
+            return False
+
+        # Consecutive events of one kind go in one request, acked as soon as accepted
+        events = [
+            (*self._decode(record, position), record, position)
+            for record, position in records
+        ]
+        for datakind, run in groupby(events, key=itemgetter(0)):
+            run = list(run)
+            if datakind is not None:
+                items = [data for _, data, _, _ in run]
+                try:
+                    self._save(datakind, items)
+                    self.sent += len(items)
+                except requests.RequestException as exc:
+                    if is_retryable(exc):
+                        self.failed += len(items)
+                        raise
+                    # Resending cant help, set the run aside and move past it
+                    logger.error(
+                        "Admin service rejected %s %s events: %s",
+                        len(items),
+                        datakind,
+                        exc,
+                    )
+                    self.spool.dead_letter([record for _, _, record, _ in run])
+                    self.rejected += len(items)
+            self.spool.ack(run[-1][3])
+            # Wakes submitters blocked on a full spool
+            with self._cond:
+                self._cond.notify_all()
+        return True
+
+    def _save(self, datakind: DataKind, items: list[dict]) -> None:
+        try:
+            self.client.save_many(datakind, items)
+        except requests.HTTPError as exc:
+            if exc.response is None or exc.response.status_code != 404:
+                raise
+            # Unknown strategy, register it again and resend the run once
+            logger.warning(
+                "Strategy %s is unknown, register it again", self.client.strategy_id
+            )
+            self.client.forget_strategy()
+            self.client.ensure_strategy()
+            self.client.save_many(datakind, items)
+
+    @staticmethod
+    def _decode(record: bytes, position: Position) -> tuple[DataKind | None, dict]:
+        try:
+            event = loads(record)
+            return DataKind(event["kind"]), event["data"]
+        except (KeyError, TypeError, ValueError):
+            logger.error("Skip corrupted spool record before %s", position)
+            return None, {}
+
+
+def is_retryable(exc: requests.RequestException) -> bool:
+    # Connection problems, timeouts, server errors and rate limits pass, other 4xx
+    # mean the request itself is wrong
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    response = exc.response
+    if response is None:
+        return True
+    return response.status_code >= 500 or response.status_code == 429
+
+
 def observeit(datakind: DataKind):
+    # Observes a method, instances with `observed = False` are skipped
     def wrapper(func):
         @wraps(func)
-        def inner_wrapper(*args, **kwds):
-            result = func(*args, **kwds)
-
-            if datakind == DataKind.INCOMING:
-                if result:
-                    client.save_incoming(asdict(result))
-            else:
-                if result:
-                    client.save_order(asdict(result))
+        def inner_wrapper(self, *args, **kwds):
+            result = func(self, *args, **kwds)
+
+            # Snapshot now, the broker keeps mutating the returned order
+            if result and enabled and getattr(self, "observed", True):
+                with recorder.span("observer_enqueue"):
+                    get_transport().submit(DataKind(datakind), asdict(result))
             return result
 
         return inner_wrapper
@@ -55,6 +329,44 @@ def observeit(datakind: DataKind):
     return wrapper
 
 
-client = ApiClient()
+def get_transport() -> SpoolTransport:
+    # Created on the first event, importing the observer does no I/O
+    global transport
+    if transport is None:
+        with _transport_lock:
+            if transport is None:
+                transport = SpoolTransport(
+                    client,
+                    Spool(os.path.join(data_dir, "spool")),
+                    max_bytes=int(
+                        os.environ.get("OBSERVER_SPOOL_MAX_BYTES", 256 * 2**20)
+                    ),
+                    overflow=OverflowPolicy(
+                        os.environ.get("OBSERVER_OVERFLOW", "drop_oldest")
+                    ),
+                )
+                transport.start()
+                atexit.register(transport.close)
+    return transport
+
+
+def configure(strategy_key: str, path: str | None = None) -> None:
+    # Called at startup before the first event: the trader reports to the strategy
+    # named by `strategy_key` and keeps the spool and the strategy cache in `path`
+    global client, data_dir
+    if transport is not None:
+        raise RuntimeError("Observer is already shipping events")
+    if path is not None:
+        data_dir = path
+    client = ApiClient(strategy_key, os.path.join(data_dir, "strategies"))
+
+
+# Spool and registered strategy ids, relative to the working directory by default
+data_dir = os.environ.get("OBSERVER_DATA_DIR", ".observer")
+client = ApiClient(
+    os.environ.get("OBSERVER_STRATEGY_KEY", "Test"),
+    os.path.join(data_dir, "strategies"),
+)
 
-client.init_strategy()
+transport: SpoolTransport | None = None
+_transport_lock = Lock()
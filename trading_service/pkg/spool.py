@@ -0,0 +1,179 @@
+import os
+from threading import Lock
+
+Position = tuple[int, int]
+
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+# Records the receiver rejected, kept for inspection and never replayed
+DEAD_LETTER_DIR = "dead"
+
+
+class Spool:
+    # Append-only log of newline terminated records split into numbered segment files.
+    # Writes go to the OS right away, fsync is batched by whoever calls sync().
+    # The cursor file keeps the position of the last acknowledged record, segments
+    # behind it are deleted.
+    def __init__(self, path: str, segment_bytes: int = 4 * 2**20) -> None:
+        self.path = path
+        self.segment_bytes = segment_bytes
+        os.makedirs(path, exist_ok=True)
+
+        self._lock = Lock()
+        # Serializes cursor updates of the shipper and of drop_oldest
+        self._ack_lock = Lock()
+        self._cursor = self._load_cursor()
+
+        # Always start a fresh segment, the last one may end with a torn record
+        for segment in self.segments():
+            if not os.path.getsize(self._segment_path(segment)):
+                os.remove(self._segment_path(segment))
+        segments = self.segments()
+        self._active_seq = (segments[-1] if segments else self._cursor[0]) + 1
+        self._active = self._open_segment(self._active_seq)
+        self._active_size = 0
+        self._unsynced = False
+        self._pending = self._pending_since(self._cursor)
+
+    @property
+    def pending_bytes(self) -> int:
+        # Size of the records not acknowledged yet
+        return self._pending
+
+    def segments(self) -> list[int]:
+        return sorted(
+            int(name.removesuffix(SEGMENT_SUFFIX))
+            for name in os.listdir(self.path)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def append(self, record: bytes) -> None:
+        with self._lock:
+            if self._active_size >= self.segment_bytes:
+                self._roll()
+            self._active.write(record + b"\n")
+            self._active_size += len(record) + 1
+            self._pending += len(record) + 1
+            self._unsynced = True
+
+    def sync(self) -> None:
+        with self._lock:
+            if self._unsynced:
+                os.fsync(self._active.fileno())
+                self._unsynced = False
+
+    def read(self, max_records: int) -> list[tuple[bytes, Position]]:
+        # Records after the acknowledged cursor with the position right after each one
+        records: list[tuple[bytes, Position]] = []
+        seq, offset = self._cursor
+        with self._lock:
+            active_seq = self._active_seq
+
+        for segment in self.segments():
+            if segment < seq:
+                continue
+            if segment > seq:
+                offset = 0
+            try:
+                with open(self._segment_path(segment), "rb") as file:
+                    file.seek(offset)
+                    for line in file:
+                        # Torn tail of a crashed writer or a record being written
+                        if not line.endswith(b"\n"):
+                            break
+                        offset += len(line)
+                        records.append((line[:-1], (segment, offset)))
+                        if len(records) >= max_records:
+                            return records
+            except FileNotFoundError:
+                # Dropped by drop_oldest in the meantime
+                continue
+            if segment == active_seq:
+                break
+        return records
+
+    def ack(self, position: Position) -> None:
+        with self._ack_lock:
+            # Records read before drop_oldest moved the cursor past them
+            if position <= self._cursor:
+                return
+            self._cursor = position
+            tmp_path = os.path.join(self.path, CURSOR_FILE + ".tmp")
+            with open(tmp_path, "w") as file:
+                file.write(f"{position[0]} {position[1]}")
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, os.path.join(self.path, CURSOR_FILE))
+
+            for segment in self.segments():
+                if segment >= position[0]:
+                    break
+                os.remove(self._segment_path(segment))
+            with self._lock:
+                self._pending = self._pending_since(position)
+
+    def drop_oldest(self) -> int:
+        # Acks the oldest segment unread, the active one is rolled first. Returns the
+        # number of records dropped.
+        with self._ack_lock:
+            seq, offset = self._cursor
+            with self._lock:
+                segment = next((s for s in self.segments() if s >= seq), None)
+                if segment is None:
+                    return 0
+                if segment == self._active_seq:
+                    self._roll()
+            if segment > seq:
+                offset = 0
+            with open(self._segment_path(segment), "rb") as file:
+                file.seek(offset)
+                dropped = file.read().count(b"\n")
+        self.ack((segment + 1, 0))
+        return dropped
+
+    def dead_letter(self, records: list[bytes]) -> None:
+        # Durable before the caller acks past the records
+        os.makedirs(os.path.join(self.path, DEAD_LETTER_DIR), exist_ok=True)
+        with self._lock:
+            seq = self._active_seq
+        path = os.path.join(self.path, DEAD_LETTER_DIR, f"{seq:020d}{SEGMENT_SUFFIX}")
+        with open(path, "ab") as file:
+            file.write(b"".join(record + b"\n" for record in records))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def close(self) -> None:
+        self.sync()
+        with self._lock:
+            self._active.close()
+
+    def _roll(self) -> None:
+        os.fsync(self._active.fileno())
+        self._active.close()
+        self._active_seq += 1
+        self._active = self._open_segment(self._active_seq)
+        self._active_size = 0
+        self._unsynced = False
+
+    def _pending_since(self, position: Position) -> int:
+        seq, offset = position
+        pending = 0
+        for segment in self.segments():
+            if segment >= seq:
+                pending += os.path.getsize(self._segment_path(segment))
+                pending -= offset if segment == seq else 0
+        return pending
+
+    def _open_segment(self, seq: int):
+        return open(self._segment_path(seq), "ab", buffering=0)
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.path, f"{seq:020d}{SEGMENT_SUFFIX}")
+
+    def _load_cursor(self) -> Position:
+        try:
+            with open(os.path.join(self.path, CURSOR_FILE)) as file:
+                seq, offset = file.read().split()
+                return int(seq), int(offset)
+        except FileNotFoundError:
+            return 0, 0
@@ -0,0 +1,165 @@
+from datetime import datetime
+from logging import getLogger
+from typing import Any, Callable
+
+import numpy as np
+import xarray as xr
+from moexalgo.models import Candle
+
+from trading_service.connector.brocker import BrockerConnector, OrderKind, OrderMetaData
+from trading_service.pkg.latency import recorder
+from trading_service.strategy import calculate_asset_lot_counts
+
+logger = getLogger("portfolio")
+
+FIELDS = ("open", "high", "low", "close", "vol")
+# Research `vol` is the turnover in rubles
+CANDLE_ATTRIBUTES = ("open", "high", "low", "close", "value")
+
+WeightFunction = Callable[[xr.DataArray, Any], xr.DataArray]
+
+
+class RollingCube:
+    # Last `window` bars as a (field, time, asset) cube like the research data. Every
+    # bar is written twice into a buffer of 2 * window, so the ordered window is always
+    # one contiguous slice and appending never copies the history.
+    def __init__(self, assets: list[str], window: int):
+        self.assets = list(assets)
+        self.window = window
+        self._index = {asset: i for i, asset in enumerate(self.assets)}
+        self._values = np.full((len(FIELDS), 2 * window, len(self.assets)), np.nan)
+        self._times = np.full(2 * window, np.datetime64("NaT"), dtype="datetime64[ns]")
+        self._count = 0
+
+    @property
+    def full(self) -> bool:
+        return self._count >= self.window
+
+    def append(self, begin: datetime, candles: dict[str, Candle]) -> None:
+        bar = np.full((len(FIELDS), len(self.assets)), np.nan)
+        for asset, candle in candles.items():
+            if (i := self._index.get(asset)) is not None:
+                bar[:, i] = [getattr(candle, name) for name in CANDLE_ATTRIBUTES]
+
+        time = np.datetime64(begin, "ns")
+        last = (self._count - 1) % self.window
+        if self._count and self._times[last] == time:
+            # Candles published late for the last bar fill it in place
+            for offset in (last, last + self.window):
+                self._values[:, offset] = np.where(
+                    np.isnan(bar), self._values[:, offset], bar
+                )
+            return
+
+        position = self._count % self.window
+        for offset in (position, position + self.window):
+            self._values[:, offset] = bar
+            self._times[offset] = time
+        self._count += 1
+
+    @property
+    def data(self) -> xr.DataArray:
+        start = self._count % self.window if self.full else 0
+        stop = start + min(self._count, self.window)
+        return xr.DataArray(
+            self._values[:, start:stop],
+            dims=["field", "time", "asset"],
+            coords={
+                "field": list(FIELDS),
+                "time": self._times[start:stop],
+                "asset": self.assets,
+            },
+        )
+
+
+class PortfolioRunner:
+    # Evaluates a research weight function on every bar and trades the difference
+    # between target and held lots. Weights are fractions of capital per asset.
+    def __init__(
+        self,
+        weight_function: WeightFunction,
+        params: Any,
+        brocker: BrockerConnector,
+        lot_sizes: dict[str, int],
+        capital: float,
+        window: int,
+    ):
+        self.weight_function = weight_function
+        self.params = params
+        self.brocker = brocker
+        self.capital = capital
+
+        assets = list(lot_sizes)
+        self.cube = RollingCube(assets, window)
+        self.lots = xr.DataArray(
+            [lot_sizes[asset] for asset in assets],
+            dims=["asset"],
+            coords={"asset": assets},
+        )
+        self.positions: dict[str, int] = dict.fromkeys(assets, 0)
+        # Open buy orders per asset, the latest last
+        self.open_orders: dict[str, list[OrderMetaData]] = {
+            asset: [] for asset in assets
+        }
+
+    def on_bar(
+        self, begin: datetime, candles: dict[str, Candle]
+    ) -> list[OrderMetaData]:
+        self.cube.append(begin, candles)
+        if not self.cube.full:
+            return []
+
+        data = self.cube.data
+        with recorder.span("strategy"):
+            weights = self.weight_function(data, self.params).isel(time=-1).fillna(0)
+            prices = data.sel(field="close").isel(time=-1)
+            targets = calculate_asset_lot_counts(
+                self.capital, prices, self.lots, weights
+            )
+
+        diffs = []
+        for asset, target, price in zip(
+            self.cube.assets, targets.values, prices.values
+        ):
+            # No price this bar, keep the position as is
+            if np.isnan(price) or np.isnan(target):
+                continue
+            if (diff := int(target) - self.positions[asset]) != 0:
+                diffs.append((diff, asset, float(price)))
+
+        # Reductions first, so the freed balance pays for the increases
+        orders = []
+        for diff, asset, price in sorted(diffs):
+            orders.extend(self._rebalance(asset, diff, price))
+        if orders:
+            recorder.since("candle", "candle_to_order")
+        return orders
+
+    def _rebalance(self, asset: str, diff: int, price: float) -> list[OrderMetaData]:
+        lot_size = int(self.lots.sel(asset=asset))
+        orders = []
+
+        # Positions are made of buy orders, close the latest ones and only the part
+        # of the last one the reduction needs
+        while diff < 0 and self.open_orders[asset]:
+            order = self.open_orders[asset][-1]
+            lots = min(int(order.quantity) // lot_size, -diff)
+            closed = self.brocker.close_order(order.order_id, price, lots * lot_size)
+            if closed is None:
+                logger.warning("Cant sell %s lots of %s at %s", lots, asset, price)
+                break
+            if closed.order_id == order.order_id:
+                self.open_orders[asset].pop()
+            orders.append(closed)
+            self.positions[asset] -= lots
+            diff += lots
+
+        if diff > 0:
+            quantity = diff * lot_size
+            if order := self.brocker.make_order(asset, price, quantity, OrderKind.BUY):
+                self.open_orders[asset].append(order)
+                self.positions[asset] += diff
+                orders.append(order)
+            else:
+                logger.warning("Cant buy %s lots of %s at %s", diff, asset, price)
+        return orders
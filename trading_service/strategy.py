@@ -1,6 +1,26 @@
 from random import randint
 from typing import Any
 
+import numpy as np
+import xarray as xr
+
 
 def mocked_ctrategy(data: Any) -> bool:
     return bool(randint(0, 1))
+
+
+def momentum_weights(data: xr.DataArray, params: tuple[int, int, int]) -> xr.DataArray:
+    # Equal weights over assets whose rolling mean of open rises, as the research rules
+    window, short_shift, long_shift = params
+    s_ = data.sel(field="open").rolling(time=window).mean()
+    signal = (s_.shift(time=short_shift) > s_.shift(time=long_shift)).astype(float)
+    return (signal / signal.sum("asset")).fillna(0)
+
+
+def calculate_asset_lot_counts(
+    capital: float, prices: xr.DataArray, lots: xr.DataArray, weights: xr.DataArray
+) -> xr.DataArray:
+    # Whole lots each asset's share of capital buys, research/moex_utils uses it too
+    aligned_weights = weights.sel(asset=prices.asset)
+    capital_allocation = capital * aligned_weights
+    return np.floor(capital_allocation / (prices * lots))
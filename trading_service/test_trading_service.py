@@ -0,0 +1,827 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count, islice
+from math import nan
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+from uuid import uuid4
+
+import httpx
+import numpy as np
+import pandas as pd
+import requests
+import xarray as xr
+from moexalgo.models import Candle
+
+from trading_service.__main__ import replay_portfolio
+from trading_service.config import Config
+from trading_service.connector import data as data_connector
+from trading_service.connector.brocker import (
+    MockedBrockerConnector,
+    OrderKind,
+    OrderMetaData,
+    OrderStatus,
+    PositionLedger,
+)
+from trading_service.connector.data import AsyncMoexDataConnector, PollingDataConnector
+from trading_service.indicator import (
+    EMA,
+    TRIX,
+    RollingMean,
+    RollingRank,
+    RollingSum,
+    verify_indicator,
+)
+from trading_service.pkg import latency, observer
+from trading_service.pkg.latency import Histogram, LatencyRecorder
+from trading_service.pkg.observer import (
+    ApiClient,
+    DataKind,
+    OverflowPolicy,
+    SpoolTransport,
+)
+from trading_service.pkg.spool import Spool
+from trading_service.portfolio import PortfolioRunner, RollingCube
+
+
+def make_candle(price: float, begin: datetime) -> Candle:
+    return Candle(
+        open=price,
+        close=price + 0.5,
+        high=price + 1,
+        low=price - 1,
+        value=price * 10,
+        volume=1,
+        begin=begin,
+        end=begin + timedelta(seconds=59),
+    )
+
+
+def reference_ema(values: np.ndarray, period: int) -> np.ndarray:
+    # moex_utils.ema semantics: NaNs are skipped, the first period - 1 valid values
+    # are warm-up
+    series = pd.Series(values)
+    result = series.ewm(span=period, adjust=False, ignore_na=True).mean()
+    result[series.isna() | (series.notna().cumsum() < period)] = nan
+    return result.to_numpy()
+
+
+class TestSpool(unittest.TestCase):
+    def test_skips_torn_tail_and_resumes_after_restart(self):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            spool = Spool(spool_dir)
+            for i in range(3):
+                spool.append(f"record-{i}".encode())
+            # A crash in the middle of the next append leaves a torn record behind
+            spool._active.write(b"torn-rec")
+            spool.close()
+
+            restarted = Spool(spool_dir)
+            self.assertEqual(
+                [record for record, _ in restarted.read(10)],
+                [b"record-0", b"record-1", b"record-2"],
+            )
+            restarted.append(b"record-3")
+            records = restarted.read(10)
+            self.assertEqual(
+                [record for record, _ in records],
+                [b"record-0", b"record-1", b"record-2", b"record-3"],
+            )
+
+            restarted.ack(records[1][1])
+            self.assertEqual(
+                [record for record, _ in restarted.read(10)], [b"record-2", b"record-3"]
+            )
+            restarted.close()
+            self.assertEqual(
+                [record for record, _ in Spool(spool_dir).read(10)],
+                [b"record-2", b"record-3"],
+            )
+
+    def test_ack_deletes_consumed_segments(self):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            spool = Spool(spool_dir, segment_bytes=20)
+            for i in range(10):
+                spool.append(f"record-{i}".encode())
+            self.assertGreater(len(spool.segments()), 3)
+
+            records = spool.read(6)
+            spool.ack(records[-1][1])
+            self.assertEqual(spool.segments()[0], records[-1][1][0])
+            self.assertEqual(
+                [record for record, _ in spool.read(10)],
+                [f"record-{i}".encode() for i in range(6, 10)],
+            )
+
+            spool.ack(spool.read(10)[-1][1])
+            self.assertEqual(spool.read(10), [])
+            spool.close()
+            self.assertEqual(Spool(spool_dir).read(10), [])
+
+
+class FakeClient:
+    # ApiClient answering each kind of event with a fixed status code
+    def __init__(self, status_codes: dict):
+        self.status_codes = status_codes
+        self.received: list[dict] = []
+
+    def ensure_strategy(self) -> None:
+        pass
+
+    def save_many(self, datakind: DataKind, items: list[dict]) -> None:
+        response = requests.Response()
+        response.status_code = self.status_codes.get(datakind, 200)
+        if response.status_code >= 400:
+            raise requests.HTTPError(response=response)
+        self.received.extend(items)
+
+
+class TestSpoolTransport(unittest.TestCase):
+    def test_dead_letters_rejected_runs(self):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            client = FakeClient({DataKind.ORDER: 503})
+            transport = SpoolTransport(client, Spool(spool_dir))
+            transport.submit(DataKind.INCOMING, {"i": 0})
+            transport.submit(DataKind.ORDER, {"i": 1})
+            transport.submit(DataKind.INCOMING, {"i": 2})
+
+            # Server errors are retried, the run stays in the spool
+            with self.assertRaises(requests.HTTPError):
+                transport._ship()
+            self.assertEqual(client.received, [{"i": 0}])
+            self.assertEqual(len(transport.spool.read(10)), 2)
+
+            # Rejected requests are set aside and the shipper moves on
+            client.status_codes = {DataKind.ORDER: 400}
+            self.assertTrue(transport._ship())
+            self.assertEqual(client.received, [{"i": 0}, {"i": 2}])
+            self.assertEqual((transport.sent, transport.rejected), (2, 1))
+            self.assertEqual(transport.spool.read(10), [])
+            dead_dir = os.path.join(spool_dir, "dead")
+            dead = b"".join(
+                open(os.path.join(dead_dir, name), "rb").read()
+                for name in os.listdir(dead_dir)
+            )
+            self.assertEqual(dead.splitlines(), [b'{"kind":"order","data":{"i":1}}'])
+            transport.spool.close()
+
+    def test_registers_forgotten_strategy_again(self):
+        class FakeSession:
+            # Admin service whose database lost every strategy
+            def __init__(self):
+                self.strategies = set()
+                self.posts = []
+
+            def post(self, url, data, headers=None, timeout=None):
+                path = url.rsplit("/", 1)[-1]
+                self.posts.append(path)
+                response = requests.Response()
+                response.status_code = 201
+                if path == "strategies":
+                    self.strategies.add(json.loads(data)["id"])
+                elif not self.strategies:
+                    response.status_code = 404
+                return response
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_path = os.path.join(tmp_dir, "strategies")
+            client = ApiClient("Lost", cache_path=cache_path)
+            with open(cache_path, "w") as file:
+                file.write(f"other\n{client.strategy_id}\n")
+            client._session = FakeSession()
+            transport = SpoolTransport(client, Spool(os.path.join(tmp_dir, "spool")))
+            transport.submit(DataKind.ORDER, {"i": 0})
+
+            self.assertTrue(transport._ship())
+            self.assertEqual(client._session.posts, ["batch", "strategies", "batch"])
+            self.assertEqual((transport.sent, transport.rejected), (1, 0))
+            with open(cache_path) as file:
+                self.assertEqual(
+                    sorted(file.read().split()),
+                    sorted(["other", str(client.strategy_id)]),
+                )
+            transport.spool.close()
+
+    def test_syncs_on_interval_while_backing_off(self):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            client = FakeClient({DataKind.ORDER: 503})
+            spool = Spool(spool_dir)
+            transport = SpoolTransport(
+                client, spool, sync_interval=0.02, max_backoff=30.0
+            )
+            transport.submit(DataKind.ORDER, {"i": 0})
+            with mock.patch.object(spool, "sync", wraps=spool.sync) as sync:
+                with self.assertLogs("observer", level="WARNING"):
+                    transport.start()
+                    time.sleep(0.5)
+                # Backoff doubles from 0.02s, about five attempts in 0.5s
+                self.assertLessEqual(transport.failed, 6)
+                self.assertGreater(sync.call_count, 10)
+                transport.close(timeout=0.1)
+
+    def test_full_batch_wakes_the_shipper(self):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            client = FakeClient({})
+            transport = SpoolTransport(
+                client, Spool(spool_dir), batch_size=3, sync_interval=30.0
+            )
+            transport.start()
+            self.assertTrue(transport.flush(5))
+
+            for i in range(3):
+                transport.submit(DataKind.ORDER, {"i": i})
+            deadline = time.monotonic() + 5
+            while len(client.received) < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(client.received, [{"i": i} for i in range(3)])
+            transport.close()
+
+    def test_configure_names_strategy_and_data_dir(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, mock.patch.object(
+            observer, "client"
+        ), mock.patch.object(observer, "data_dir"):
+            observer.configure(Config(instrument="SBER").observer_key, tmp_dir)
+            first = observer.client
+            observer.configure(Config(instrument="GAZP").observer_key, tmp_dir)
+
+            self.assertNotEqual(first.strategy_id, observer.client.strategy_id)
+            self.assertEqual(
+                observer.client.cache_path, os.path.join(tmp_dir, "strategies")
+            )
+            self.assertEqual(observer.data_dir, tmp_dir)
+
+
+class TestSpoolOverflow(unittest.TestCase):
+    # Every event takes 32 bytes, a segment holds two and the spool four
+    def make_transport(self, spool_dir: str, overflow: OverflowPolicy):
+        return SpoolTransport(
+            FakeClient({}),
+            Spool(spool_dir, segment_bytes=64),
+            max_bytes=128,
+            overflow=overflow,
+        )
+
+    def unshipped(self, transport: SpoolTransport) -> list[int]:
+        return [
+            json.loads(record)["data"]["i"] for record, _ in transport.spool.read(10)
+        ]
+
+    def test_drop_newest_refuses_events(self):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            transport = self.make_transport(spool_dir, OverflowPolicy.DROP_NEWEST)
+            accepted = [transport.submit(DataKind.ORDER, {"i": i}) for i in range(6)]
+
+            self.assertEqual(accepted, [True] * 4 + [False] * 2)
+            self.assertEqual(transport.dropped, 2)
+            self.assertEqual(self.unshipped(transport), [0, 1, 2, 3])
+            transport.spool.close()
+
+    def test_drop_oldest_drops_whole_segments(self):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            transport = self.make_transport(spool_dir, OverflowPolicy.DROP_OLDEST)
+            with self.assertLogs("observer", level="WARNING"):
+                for i in range(10):
+                    self.assertTrue(transport.submit(DataKind.ORDER, {"i": i}))
+
+            self.assertEqual(transport.dropped, 6)
+            self.assertEqual(self.unshipped(transport), [6, 7, 8, 9])
+            self.assertLessEqual(transport.spool.pending_bytes, 128)
+
+            # A restart keeps what was dropped out of the spool
+            transport.spool.close()
+            restarted = self.make_transport(spool_dir, OverflowPolicy.DROP_OLDEST)
+            self.assertEqual(self.unshipped(restarted), [6, 7, 8, 9])
+            self.assertTrue(restarted._ship())
+            self.assertEqual(
+                restarted.client.received, [{"i": i} for i in range(6, 10)]
+            )
+            self.assertEqual(restarted.spool.pending_bytes, 0)
+            restarted.spool.close()
+
+    def test_block_waits_for_the_shipper(self):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            transport = self.make_transport(spool_dir, OverflowPolicy.BLOCK)
+            for i in range(4):
+                transport.submit(DataKind.ORDER, {"i": i})
+
+            blocked = threading.Thread(
+                target=transport.submit, args=(DataKind.ORDER, {"i": 4})
+            )
+            blocked.start()
+            blocked.join(0.2)
+            self.assertTrue(blocked.is_alive())
+
+            # The shipper frees room as it acks
+            transport.start()
+            blocked.join(5)
+            self.assertFalse(blocked.is_alive())
+            self.assertTrue(transport.flush(5))
+            self.assertEqual(transport.client.received, [{"i": i} for i in range(5)])
+            self.assertEqual(transport.dropped, 0)
+            transport.close()
+
+
+class TestIndicators(unittest.TestCase):
+    def test_streaming_indicators_match_batch(self):
+        rng = np.random.default_rng(10)
+        opens = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, 400)))
+        vols = (rng.random(400) * 1e6).round(-4)
+        vols[rng.random(400) < 0.05] = nan
+
+        triple = reference_ema(reference_ema(reference_ema(opens, 20), 20), 20)
+        trix = (triple / np.roll(triple, 1) - 1) * 100
+        trix[0] = nan
+        rolling = pd.Series(vols).fillna(0).rolling(30)
+        verify_indicator(EMA(20), opens, reference_ema(opens, 20))
+        verify_indicator(TRIX(20), opens, trix)
+        verify_indicator(RollingMean(30), vols, rolling.mean().to_numpy())
+        verify_indicator(RollingSum(30), vols, rolling.sum().to_numpy())
+        verify_indicator(
+            RollingRank(30), vols, pd.Series(vols).rolling(30).rank().to_numpy()
+        )
+
+        with self.assertRaises(ValueError):
+            verify_indicator(EMA(21), opens, reference_ema(opens, 20))
+
+
+class FakeIssServer:
+    # Local stand-in for the ISS candles.json and securities.json endpoints, serves
+    # `candles` begin times per instrument in pages of ISS_PAGE_SIZE
+    def __init__(self, candles: dict, lot_sizes: dict | None = None, failing=()):
+        self.candles = candles
+        self.lot_sizes = lot_sizes or {}
+        self.failing = set(failing)
+        self.requests: list[tuple[str, int]] = []
+        self.url = ""
+        self._httpd: ThreadingHTTPServer | None = None
+
+    def __enter__(self) -> "FakeIssServer":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path.endswith("/securities.json"):
+                    columns = ["SECID", "LOTSIZE"]
+                    rows = list(fake.lot_sizes.items())
+                    return self.reply(
+                        200, {"securities": {"columns": columns, "data": rows}}
+                    )
+
+                instrument = url.path.split("/")[-2]
+                start = int(parse_qs(url.query)["start"][0])
+                fake.requests.append((instrument, start))
+                if instrument in fake.failing:
+                    return self.reply(503, {})
+                rows = [
+                    [100.0 + i, 100.5 + i, 101.0 + i, 99.0 + i, 1000.0, 10]
+                    + [str(begin), str(begin + timedelta(seconds=59))]
+                    for i, begin in enumerate(fake.candles.get(instrument, []))
+                ][start : start + data_connector.ISS_PAGE_SIZE]
+                columns = ["open", "close", "high", "low", "value", "volume"]
+                columns += ["begin", "end"]
+                self.reply(200, {"candles": {"columns": columns, "data": rows}})
+
+            def reply(self, status, body):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(json.dumps(body).encode())
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self._httpd.server_port}"
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class FakeClock:
+    # Moscow wall clock that only moves when the connector sleeps
+    def __init__(self, now: datetime):
+        self.now = now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += timedelta(seconds=seconds)
+
+
+class TestPollingDataConnector(unittest.TestCase):
+    def test_polls_once_per_bar_and_skips_forming_candle(self):
+        clock = FakeClock(datetime(2024, 1, 10, 10, 0, 30))
+        first_begin = datetime(2024, 1, 10, 9, 57)
+
+        class FakeTicker:
+            # ISS lists the forming candle too, it has begun but not closed yet
+            def __init__(self, instrument: str):
+                self.requests: list[int] = []
+
+            def candles(self, date, period, offset=0):
+                self.requests.append(offset)
+                begin = first_begin + timedelta(minutes=offset)
+                while begin <= clock.now:
+                    yield make_candle(100.0, begin)
+                    begin += timedelta(minutes=period)
+
+        config = Config(period=1, poll_interval=2.0, poll_jitter=0.0)
+        with mock.patch.object(data_connector, "Ticker", FakeTicker), mock.patch.object(
+            data_connector, "now_dt_mostz", lambda: clock.now
+        ), mock.patch.object(
+            data_connector, "nowday_mostz", lambda: clock.now.date()
+        ), mock.patch.object(
+            data_connector, "sleep", clock.sleep
+        ):
+            connector = PollingDataConnector(config)
+            yielded = [(candle.begin, clock.now) for candle in islice(connector, 6)]
+
+        begins = [begin for begin, _ in yielded]
+        self.assertEqual(begins, [first_begin + timedelta(minutes=i) for i in range(6)])
+        # Yielded only once closed, a second after the close of the live bars
+        for begin, yielded_at in yielded:
+            self.assertGreaterEqual(yielded_at, begin + timedelta(minutes=1))
+        self.assertEqual(yielded[-1][1], datetime(2024, 1, 10, 10, 3, 1))
+        # The catch-up poll and one poll per bar after it, each from the next offset
+        self.assertEqual(connector.metrics.polls, 4)
+        self.assertEqual(connector._ticker.requests, [0, 3, 4, 5])
+
+
+class TestAsyncMoexDataConnector(unittest.TestCase):
+    def test_polls_only_new_closed_candles(self):
+        begin = datetime(2024, 1, 10, 10, 0)
+        candles = {
+            "SBER": [begin + timedelta(minutes=i) for i in range(6)],
+            "GAZP": [begin + timedelta(minutes=i) for i in range(3)],
+        }
+
+        async def run(server: FakeIssServer):
+            config = Config(
+                instruments=["SBER", "GAZP", "LKOH"],
+                iss_url=server.url,
+                period=1,
+                max_concurrency=2,
+            )
+            async with httpx.AsyncClient() as client:
+                connector = AsyncMoexDataConnector(config, client=client)
+                first = await connector.poll(client)
+                server.candles["GAZP"].append(begin + timedelta(minutes=3))
+                server.requests.clear()
+                second = await connector.poll(client)
+                return connector, first, second, await connector.lot_sizes()
+
+        # 10:05 candles are still forming, small pages make every instrument page
+        with mock.patch.object(
+            data_connector, "now_dt_mostz", return_value=begin + timedelta(minutes=5)
+        ), mock.patch.object(
+            data_connector, "nowday_mostz", return_value=begin.date()
+        ), mock.patch.object(
+            data_connector, "ISS_PAGE_SIZE", 2
+        ), FakeIssServer(
+            candles, lot_sizes={"SBER": 10}, failing={"LKOH"}
+        ) as server:
+            # A failing instrument is logged and skipped, the others are still polled
+            with self.assertLogs("data_connector", level="ERROR"):
+                connector, first, second, lot_sizes = asyncio.run(run(server))
+
+        self.assertEqual(
+            [(instrument, candle.begin.minute) for instrument, candle in first],
+            [("SBER", i) for i in range(5)] + [("GAZP", i) for i in range(3)],
+        )
+        self.assertEqual((first[0][1].open, first[0][1].close), (100.0, 100.5))
+        self.assertEqual(
+            [(instrument, candle.begin.minute) for instrument, candle in second],
+            [("GAZP", 3)],
+        )
+        # Later polls start at the first candle not consumed yet
+        self.assertIn(("SBER", 5), server.requests)
+        self.assertIn(("GAZP", 3), server.requests)
+        self.assertEqual(connector._offsets, {"SBER": 5, "GAZP": 4, "LKOH": 0})
+        self.assertEqual(connector.metrics.candles, 9)
+        self.assertEqual(lot_sizes, {"SBER": 10, "GAZP": 1, "LKOH": 1})
+
+    def test_merges_late_candle_into_its_bar(self):
+        begin = datetime(2024, 1, 10, 10, 0)
+        candles = {"SBER": [begin, begin + timedelta(minutes=1)], "GAZP": []}
+        ticks = count()
+        polled: list[list[str]] = []
+
+        async def run(server: FakeIssServer):
+            config = Config(
+                instruments=["SBER", "GAZP", "LKOH"],
+                iss_url=server.url,
+                period=1,
+                poll_interval=0.0,
+                max_poll_delay=30.0,
+            )
+            async with httpx.AsyncClient() as client:
+                connector = AsyncMoexDataConnector(config, client=client)
+                poll = connector.poll
+
+                async def late_poll(client, instruments=None):
+                    new_candles = await poll(client, instruments)
+                    polled.append(list(instruments))
+                    # GAZP publishes the closed candle only after the first poll
+                    server.candles["GAZP"] = [begin]
+                    return new_candles
+
+                connector.poll = late_poll
+                snapshots = connector.snapshots()
+                snapshot = await anext(snapshots)
+                await snapshots.aclose()
+                return snapshot
+
+        # The clock moves a second per read, LKOH never trades and waits out the
+        # deadline, 10:01 is still forming
+        with mock.patch.object(
+            data_connector,
+            "now_dt_mostz",
+            side_effect=lambda: begin + timedelta(seconds=70 + next(ticks)),
+        ), mock.patch.object(
+            data_connector, "nowday_mostz", return_value=begin.date()
+        ), FakeIssServer(
+            candles
+        ) as server:
+            bar, snapshot = asyncio.run(run(server))
+
+        self.assertEqual(bar, begin)
+        self.assertEqual(list(snapshot), ["GAZP", "SBER"])
+        self.assertEqual(polled[:2], [["SBER", "GAZP", "LKOH"], ["GAZP", "LKOH"]])
+        self.assertGreater(len(polled), 2)
+        self.assertTrue(all(instruments == ["LKOH"] for instruments in polled[2:]))
+
+
+class TestPositionLedger(unittest.TestCase):
+    def test_indexes_open_orders_and_pnl(self):
+        def order(instrument, kind, price, quantity, status=OrderStatus.OPEN):
+            open_dt = datetime(2024, 1, 10)
+            return OrderMetaData(
+                uuid4(), instrument, kind, status, price, None, quantity, open_dt, None
+            )
+
+        ledger = PositionLedger()
+        sber_buy = order("SBER", OrderKind.BUY, 100.0, 10)
+        sber_sell = order("SBER", OrderKind.SELL, 110.0, 4, OrderStatus.PROCCESSING)
+        gazp_buy = order("GAZP", OrderKind.BUY, 50.0, 2)
+        for item in (sber_buy, sber_sell, gazp_buy):
+            ledger.add(item)
+
+        self.assertEqual(ledger.open_orders(), [sber_buy, sber_sell, gazp_buy])
+        self.assertEqual(ledger.open_orders("SBER"), [sber_buy, sber_sell])
+        self.assertEqual(
+            ledger.open_orders(status=OrderStatus.OPEN), [sber_buy, gazp_buy]
+        )
+        self.assertEqual(
+            ledger.open_orders("SBER", OrderStatus.PROCCESSING), [sber_sell]
+        )
+        self.assertEqual(ledger.open_orders("LKOH"), [])
+        self.assertEqual(ledger.position("SBER").quantity, 6)
+        self.assertAlmostEqual(ledger.position("SBER").avg_price, (1000 - 440) / 6)
+        self.assertAlmostEqual(
+            ledger.unrealized_pnl({"SBER": 105.0, "GAZP": 55.0}), 6 * 105 - 560 + 10
+        )
+        with self.assertRaisesRegex(ValueError, "GAZP"):
+            ledger.unrealized_pnl({"SBER": 105.0})
+
+        # The status index follows status changes
+        ledger.set_status(sber_sell, OrderStatus.OPEN)
+        self.assertEqual(sber_sell.status, OrderStatus.OPEN)
+        self.assertEqual(ledger.open_orders("SBER", OrderStatus.PROCCESSING), [])
+        self.assertEqual(
+            ledger.open_orders(status=OrderStatus.OPEN),
+            [sber_buy, gazp_buy, sber_sell],
+        )
+
+        # Closing reports the order PnL, the position keeps only the open orders
+        sber_buy.status, sber_buy.close_price = OrderStatus.CLOSE, 120.0
+        self.assertAlmostEqual(ledger.remove(sber_buy), 200.0)
+        gazp_buy.status = OrderStatus.CANCELLED
+        self.assertEqual(ledger.remove(gazp_buy), 0.0)
+        self.assertIsNone(ledger.get(sber_buy.order_id))
+        self.assertEqual(ledger.open_orders(), [sber_sell])
+        self.assertEqual(ledger.open_orders(status=OrderStatus.OPEN), [sber_sell])
+        self.assertEqual(ledger._statuses, {sber_sell.order_id: OrderStatus.OPEN})
+        sber = ledger.position("SBER")
+        self.assertEqual((sber.quantity, sber.cost), (-4, -440.0))
+        self.assertIsNone(ledger.position("GAZP").avg_price)
+        self.assertAlmostEqual(ledger.realized_pnl, 200.0)
+
+
+class TestRollingCube(unittest.TestCase):
+    def test_keeps_last_window_in_order(self):
+        cube = RollingCube(["SBER", "GAZP"], window=3)
+        times = [datetime(2024, 1, 10, 10, i) for i in range(5)]
+
+        for i, begin in enumerate(times):
+            # GAZP has no trades in the second bar, unknown assets are ignored
+            candles = {
+                "SBER": make_candle(100.0 + i, begin),
+                "LKOH": make_candle(1.0, begin),
+            }
+            if i != 1:
+                candles["GAZP"] = make_candle(200.0 + i, begin)
+            cube.append(begin, candles)
+            self.assertEqual(cube.full, i >= 2)
+            if i == 1:
+                gazp_close = cube.data.sel(field="close", asset="GAZP").values
+                self.assertEqual(cube.data.sizes["time"], 2)
+                self.assertTrue(np.isnan(gazp_close[-1]))
+
+        data = cube.data
+        self.assertEqual(data.dims, ("field", "time", "asset"))
+        self.assertEqual(
+            list(data.field.values), ["open", "high", "low", "close", "vol"]
+        )
+        self.assertEqual(list(data.asset.values), ["SBER", "GAZP"])
+        np.testing.assert_array_equal(
+            data.time.values, np.array(times[2:], dtype="datetime64[ns]")
+        )
+        np.testing.assert_array_equal(
+            data.sel(field="close", asset="SBER").values, [102.5, 103.5, 104.5]
+        )
+        np.testing.assert_array_equal(
+            data.sel(field="vol", asset="GAZP").values, [2020.0, 2030.0, 2040.0]
+        )
+
+    def test_merges_repeated_bar(self):
+        cube = RollingCube(["SBER", "GAZP"], window=2)
+        times = [datetime(2024, 1, 10, 10, i) for i in range(3)]
+
+        for begin in times:
+            # GAZP of every bar comes in a later snapshot with the same begin
+            cube.append(begin, {"SBER": make_candle(100.0, begin)})
+            cube.append(begin, {"GAZP": make_candle(200.0, begin)})
+
+        data = cube.data
+        np.testing.assert_array_equal(
+            data.time.values, np.array(times[1:], dtype="datetime64[ns]")
+        )
+        np.testing.assert_array_equal(
+            data.sel(field="close").values, [[100.5, 200.5], [100.5, 200.5]]
+        )
+
+
+class TestPortfolioRunner(unittest.TestCase):
+    def test_sells_only_the_reduction(self):
+        def weight_function(data: xr.DataArray, params: dict) -> xr.DataArray:
+            return xr.full_like(data.sel(field="close"), params["weight"])
+
+        times = [datetime(2024, 1, 10, 10, i) for i in range(4)]
+        bars = [(begin, {"SBER": make_candle(99.5, begin)}) for begin in times]
+        brocker = MockedBrockerConnector()
+        runner = PortfolioRunner(
+            weight_function,
+            {"weight": 1.0},
+            brocker,
+            lot_sizes={"SBER": 1},
+            capital=1000.0,
+            window=1,
+        )
+
+        with mock.patch.object(observer, "enabled", False):
+            (bought,) = runner.on_bar(*bars[0])
+            runner.params["weight"] = 0.3
+            (sold,) = runner.on_bar(*bars[1])
+
+            # A failed close leaves the position as it is
+            runner.params["weight"] = 0.0
+            with mock.patch.object(
+                brocker, "close_order", return_value=None
+            ), self.assertLogs("portfolio", level="WARNING"):
+                self.assertEqual(runner.on_bar(*bars[2]), [])
+            self.assertEqual(runner.positions["SBER"], 3)
+
+            (closed,) = runner.on_bar(*bars[3])
+
+        self.assertEqual(bought.quantity, 3)
+        self.assertEqual((sold.quantity, sold.status), (7, OrderStatus.CLOSE))
+        self.assertEqual(sold.parent_id, bought.order_id)
+        self.assertEqual(closed.order_id, bought.order_id)
+        self.assertEqual(closed.status, OrderStatus.CLOSE)
+        self.assertEqual(runner.positions["SBER"], 0)
+        self.assertEqual(runner.open_orders["SBER"], [])
+        self.assertEqual(brocker.ledger.orders, {})
+        self.assertEqual(brocker.ledger.position("SBER").quantity, 0)
+        self.assertAlmostEqual(brocker.balance, 50_000.0)
+
+
+class TestReplay(unittest.TestCase):
+    def test_replayed_orders_stay_offline(self):
+        times = pd.date_range("2024-01-10 10:00", periods=40, freq="1min")
+        trend = np.linspace(100.0, 140.0, len(times))
+        prices = np.stack([trend, trend / 2], axis=-1)
+        cube = xr.DataArray(
+            np.stack([prices, prices + 1, prices - 1, prices, prices * 10]),
+            dims=["field", "time", "asset"],
+            coords={
+                "field": ["open", "high", "low", "close", "vol"],
+                "time": times,
+                "asset": ["SBER", "GAZP"],
+            },
+        )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            replay_path = os.path.join(tmp_dir, "candles.nc")
+            cube.to_netcdf(replay_path, engine="scipy")
+            config = Config(
+                instruments=["SBER", "GAZP"],
+                replay_path=replay_path,
+                period=1,
+                portfolio=True,
+                capital=100_000.0,
+                window=10,
+                weight_params=(3, 1, 2),
+            )
+            # The live observer is on, the replay must not reach it
+            with mock.patch.object(observer, "enabled", True), mock.patch.object(
+                observer, "get_transport"
+            ) as get_transport:
+                brocker = replay_portfolio(config)
+
+        self.assertTrue(brocker.ledger.orders)
+        self.assertLess(brocker.balance, config.capital)
+        get_transport.assert_not_called()
+
+
+class TestLatency(unittest.TestCase):
+    def test_bucket_round_trip_within_a_sixteenth(self):
+        values = list(range(1000)) + [int(1.37**i) for i in range(30, 90)]
+        buckets = [latency._bucket(value) for value in values]
+
+        self.assertEqual(buckets, sorted(buckets))
+        for value, bucket in zip(values, buckets):
+            lower = latency._bucket_value(bucket)
+            self.assertEqual(latency._bucket(lower), bucket)
+            self.assertLessEqual(lower, value)
+            self.assertLess(value - lower, max(value / 16, 1))
+        # Small values keep their own bucket
+        self.assertEqual(buckets[:32], list(range(32)))
+
+    def test_percentiles(self):
+        histogram = Histogram()
+        for micros in range(1, 1001):
+            histogram.record(micros * 1000)
+
+        self.assertEqual(histogram.count, 1000)
+        self.assertEqual(histogram.max, 1_000_000)
+        self.assertAlmostEqual(histogram.percentile(0.5), 500_000, delta=500_000 / 16)
+        self.assertAlmostEqual(histogram.percentile(0.99), 990_000, delta=990_000 / 16)
+        # Percentiles are bucket lower bounds, only max is exact
+        self.assertGreater(histogram.percentile(1.0), 1_000_000 * 15 / 16)
+        summary = histogram.summary()
+        self.assertEqual((summary["count"], summary["max"]), (1000, 1.0))
+        self.assertAlmostEqual(summary["p50"], 0.5, delta=0.5 / 16)
+
+    def test_since_span_and_timed(self):
+        recorder = LatencyRecorder(enabled=True)
+
+        @recorder.timed("call")
+        def call(x):
+            return x * 2
+
+        # Every reading of the clock moves it 1ms
+        ticks = (i * 1_000_000 for i in count())
+        with mock.patch.object(
+            latency, "monotonic_ns", side_effect=lambda: next(ticks)
+        ):
+            recorder.mark("candle")
+            with recorder.span("strategy"):
+                pass
+            self.assertEqual(call(2), 4)
+            recorder.since("candle", "candle_to_order")
+            recorder.since("unknown", "never")
+
+        self.assertEqual(
+            {name: h.max for name, h in recorder.histograms.items()},
+            {"strategy": 1_000_000, "call": 1_000_000, "candle_to_order": 5_000_000},
+        )
+        self.assertAlmostEqual(
+            recorder.summary()["candle_to_order"]["p50"], 5.0, delta=5.0 / 16
+        )
+
+    def test_disabled_recorder_is_a_no_op(self):
+        recorder = LatencyRecorder(enabled=False, report_interval=0.0)
+
+        @recorder.timed("call")
+        def call(x):
+            return x * 2
+
+        with mock.patch.object(latency, "monotonic_ns") as monotonic_ns:
+            recorder.mark("candle")
+            with recorder.span("strategy"):
+                pass
+            self.assertEqual(call(2), 4)
+            recorder.since("candle", "candle_to_order")
+        monotonic_ns.assert_not_called()
+        self.assertEqual(recorder.histograms, {})
+        self.assertEqual(recorder.summary(), {})
+        self.assertFalse(recorder.due())